@@ -1,16 +1,14 @@
 # api_debug.py
-import requests
+import sys
 import json
 import base64
+from http_session import get_session, new_session, timed_request, format_timings
 
-def debug_api_response():
+def debug_api_response(url="https://tngis.tn.gov.in/apps/gi_viewer_api/api/encumbrance_certificate", payload=None):
     """Debug script to understand API response structure"""
     
-    # API endpoint
-    url = "https://tngis.tn.gov.in/apps/gi_viewer_api/api/encumbrance_certificate"
-    
     # Sample payload (modify with your actual data)
-    payload = {
+    payload = payload or {
         "district_code": "29",
         "taluk_code": "08", 
         "village_code": "040",
@@ -31,8 +29,9 @@ def debug_api_response():
     print(f"Payload: {json.dumps(payload, indent=2)}")
     
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = timed_request(get_session(), "POST", url, json=payload, headers=headers, timeout=30)
         print(f"\nStatus Code: {response.status_code}")
+        print(f"Timing: {format_timings(response.timings)}")
         print(f"Content-Type: {response.headers.get('content-type')}")
         
         if response.status_code == 200:
@@ -71,5 +70,27 @@ def debug_api_response():
     except Exception as e:
         print(f"Request failed: {e}")
 
+def compare_connection_reuse(url="https://tngis.tn.gov.in/apps/gi_viewer/", n=5):
+    """Show handshake savings: fresh session per request vs the shared pooled session"""
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+
+    print(f"\n🔍 Connection reuse comparison ({n} GETs to {url})")
+    print("=" * 50)
+    for label, pick in (("fresh session", lambda: new_session()), ("shared session", get_session)):
+        totals = []
+        for i in range(n):
+            try:
+                r = timed_request(pick(), "GET", url, headers=headers, timeout=30)
+            except Exception as e:
+                print(f"{label} #{i + 1}: request failed: {e}")
+                continue
+            totals.append(r.timings['total'])
+            print(f"{label} #{i + 1}: {format_timings(r.timings)}")
+        if totals:
+            print(f"➡️ {label}: avg {sum(totals) / len(totals) * 1000:.0f}ms over {len(totals)} requests\n")
+
 if __name__ == "__main__":
-    debug_api_response()
\ No newline at end of file
+    if "--timing" in sys.argv:
+        compare_connection_reuse()
+    else:
+        debug_api_response()
\ No newline at end of file
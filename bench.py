@@ -0,0 +1,216 @@
+# bench.py - Throughput benchmark of the download hot path against the local mock server (mock_tngis.py)
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+MODES = ("sequential", "threaded", "async", "pipelined")
+RESULT_MARK = "BENCH_RESULT "
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, None if the platform can't tell"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(pct / 100 * len(values) + 0.5)) - 1))]
+
+
+def bench_payloads(n: int):
+    for i in range(n):
+        yield {"revDistrictCode": "29", "revTalukCode": "08", "revVillageCode": f"{i % 900 + 1:03d}",
+               "survey_number": str(1000 + i), "sub_division_number": "-"}
+
+
+def run_mode(mode: str, base_url: str, n: int, concurrency: int, profile: str = None) -> dict:
+    """Download n ECs from the mock server in one mode and measure it (runs in a child process)"""
+    from ec_client import ECClient
+    from mock_tngis import EC_PATH, REFERER_PATH
+    from pipeline import Pipeline
+    from profiler import Profiler
+    from rate_limiter import AdaptiveThrottle
+    from session_pool import SessionPool
+
+    api_url, referer = base_url + EC_PATH, base_url + REFERER_PATH
+    out_dir = tempfile.mkdtemp(prefix=f"ec_bench_{mode}_")
+    workers = 1 if mode == "sequential" else concurrency
+    # Limits wide open: we measure our own overhead, not the production politeness settings
+    throttle = AdaptiveThrottle(api_url, rate=1e6, max_rate=1e6, capacity=workers, state_file=os.devnull)
+    sessions = SessionPool(referer, "Mozilla/5.0", count=workers, per_session_rate=1e6)
+    pipeline = Pipeline() if mode == "pipelined" else None
+    client = ECClient(out_dir, api_url, referer, sessions=sessions, throttle=throttle, verbose=False, pipeline=pipeline)
+
+    results = []
+    prof = Profiler(profile, f"ec_bench_profile_{mode}").start() if profile else None
+    cpu0, t0 = os.times(), time.perf_counter()
+    try:
+        if mode == "sequential":
+            results = [client.fetch(p) for p in bench_payloads(n)]
+        elif mode == "threaded":
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(client.fetch, bench_payloads(n)))
+        elif mode == "pipelined":
+            # workers only fetch; results arrive from the decode / write stages
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda p: client.submit(p, done=results.append), bench_payloads(n)))
+            pipeline.close()
+        else:
+            async def collect():
+                return [r async for r in client.fetch_many(bench_payloads(n), concurrency=workers)]
+            results = asyncio.run(collect())
+    finally:
+        wall = time.perf_counter() - t0
+        cpu1 = os.times()
+        if prof:
+            prof.close()
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    cpu = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    latencies = [r.latency for r in results if r.latency is not None]
+    statuses = {}
+    for r in results:
+        statuses[r.status] = statuses.get(r.status, 0) + 1
+    return {
+        'mode': mode,
+        'workers': workers,
+        'n': n,
+        'ok': sum(r.ok for r in results),
+        'statuses': statuses,
+        'seconds': wall,
+        'ecs_per_min': len(results) / wall * 60 if wall else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'peak_rss_mb': peak_rss_mb(),
+        'cpu_ms_per_ec': cpu / len(results) * 1000 if results else None,
+    }
+
+
+def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Mock server did not start on port {port}")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fmt(value, spec):
+    return "n/a" if value is None else format(value, spec)
+
+
+def print_table(rows):
+    print(f"\n{'mode':<11} {'workers':>7} {'ok':>9} {'ECs/min':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'RSS MB':>7} {'CPU ms/EC':>10}")
+    for r in rows:
+        ms = lambda v: fmt(v * 1000 if v is not None else None, ".0f")
+        print(f"{r['mode']:<11} {r['workers']:>7} {r['ok']:>4}/{r['n']:<4} {fmt(r['ecs_per_min'], '.0f'):>9} "
+              f"{ms(r['p50']):>8} {ms(r['p95']):>8} {ms(r['p99']):>8} {fmt(r['peak_rss_mb'], '.1f'):>7} "
+              f"{fmt(r['cpu_ms_per_ec'], '.2f'):>10}")
+        others = {k: v for k, v in r['statuses'].items() if k != 'saved'}
+        if others:
+            print(f"{'':<11} ↳ {others}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark EC downloads against mock_tngis.py")
+    ap.add_argument("--modes", default=",".join(MODES), help="comma separated: " + ", ".join(MODES))
+    ap.add_argument("-n", type=int, default=200, help="ECs per mode")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.05, help="mock server latency (s)")
+    ap.add_argument("--jitter", type=float, default=0.02)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--expire-rate", type=float, default=0.0)
+    ap.add_argument("--pdf-kb", type=float, default=50)
+    ap.add_argument("--mix", default=None, help="mock answer shapes, e.g. base64=70,pdf=10,nodata=10,nested=5,url=5")
+    ap.add_argument("--save", metavar="FILE", help="append the results as JSON lines, for comparing runs")
+    ap.add_argument("--profile", nargs="?", const="phases", choices=("phases", "cprofile", "sample"),
+                    help="per-phase timing report for each mode (dumps in ec_bench_profile_<mode>/, see profiler.py)")
+    ap.add_argument("--child", metavar="MODE", help=argparse.SUPPRESS)
+    ap.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        result = run_mode(args.child, args.base_url, args.n, args.concurrency, args.profile)
+        print(RESULT_MARK + json.dumps(result))
+        return
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    for m in modes:
+        if m not in MODES:
+            ap.error(f"unknown mode '{m}'")
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    port = free_port()
+    server_cmd = [sys.executable, os.path.join(here, "mock_tngis.py"), "--port", str(port),
+                  "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+                  "--expire-rate", str(args.expire_rate), "--pdf-kb", str(args.pdf_kb), "--seed", "1"]
+    if args.mix:
+        server_cmd += ["--mix", args.mix]
+    print(f"🧪 Starting mock server on port {port} (latency {args.latency}s ± {args.jitter}s, "
+          f"{args.pdf_kb:g} KB PDFs, errors {args.error_rate:.0%}, expiries {args.expire_rate:.0%})")
+    server = subprocess.Popen(server_cmd, stdout=subprocess.DEVNULL)
+    rows = []
+    try:
+        wait_for_port(port)
+        for mode in modes:
+            # Each mode gets its own process so peak RSS and CPU are not mixed between modes
+            print(f"⏱️ {mode}: {args.n} ECs...")
+            child = [sys.executable, os.path.abspath(__file__), "--child", mode, "-n", str(args.n),
+                     "--concurrency", str(args.concurrency), "--base-url", f"http://127.0.0.1:{port}"]
+            if args.profile:
+                child += ["--profile", args.profile]
+            proc = subprocess.run(child, capture_output=True, text=True)
+            lines = [l for l in proc.stdout.splitlines() if l.startswith(RESULT_MARK)]
+            if args.profile:
+                print("\n".join(l for l in proc.stdout.splitlines() if not l.startswith(RESULT_MARK)))
+            if proc.returncode or not lines:
+                print(f"❌ {mode} failed:\n{proc.stderr[-2000:] or proc.stdout[-2000:]}")
+                continue
+            rows.append(json.loads(lines[-1][len(RESULT_MARK):]))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print_table(rows)
+    if args.save and rows:
+        stamp = datetime.now().isoformat(timespec='seconds')
+        with open(args.save, "a", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(dict(r, timestamp=stamp, latency=args.latency, pdf_kb=args.pdf_kb)) + "\n")
+        print(f"📝 Results appended to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# bulk.py - Bulk EC downloads from an input sheet: job store, worker threads, retries, metrics (importable)
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from code_index import CodeIndex, CODES_DB_FILE, REFUSED
+from ec_client import ECClient, API_URL, REFERER, DEFAULT_HEADERS, OVERLOAD_HTTP_STATUS, NEGATIVE_EC_STATUS
+from input_reader import iter_jobs
+from job_store import JobStore, job_payload
+from metrics import METRICS_HOST, Metrics, EventLog, MetricsExporter
+from pack_store import PACK_MAX_MB, PackStore
+from pdf_writer import PDFStore
+from pipeline import Pipeline
+from profiler import Profiler
+from rate_limiter import THROTTLE_STATE_FILE, AdaptiveThrottle
+from response_archive import ResponseArchive, ARCHIVE_DIR
+from response_cache import ResponseCache
+from retry_policy import RetryPolicy
+from session_pool import SessionPool
+
+DAY = 24 * 60 * 60
+
+
+@dataclass
+class BulkSettings:
+    """Everything a bulk run can be tuned with; defaults match the old script constants"""
+    output_dir: str
+    district: str = "29"
+    taluk: str = "08"
+    api_url: str = API_URL
+    referer: str = REFERER
+    cookie: str = None                  # browser cookie for the first session; others bootstrap from referer
+    proxy: str = None                   # send every session through this proxy / egress IP (shard workers)
+    headers: dict = None                # None = ec_client.DEFAULT_HEADERS
+    timeout: float = 45
+    workers: int = 4
+    rate: float = 0.1                   # starting req/s shared by all workers
+    max_rate: float = 1.0
+    burst: int = 1
+    slow_latency: float = 15
+    overload_http_status: set = field(default_factory=lambda: set(OVERLOAD_HTTP_STATUS))
+    overload_ec_status: set = field(default_factory=set)
+    negative_ec_status: set = field(default_factory=lambda: set(NEGATIVE_EC_STATUS))
+    sessions: int = 3
+    per_session_rate: float = 0.2
+    ingest_batch: int = 500
+    verify_full: bool = False
+    verify_existing: bool = False
+    cache_file: str = "ec_response_cache.db"
+    cache_pdf_ttl_days: float = 30
+    cache_negative_ttl_days: float = 7
+    cache_max_entries: int = 200000     # LRU cap on PDF entries; negative entries leave by TTL only
+    force_refresh: bool = False
+    postprocess: bool = False
+    postprocess_workers: int = None
+    retry_base: float = 5
+    retry_max: float = 300
+    max_attempts: int = 6
+    metrics_textfile: str = "ec_metrics.prom"   # inside output_dir, None = off
+    metrics_port: int = None
+    metrics_host: str = METRICS_HOST
+    metrics_interval: float = 15
+    verbose: bool = True                # per-request progress lines
+    archive_sample_rate: float = 0.01   # share of normal answers kept in output_dir/responses/ (failures always),
+                                        # None = no response archive
+    codes_file: str = CODES_DB_FILE     # village code index (names + known-bad codes), None = send every payload
+    recheck_codes: bool = False         # send codes the index learned to refuse (e.g. a village added since)
+    pipeline: bool = False              # workers only do network I/O; decode / write run in their own stages
+    decode_workers: int = 2
+    write_workers: int = 1
+    stage_queue: int = 8                # bodies waiting per stage (bounds memory)
+    write_batch: int = 16               # temp files fsync'd together by the writer
+    pack: bool = False                  # PDFs go into tar packs + index under output_dir/packs/ (pack_store.py)
+    pack_max_mb: float = PACK_MAX_MB
+    profile: str = None                 # "phases" / "cprofile" / "sample": per-phase timing report (profiler.py)
+    throttle_file: str = None           # learned req/s per endpoint; None = output_dir/throttle_state.json
+
+
+class Budget:
+    """The request budget of one process: throttle, session pool and response cache shared by every run in it"""
+
+    def __init__(self, settings: BulkSettings):
+        s = self.settings = settings
+        self.headers = dict(s.headers or DEFAULT_HEADERS, Referer=s.referer)
+        self.cache = ResponseCache(s.cache_file, s.cache_pdf_ttl_days, s.cache_negative_ttl_days, s.cache_max_entries)
+        # One controller for every request in this process; learned rate is saved per endpoint
+        state_file = s.throttle_file or os.path.join(s.output_dir or ".", THROTTLE_STATE_FILE)
+        self.throttle = AdaptiveThrottle(s.api_url, rate=s.rate, max_rate=s.max_rate, slow_latency=s.slow_latency,
+                                         capacity=s.burst, state_file=state_file)
+        self.sessions = SessionPool(s.referer, self.headers["User-Agent"], s.sessions, s.per_session_rate,
+                                    seed_cookies=[s.cookie] if s.cookie else (), proxy=s.proxy)
+        self.codes = CodeIndex(s.codes_file, recheck=s.recheck_codes) if s.codes_file else None
+        self.pipeline = (Pipeline(s.decode_workers, s.write_workers, s.stage_queue, s.write_batch)
+                         if s.pipeline else None)
+        self.profiler = Profiler(s.profile, s.output_dir or ".").start() if s.profile else None
+
+    def client(self, output_dir: str, **options) -> ECClient:
+        """ECClient writing to output_dir that spends this budget"""
+        s = self.settings
+        return ECClient(output_dir, s.api_url, s.referer, self.headers, sessions=self.sessions, throttle=self.throttle,
+                        cache=self.cache, overload_http_status=s.overload_http_status,
+                        overload_ec_status=s.overload_ec_status, negative_ec_status=s.negative_ec_status,
+                        timeout=s.timeout, codes=self.codes, pipeline=self.pipeline, **options)
+
+    def busy(self) -> bool:
+        """True while pipelined lookups are still being decoded / written"""
+        return bool(self.pipeline and self.pipeline.inflight)
+
+    def close(self):
+        """Save the learned rate, finish the pipeline stages, print the profile"""
+        self.throttle.save()
+        if self.pipeline:
+            self.pipeline.close()
+        if self.profiler:
+            self.profiler.close()
+
+
+class BulkRun:
+    """One output folder's worth of state; use as a context manager around process() / retry_failed().
+
+    Pass a shared Budget to run several folders (campaigns) against one request budget, see scheduler.py.
+    """
+
+    def __init__(self, settings: BulkSettings, budget: Budget = None):
+        s = self.settings = settings
+        os.makedirs(s.output_dir, exist_ok=True)
+        self.job_db = os.path.join(s.output_dir, "ec_jobs.db")
+        self.events_file = os.path.join(s.output_dir, "ec_events.jsonl")
+        self.store = JobStore(self.job_db)
+        self.pdf_store = (PackStore(s.output_dir, full_check=s.verify_full, max_mb=s.pack_max_mb) if s.pack
+                          else PDFStore(s.output_dir, full_check=s.verify_full))
+        self.own_budget = budget is None
+        self.budget = budget or Budget(s)
+        self.cache, self.throttle, self.sessions = self.budget.cache, self.budget.throttle, self.budget.sessions
+        self.metrics = Metrics()
+        self.events = EventLog(self.events_file)
+        self.retry = RetryPolicy(s.retry_base, s.retry_max, s.max_attempts)
+        self.archive = (ResponseArchive(os.path.join(s.output_dir, ARCHIVE_DIR), s.archive_sample_rate)
+                        if s.archive_sample_rate is not None else None)
+        self.client = self.budget.client(s.output_dir, pdf_store=self.pdf_store, exists=self.downloaded,
+                                         metrics=self.metrics,
+                                         events=self.events, force_refresh=s.force_refresh, verbose=s.verbose,
+                                         archive=self.archive)
+        self.ingest_done = threading.Event()   # cleared while a sheet is still being loaded into the store
+        self.ingest_done.set()
+        self.post = None                       # ec_index.PostProcessor while a run is going
+        self.pdf_names = None                  # one listing of the PDF store per run (see requeue_missing)
+        self.on_settled = None                 # callback(job, result) after every outcome (FairScheduler uses it)
+        self._loader = None
+        self.exporter = None
+
+    def __enter__(self):
+        # Jobs a killed run left half-done go back to the queue
+        stale = self.store.requeue_stale()
+        if stale:
+            print(f"♻️ Resuming {stale} jobs interrupted in the last run")
+        if self.settings.recheck_codes:
+            # Rows refused by the code index last time get another real request
+            recheck = self.store.requeue_failed(error_like=f"%{REFUSED}%")
+            if recheck:
+                print(f"🔎 Re-checking {recheck} jobs whose village code was refused earlier")
+        self.metrics.add_collector(self.collect_job_counts)
+        if self.budget.pipeline:
+            self.metrics.add_collector(self.budget.pipeline.start().collect)
+        s = self.settings
+        textfile = os.path.join(s.output_dir, s.metrics_textfile) if s.metrics_textfile else None
+        self.exporter = MetricsExporter(self.metrics, textfile, s.metrics_port, s.metrics_interval, s.metrics_host)
+        return self
+
+    def __exit__(self, *exc):
+        if self.own_budget:
+            self.budget.close()
+        if self.exporter:
+            self.exporter.stop()
+        self.events.close()
+        print(f"📈 Per-request events: {self.events_file}")
+        if self.archive:
+            self.archive.close()
+            if self.archive.kept:
+                print(f"📚 {self.archive.kept} API answers archived in {self.archive.path}")
+        return False
+
+    def downloaded(self, path: str) -> bool:
+        """ECClient's "already downloaded?": indexed job lookup, then the PDF must still be in the store"""
+        return self.store.is_done(path) and self.pdf_store.exists(path)
+
+    def requeue_missing(self) -> set:
+        """List the PDF store once and sync the job store with it: done jobs whose PDF is gone (deleted,
+        quarantined) go back to the queue, queued jobs whose PDF is there are done.
+
+        The listing is kept for ingest(), which marks new rows whose PDF is already there as done.
+        """
+        names = self.pdf_names = self.pdf_store.names()
+        missing = [job['filename'] for job in self.store.jobs('done') if job['filename'] not in names]
+        if missing:
+            print(f"♻️ {self.store.requeue_filenames(missing)} finished jobs lost their PDF - queued for download again")
+        found = [job['filename'] for job in self.store.jobs('pending') if job['filename'] in names]
+        if found:
+            print(f"📁 {self.store.mark_done_filenames(found)} queued jobs already have their PDF - marked done")
+        return names
+
+    def import_failed_entries(self, path: str):
+        """Move an old failed_entries.json into the job store (one-time migration)"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            entries = json.load(f)
+        if entries:
+            added = self.store.add_jobs(entries, self.settings.district, self.settings.taluk)
+            os.replace(path, path + ".imported")
+            print(f"📥 Imported {added} entries from {path} into {self.job_db}")
+
+    def run_job(self, job: dict):
+        """Download one claimed job and record the outcome in the job store.
+
+        With a pipeline the call returns once the request is answered; settle() runs on a pipeline thread.
+        """
+        if self.settings.verbose:
+            print(f"\n📄 Processing: Village {job['village']}, Survey {job['survey']}, Sub-division '{job['subdivision']}'"
+                  f" (attempt {job['attempts']})")
+        if self.budget.pipeline:
+            self.client.submit(job_payload(job), job['filename'], attempt=job['attempts'],
+                               done=lambda result: self.settle(job, result))
+            return None
+        return self.settle(job, self.client.fetch(job_payload(job), job['filename'], attempt=job['attempts']))
+
+    def settle(self, job: dict, result) -> bool:
+        delay = self.store.settle(job, result, self.retry)
+        if self.on_settled:
+            self.on_settled(job, result)
+        if delay is not None:
+            self.metrics.inc('ec_retries_scheduled_total', reason=result.status)
+            print(f"🔁 {job['filename']}: {result.status}, retrying in {delay:.1f}s "
+                  f"(attempt {job['attempts']}/{self.retry.max_attempts})")
+        if result.ok and self.post:
+            village = result.village or {}
+            self.post.submit(result.path, {'filename': job['filename'], 'district': job['district'], 'taluk': job['taluk'], 'village': job['village'],
+                                           'survey': job['survey'], 'subdivision': job['subdivision'],
+                                           'village_name': village.get('regVillageNameEng'),
+                                           'sro': village.get('sroNameEng')},
+                             result.sha256)
+        return result.ok
+
+    def work_loop(self):
+        """Claim due jobs one by one until the store runs dry and no retry is waiting"""
+        while True:
+            finished = self.ingest_done.is_set()
+            job = self.store.claim()
+            if job is None:
+                retry_in = self.store.next_retry_in()
+                if finished and retry_in is None and not self.budget.busy():
+                    return
+                if self.budget.busy():
+                    time.sleep(0.05)   # pipelined lookups may still come back as retries
+                    continue
+                if not finished:
+                    self.ingest_done.wait(0.5 if retry_in is None else min(retry_in, 0.5))  # sheet still loading
+                else:
+                    time.sleep(min(max(retry_in, 0.05), 5))  # only backed-off retries left
+                continue
+            self.run_job(job)
+
+    def run_pending(self, workers: int = None):
+        """Drain the job store with `workers` threads sharing the adaptive throttle"""
+        workers = workers or self.settings.workers
+        if workers > 1:
+            print(f"🚀 Concurrent mode: {workers} workers sharing {self.throttle.rate:.3f} req/s (adaptive)")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for fut in [pool.submit(self.work_loop) for _ in range(workers)]:
+                    fut.result()
+        else:
+            self.work_loop()
+
+    def collect_job_counts(self, metrics: Metrics):
+        counts = self.store.counts()
+        for status in ('pending', 'running', 'done', 'no_data', 'failed'):
+            metrics.set_gauge('ec_jobs', counts.get(status, 0), status=status)
+
+    def print_summary(self):
+        counts = self.store.counts()
+        print(f"✅ Done: {counts.get('done', 0)} | 🚫 No Data: {counts.get('no_data', 0)} | "
+              f"❌ Failed: {counts.get('failed', 0)} | ⏳ Pending: {counts.get('pending', 0)}")
+        print(f"🔑 Sessions: {self.sessions.summary()}")
+
+    def print_failures(self):
+        failed = self.store.failed_jobs()
+        if not failed:
+            print("🎉 All downloads completed successfully!")
+            return
+        print(f"\n⚠️ {len(failed)} entries still failed (details in {self.job_db}):")
+        for job in failed:
+            print(f"   ❌ {job['village']}-{job['survey']}-{job['subdivision']}: {job['last_error']} (attempts {job['attempts']})")
+
+    def ingest(self, jobs):
+        """Feed job entries into the store in batches while the workers are already downloading"""
+        s = self.settings
+        try:
+            # New rows whose PDF is already there (older tree, manual run, another sheet) start as done
+            existing = self.pdf_names if self.pdf_names is not None else self.requeue_missing()
+            seen = set()   # rows are canonical already, so repeats in the sheet collapse onto one job
+            total = added = repeats = renamed = 0
+            while True:
+                batch = list(itertools.islice(jobs, s.ingest_batch))
+                if not batch:
+                    break
+                total += len(batch)
+                for entry in batch:
+                    key = (entry['village_no'], entry['survey_no'], entry['sub_division'])
+                    repeats += key in seen
+                    seen.add(key)
+                    # 👉 PDF from before canonical names ("_2a_", "0384")? rename it instead of downloading again
+                    legacy = entry.get('legacy_filename')
+                    if legacy and self.pdf_store.adopt_legacy(legacy, entry['filename']):
+                        existing.add(entry['filename'])
+                        renamed += 1
+                added += self.store.add_jobs(batch, s.district, s.taluk, existing)
+            print(f"📊 Loaded {total} records from input ({added} new jobs, {repeats} duplicate rows merged)")
+            if renamed:
+                print(f"🏷️ Renamed {renamed} PDFs from their old file names to canonical ones")
+        except Exception as e:
+            print(f"❌ Error reading input file: {e}")
+        finally:
+            self.ingest_done.set()
+
+    def start(self, jobs=None):
+        """Start the loader thread for `jobs` and the post-processing pool (if enabled)"""
+        s = self.settings
+        if s.postprocess:
+            from ec_index import PostProcessor  # process pool only when asked for
+            index_file = os.path.join(s.output_dir, "ec_index.db")
+            self.post = PostProcessor(index_file, s.postprocess_workers)
+            print(f"🧾 Post-processing saved PDFs on {self.post.workers} processes → {index_file}")
+        self._loader = None
+        if jobs is not None:
+            self.ingest_done.clear()
+            self._loader = threading.Thread(target=self.ingest, args=(jobs,), daemon=True)
+            self._loader.start()
+
+    def finish(self):
+        """Wait for the loader thread and the post-processing pool"""
+        if self._loader:
+            self._loader.join()
+            self._loader = None
+        if self.post:
+            self.post.close()
+            self.post = None
+
+    def _download(self, jobs=None, workers: int = None):
+        """Run the workers (and the loader thread / post-processing pool if needed)"""
+        self.start(jobs)
+        try:
+            self.run_pending(workers)
+        finally:
+            self.finish()
+
+    def prepare(self, input_file: str):
+        """Open the input and put earlier failures back in the queue; returns the job iterator or None"""
+        s = self.settings
+        try:
+            # Columns are validated here, before any request goes out
+            jobs = iter_jobs(input_file, s.district, s.taluk)
+        except Exception as e:
+            print(f"❌ Error processing input file: {e}")
+            return None
+
+        # Failures from earlier runs get a fresh try in this run; "No Data" rows only once their cache entry expired
+        self.store.requeue_failed()
+        recheck = self.store.requeue_no_data(0 if s.force_refresh else s.cache_negative_ttl_days * DAY)
+        if recheck:
+            print(f"🔁 Checking {recheck} earlier \"No Data\" entries again")
+        if s.verify_existing:
+            bad = self.pdf_store.verify_tree()
+            self.pdf_store.quarantine(bad)
+            if bad:
+                print(f"♻️ {self.store.requeue_filenames(bad)} broken PDFs queued for download again")
+        self.requeue_missing()
+        return jobs
+
+    def report(self):
+        self.print_summary()
+        print(f"📁 Files saved in: {os.path.abspath(self.settings.output_dir)}")
+        self.print_failures()
+
+    def process(self, input_file: str, workers: int = None):
+        """Stream the input rows into the job store and download everything still pending"""
+        jobs = self.prepare(input_file)
+        if jobs is None:
+            return
+        self._download(jobs, workers)
+        print(f"\n🎉 Main download process completed!")
+        self.report()
+
+    def retry_failed(self, workers: int = None, include_no_data: bool = False):
+        """Put failed (and optionally No Data) jobs back in the queue and run them"""
+        requeued = self.store.requeue_failed()
+        self.requeue_missing()
+        if include_no_data:
+            requeued += self.store.requeue_no_data(0)
+        pending = self.store.counts().get('pending', 0)
+        if not pending:
+            print("🎉 No failed entries to retry!")
+            return
+        print(f"\n🔄 Retrying {requeued} failed entries ({pending} pending in total)...")
+        self._download(None, workers)
+        self.print_summary()
+        self.print_failures()
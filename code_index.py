@@ -0,0 +1,293 @@
+# code_index.py - Local table of district / taluk / village codes and names, for lookups by name and payload checks
+#
+# Filled from every EC answer that carries regVillageBeanList (names in English and Tamil, SRO), from response
+# archives and old debug JSON files (`ec_download.py codes learn <dir>`), and from an optional seed file
+# (`ec_download.py codes import villages.csv`). A seed file lists whole taluks, so codes missing from a seeded
+# taluk are rejected before any request goes out; elsewhere only codes the server already refused are.
+# "Refused" means a No Data answer whose regVillageBeanList is present but empty, for a few different surveys;
+# `--recheck-codes` sends those lookups anyway (a real answer clears the refusal).
+#
+# Seed file columns (csv or jsonl): district, taluk, village, village_name, village_name_ta, sro,
+#                                   district_name, taluk_name (the names are optional)
+import csv
+import difflib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from ec_payload import canonical_code
+
+CODES_DB_FILE = "ec_codes.db"
+INVALID_TTL_DAYS = 30          # a refused code is asked again after this long (TNGIS adds villages rarely)
+INVALID_AFTER = 3              # answers without village data before a never-seen village code counts as invalid
+REFUSED = "server had no village data"   # in the invalid_code error of a refused code (see BulkRun, --recheck-codes)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS districts (
+    district TEXT PRIMARY KEY,
+    name_en  TEXT,
+    name_ta  TEXT
+);
+CREATE TABLE IF NOT EXISTS taluks (
+    district TEXT NOT NULL,
+    taluk    TEXT NOT NULL,
+    name_en  TEXT,
+    name_ta  TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,   -- 1 = village list came from a seed file, unknown codes are invalid
+    PRIMARY KEY (district, taluk)
+);
+CREATE TABLE IF NOT EXISTS villages (
+    district   TEXT NOT NULL,
+    taluk      TEXT NOT NULL,
+    village    TEXT NOT NULL,
+    name_en    TEXT,
+    name_ta    TEXT,
+    sro        TEXT,
+    village_id TEXT,                       -- regVillageId
+    source     TEXT,                       -- response / seed / archive
+    seen_at    REAL NOT NULL,
+    PRIMARY KEY (district, taluk, village)
+);
+CREATE TABLE IF NOT EXISTS invalid (
+    district TEXT NOT NULL,
+    taluk    TEXT NOT NULL,
+    village  TEXT NOT NULL,
+    misses   INTEGER NOT NULL,             -- EC answers for this code that carried no village data
+    seen_at  REAL NOT NULL,
+    PRIMARY KEY (district, taluk, village)
+);
+"""
+
+LEVELS = {'district': 2, 'taluk': 2, 'village': 3}   # code widths
+
+
+def _codes(payload: dict) -> tuple:
+    return (canonical_code(payload.get("revDistrictCode"), 2), canonical_code(payload.get("revTalukCode"), 2),
+            canonical_code(payload.get("revVillageCode"), 3))
+
+
+def _unknown_village(response) -> bool:
+    """True for the server's answer to a village code it doesn't have: first.data.regVillageBeanList == []"""
+    first = response.get("first")
+    data = first.get("data") if isinstance(first, dict) else None
+    return isinstance(data, dict) and data.get("regVillageBeanList") == []
+
+
+def _named(bean: dict, level: str) -> tuple:
+    """(English, Tamil) name of `level` in a regVillageBeanList entry, e.g. regVillageNameEng / ...Tam"""
+    en = ta = None
+    for key, value in bean.items():
+        k = key.lower()
+        if level in k and "name" in k and isinstance(value, str):
+            if k.endswith("eng"):
+                en = value.strip()
+            elif k.endswith("tam"):
+                ta = value.strip()
+    return en, ta
+
+
+class CodeIndex:
+    """SQLite code table shared by every client in the process (thread-local connections)"""
+
+    def __init__(self, path: str = CODES_DB_FILE, invalid_ttl_days: float = INVALID_TTL_DAYS,
+                 invalid_after: int = INVALID_AFTER, recheck: bool = False):
+        self.path = path
+        self.invalid_after = invalid_after
+        self.recheck = recheck         # ignore refusals learned from the server (seeded taluks still apply)
+        self.invalid_ttl = invalid_ttl_days * 24 * 60 * 60
+        self._local = threading.local()
+        self._known = set()            # codes written in this process, so repeat answers cost no write
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Filling the index
+    # ------------------------------------------------------------------
+
+    def learn(self, codes: tuple, bean: dict, source: str = "response"):
+        """Store one village's names from a regVillageBeanList entry"""
+        district, taluk, village = codes
+        name_en, name_ta = _named(bean, "village")
+        if (codes, name_en) in self._known:
+            return
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO villages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (district, taluk, village) DO UPDATE "
+                "SET name_en = COALESCE(excluded.name_en, name_en), name_ta = COALESCE(excluded.name_ta, name_ta), "
+                "sro = COALESCE(excluded.sro, sro), village_id = COALESCE(excluded.village_id, village_id), "
+                "seen_at = excluded.seen_at",
+                (district, taluk, village, name_en, name_ta, bean.get("sroNameEng"),
+                 str(bean["regVillageId"]) if bean.get("regVillageId") is not None else None, source, now))
+            conn.execute("DELETE FROM invalid WHERE district = ? AND taluk = ? AND village = ?", codes)
+            self._upsert_names(conn, district, taluk, bean)
+        self._known.add((codes, name_en))
+
+    def _upsert_names(self, conn, district: str, taluk: str, bean: dict):
+        d_en, d_ta = _named(bean, "district")
+        t_en, t_ta = _named(bean, "taluk")
+        conn.execute("INSERT INTO districts VALUES (?, ?, ?) ON CONFLICT (district) DO UPDATE SET "
+                     "name_en = COALESCE(excluded.name_en, name_en), name_ta = COALESCE(excluded.name_ta, name_ta)",
+                     (district, d_en, d_ta))
+        conn.execute("INSERT INTO taluks (district, taluk, name_en, name_ta) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT (district, taluk) DO UPDATE SET name_en = COALESCE(excluded.name_en, name_en), "
+                     "name_ta = COALESCE(excluded.name_ta, name_ta)", (district, taluk, t_en, t_ta))
+
+    def observe(self, result):
+        """Learn from one ECResult: names when the answer carries village data, a refusal when it says "no village" """
+        response = result.response
+        if not isinstance(response, dict):
+            return
+        codes = _codes(result.payload)
+        if result.village:
+            self.learn(codes, result.village)
+        elif result.status == "no_data" and _unknown_village(response) and not self.is_known(codes):
+            # No Data with an empty village list: the server probably doesn't know this code. Other shapes
+            # (missing keys, errors, busy pages) say nothing about the village and are not counted.
+            # A few of them (different survey numbers) are needed before lookups are refused locally.
+            with self._conn() as conn:
+                conn.execute("INSERT INTO invalid VALUES (?, ?, ?, 1, ?) ON CONFLICT (district, taluk, village) "
+                             "DO UPDATE SET misses = misses + 1, seen_at = excluded.seen_at", codes + (time.time(),))
+
+    def learn_response(self, j: dict, payload: dict = None, source: str = "archive") -> bool:
+        """Learn from a raw EC answer; without the request payload the codes echoed in first.data are used"""
+        first = j.get("first") if isinstance(j, dict) else None
+        data = first.get("data") if isinstance(first, dict) else None
+        beans = data.get("regVillageBeanList") if isinstance(data, dict) else None
+        codes = _codes(payload or data or {})
+        if not (isinstance(beans, list) and beans and isinstance(beans[0], dict)) or not all(codes):
+            return False
+        self.learn(codes, beans[0], source)
+        return True
+
+    def learn_dir(self, directory: str) -> int:
+        """Learn from a response archive folder / output folder and any old debug *.json answers in it"""
+        from response_archive import ARCHIVE_DIR, read_archive
+        learned = 0
+        folder = os.path.join(directory, ARCHIVE_DIR)
+        if not os.path.isdir(folder):
+            folder = directory
+        for record in read_archive(folder):
+            learned += self.learn_response(record.get('response'), record.get('payload'))
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(directory, name), encoding="utf-8") as f:
+                        learned += self.learn_response(json.load(f), source="debug json")
+                except (OSError, ValueError):
+                    continue
+        return learned
+
+    def import_seed(self, path: str) -> int:
+        """Load a seed file (csv / jsonl); every taluk in it is marked complete"""
+        if path.lower().endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                rows = list(csv.DictReader(f))
+        now, taluks = time.time(), set()
+        with self._conn() as conn:
+            for row in rows:
+                district, taluk = canonical_code(row['district'], 2), canonical_code(row['taluk'], 2)
+                village = canonical_code(row['village'], 3)
+                conn.execute(
+                    "INSERT OR REPLACE INTO villages VALUES (?, ?, ?, ?, ?, ?, NULL, 'seed', ?)",
+                    (district, taluk, village, row.get('village_name') or None, row.get('village_name_ta') or None,
+                     row.get('sro') or None, now))
+                conn.execute("DELETE FROM invalid WHERE district = ? AND taluk = ? AND village = ?",
+                             (district, taluk, village))
+                self._upsert_names(conn, district, taluk, {'districtNameEng': row.get('district_name') or None,
+                                                           'talukNameEng': row.get('taluk_name') or None})
+                taluks.add((district, taluk))
+            conn.executemany("UPDATE taluks SET complete = 1 WHERE district = ? AND taluk = ?", taluks)
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def is_known(self, codes: tuple) -> bool:
+        return self._conn().execute("SELECT 1 FROM villages WHERE district = ? AND taluk = ? AND village = ?",
+                                    codes).fetchone() is not None
+
+    def check(self, payload: dict):
+        """Why this payload can't be a valid lookup, or None if it may be sent"""
+        codes = _codes(payload)
+        for (level, width), code in zip(LEVELS.items(), codes):
+            if not code.isdigit() or len(code) != width:
+                return f"{level} code '{code}' is not a {width}-digit number"
+        if not str(payload.get("survey_number") or "").strip():
+            return "survey number is empty"
+        if self.is_known(codes):
+            return None
+        conn = self._conn()
+        district, taluk, village = codes
+        refused = conn.execute("SELECT misses, seen_at FROM invalid WHERE district = ? AND taluk = ? AND village = ?",
+                               codes).fetchone()
+        if (refused and not self.recheck and refused['misses'] >= self.invalid_after
+                and refused['seen_at'] > time.time() - self.invalid_ttl):
+            return f"village {village} is not in district {district} / taluk {taluk} ({REFUSED}; --recheck-codes to ask again)"
+        seeded = conn.execute("SELECT complete FROM taluks WHERE district = ? AND taluk = ?",
+                              (district, taluk)).fetchone()
+        if seeded and seeded['complete']:
+            return f"village {village} is not in the village list of district {district} / taluk {taluk}"
+        return None
+
+    def search(self, text: str, level: str = "village", district: str = None, taluk: str = None,
+               limit: int = 10) -> list:
+        """Rows whose English or Tamil name matches: prefix / substring matches first, then fuzzy ones"""
+        table = {'district': "districts", 'taluk': "taluks", 'village': "villages"}[level]
+        where, args = [], []
+        if district and level != "district":
+            where.append("district = ?")
+            args.append(canonical_code(district, 2))
+        if taluk and level == "village":
+            where.append("taluk = ?")
+            args.append(canonical_code(taluk, 2))
+        sql = f"SELECT * FROM {table}" + (" WHERE " + " AND ".join(where) if where else "")
+        rows = [dict(r) for r in self._conn().execute(sql, args)]
+        needle = text.strip().lower()
+
+        def score(row) -> float:
+            best = 0.0
+            for name in (row.get('name_en'), row.get('name_ta')):
+                if not name:
+                    continue
+                name = name.lower()
+                if name.startswith(needle):
+                    return 2.0
+                if needle in name:
+                    best = max(best, 1.5)
+                else:
+                    best = max(best, difflib.SequenceMatcher(None, needle, name).ratio())
+            return best
+
+        ranked = sorted(((score(r), r) for r in rows), key=lambda x: -x[0])
+        return [r for s, r in ranked if s >= 0.6][:limit]
+
+    def counts(self) -> dict:
+        conn = self._conn()
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in ("districts", "taluks", "villages")}
+        counts['invalid'] = conn.execute("SELECT COUNT(*) FROM invalid WHERE misses >= ?",
+                                         (self.invalid_after,)).fetchone()[0]
+        return counts
+
+
+def describe(row: dict) -> str:
+    """One line for a search hit"""
+    codes = "/".join(row[k] for k in ("district", "taluk", "village") if k in row)
+    names = " / ".join(n for n in (row.get('name_en'), row.get('name_ta')) if n)
+    return f"{codes}  {names or '(no name)'}" + (f"  SRO {row['sro']}" if row.get('sro') else "")
@@ -3,15 +3,35 @@
 TNGIS_CONFIG = {
     'production': {
         'base_url': 'https://tngis.tn.gov.in',
-        'ec_endpoint': '/api/ec/download',
+        'ec_endpoint': '/apps/gi_viewer_api/api/encumbrance_certificate',
+        'referer_path': '/apps/gi_viewer/',
         'auth_required': False,
-        'timeout': 30
+        'timeout': 45
     },
     'staging': {
         'base_url': 'https://staging-tngis.tn.gov.in',
-        'ec_endpoint': '/api/ec/download',
+        'ec_endpoint': '/apps/gi_viewer_api/api/encumbrance_certificate',
+        'referer_path': '/apps/gi_viewer/',
         'auth_required': False,
-        'timeout': 30
+        'timeout': 45
+    },
+    # python mock_tngis.py (same paths as the real site)
+    'mock': {
+        'base_url': 'http://127.0.0.1:8765',
+        'ec_endpoint': '/apps/gi_viewer_api/api/encumbrance_certificate',
+        'referer_path': '/apps/gi_viewer/',
+        'auth_required': False,
+        'timeout': 10
     }
     # Add other environments as needed
-}
\ No newline at end of file
+}
+
+DEFAULT_ENV = 'production'
+
+
+def environment(name: str = DEFAULT_ENV) -> dict:
+    """Config of one environment plus the full api_url / referer built from it"""
+    if name not in TNGIS_CONFIG:
+        raise KeyError(f"Unknown environment '{name}' (choose from: {', '.join(TNGIS_CONFIG)})")
+    env = TNGIS_CONFIG[name]
+    return dict(env, api_url=env['base_url'] + env['ec_endpoint'], referer=env['base_url'] + env['referer_path'])
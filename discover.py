@@ -0,0 +1,149 @@
+# discover.py - Find which survey / sub-division combinations of a village have ECs, without a list up front
+#
+# For every survey number in a range the "-" (whole survey) variant is asked first. Sub-division numbers the
+# server mentions in its answer (regVillageBeanList metadata, survey lists) are probed next; a fixed guess
+# list is only tried when the server gave no hints. A range is abandoned after `gap` survey numbers in a row
+# answered "No Data" (1003) - villages end somewhere, and the tail of a wide range is all misses.
+#
+# Hits are saved like any other download; hits and unanswered lookups are written as a job list
+# (jsonl, readable by input_reader / `ec_download.py bulk`).
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ec_payload import canonical_code, canonical_survey, canonical_subdivision
+from input_reader import make_entry
+from retry_policy import RetryPolicy, is_transient
+
+HIT, MISS, UNRESOLVED = "hit", "miss", "unresolved"
+
+_RANGE = re.compile(r"^(\d+)\s*-\s*(\d+)$")
+
+
+def parse_ranges(text: str) -> list:
+    """"384-420,450,12A" -> survey numbers in order; numeric ranges are inclusive, other values kept as given"""
+    surveys = []
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        m = _RANGE.match(part)
+        if m:
+            lo, hi = int(m.group(1)), int(m.group(2))
+            if hi < lo:
+                raise ValueError(f"Survey range '{part}' runs backwards")
+            surveys.extend(str(n) for n in range(lo, hi + 1))
+        else:
+            surveys.append(canonical_survey(part))
+    return list(dict.fromkeys(surveys))
+
+
+class Discovery:
+    """Probe village x survey ranges through an ECClient and collect the job list"""
+
+    def __init__(self, client, district: str, taluk: str, gap: int = 10, guesses=(), guess_misses: int = 3,
+                 retry: RetryPolicy = None):
+        self.client = client
+        self.district = canonical_code(district, 2)
+        self.taluk = canonical_code(taluk, 2)
+        self.gap = gap                        # consecutive empty survey numbers that end a range (0 = never)
+        self.guesses = [canonical_subdivision(g) for g in guesses if canonical_subdivision(g) != "-"]
+        self.guess_misses = guess_misses      # stop guessing in a survey after this many misses in a row
+        self.retry = retry or RetryPolicy()
+        self.entries = []
+        self.stats = {'lookups': 0, HIT: 0, MISS: 0, UNRESOLVED: 0, 'pruned': 0}
+        self._lock = threading.Lock()
+        self._out = None
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _emit(self, entry: dict, outcome: str):
+        with self._lock:
+            self.entries.append(dict(entry, discovered=outcome))
+            if self._out:
+                self._out.write(json.dumps(self.entries[-1], ensure_ascii=False) + "\n")
+                self._out.flush()
+
+    def probe(self, village: str, survey: str, subdivision: str):
+        """(outcome, entry, result) for one combination; transient failures are retried with backoff"""
+        entry = make_entry(village, survey, subdivision, self.district, self.taluk)
+        payload = {"revDistrictCode": self.district, "revTalukCode": self.taluk, "revVillageCode": entry['village_no'],
+                   "survey_number": entry['survey_no'], "sub_division_number": entry['sub_division']}
+        attempt = 1
+        while True:
+            result = self.client.fetch(payload, entry['filename'], attempt=attempt)
+            self._count('lookups')
+            if result.ok:
+                outcome = HIT
+            elif is_transient(result):
+                delay = self.retry.next_delay(result, attempt)
+                if delay is not None:
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                outcome = UNRESOLVED
+            elif result.status == "no_data" or result.ec_status in self.client.negative_ec_status:
+                outcome = MISS   # 1003 "No Data": the only answer that counts towards the gap
+            else:
+                # no_pdf, invalid_code, odd answers, retries used up: nothing ruled out, so no gap either
+                outcome = UNRESOLVED
+            self._count(outcome)
+            if outcome != MISS:
+                self._emit(entry, outcome)
+            return outcome, entry, result
+
+    def survey(self, village: str, survey: str) -> bool:
+        """Probe one survey number; True if anything was found (or could not be ruled out)"""
+        outcome, _, result = self.probe(village, survey, "-")
+        alive = outcome != MISS
+        hints = list(result.subdivisions or [])
+        guessing = not hints
+        candidates = list(hints or (self.guesses if outcome == MISS else []))
+        misses = 0
+        for sub in candidates:
+            sub_outcome, _, sub_result = self.probe(village, survey, sub)
+            if sub_outcome != MISS:
+                alive, misses = True, 0
+            else:
+                misses += 1
+                if guessing and misses >= self.guess_misses:
+                    break
+            # a sub-division answer may list more siblings
+            for extra in sub_result.subdivisions or []:
+                if extra not in candidates:
+                    candidates.append(extra)
+        return alive
+
+    def village(self, village: str, surveys: list):
+        village = canonical_code(village, 3)
+        empty = 0
+        for i, survey in enumerate(surveys):
+            empty = 0 if self.survey(village, survey) else empty + 1
+            if self.gap and empty >= self.gap and i + 1 < len(surveys):
+                rest = len(surveys) - i - 1
+                self._count('pruned', rest)
+                print(f"✂️ Village {village}: {empty} empty survey numbers in a row after {survey}, "
+                      f"skipping the other {rest}")
+                return
+
+    def run(self, villages, surveys: list, jobs_file: str = None, workers: int = 1) -> list:
+        """Discover every village (villages in parallel, survey numbers in order); returns the job entries"""
+        self._out = open(jobs_file, "w", encoding="utf-8") if jobs_file else None
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                for fut in [pool.submit(self.village, v, surveys) for v in villages]:
+                    fut.result()
+        finally:
+            if self._out:
+                self._out.close()
+                self._out = None
+        s = self.stats
+        print(f"🔎 Discovery: {s['lookups']} lookups | ✅ {s[HIT]} ECs | 🚫 {s[MISS]} empty | "
+              f"⚠️ {s[UNRESOLVED]} unanswered | ✂️ {s['pruned']} survey numbers skipped")
+        if jobs_file:
+            print(f"📝 Job list: {jobs_file}")
+        return self.entries
@@ -0,0 +1,650 @@
+# ec_client.py - Importable EC download client: ECClient.fetch() and async ECClient.fetch_many()
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+from ec_payload import normalize_payload, payload_key, canonical_subdivision
+from metrics import record_result
+from pack_store import is_pack_ref, read_ref
+import profiler
+from http_session import timed_request, finish_timings, iter_body, format_timings, TRANSIENT_ERRORS
+from pdf_writer import JSONPDFExtractor, InvalidPDF, PDFStore, looks_like_pdf_bytes, write_stream, discard, CHUNK_SIZE
+from rate_limiter import THROTTLE_STATE_FILE, AdaptiveThrottle
+from response_cache import cache_key
+from session_pool import SessionPool, looks_expired
+
+API_URL    = "https://tngis.tn.gov.in/apps/gi_viewer_api/api/encumbrance_certificate"
+REFERER    = "https://tngis.tn.gov.in/apps/gi_viewer/"
+ORIGIN     = "https://tngis.tn.gov.in"
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+    "Content-Type": "application/json",
+    "Origin": ORIGIN,
+    "Referer": REFERER,
+    "X-Requested-With": "XMLHttpRequest",
+    # 🔑 ivlo than main fix:
+    "x-app-name": "demo",
+}
+
+OVERLOAD_HTTP_STATUS = {429, 500, 502, 503, 504}
+NEGATIVE_EC_STATUS = {1003}            # "No Data Found / Generation Failed"
+PDF_URL_KEYS = ("url", "pdfUrl", "fileUrl")
+SUBDIVISION_KEY_PARTS = ("subdiv", "sub_div")   # keys like subDivList / sub_division_number in responses
+
+
+def ec_filename(payload: dict) -> str:
+    """Default output name: district_taluk_village_survey_subdivision_EC.pdf"""
+    return (f"{payload['revDistrictCode']}_{payload['revTalukCode']}_{payload['revVillageCode']}_"
+            f"{payload['survey_number']}_{payload['sub_division_number']}_EC.pdf")
+
+
+@dataclass
+class ECResult:
+    """Outcome of one EC lookup.
+
+    status is one of: saved, cached, exists, no_data, busy, network, session_expired, not_json,
+    decode_error, invalid_pdf, no_pdf, invalid_code, error (see retry_policy for which ones are retried).
+    coalesced results shared the request of an identical lookup that was already in flight.
+    sent is False when no request went out (exists, cached, coalesced, refused codes).
+    """
+    payload: dict
+    filename: str
+    ok: bool = False
+    status: str = "error"
+    path: str = None
+    ec_status: int = None
+    http_status: int = None
+    error: str = None
+    bytes: int = None
+    sha256: str = None
+    village: dict = None           # first regVillageBeanList entry (names, SRO)
+    subdivisions: list = None      # sub-division numbers the response mentions (see subdivision_hints)
+    response: object = field(default=None, repr=False)   # parsed JSON (base64 streamed out) or body snippet
+    message: str = None
+    timings: dict = field(default_factory=dict)
+    latency: float = None
+    decode_time: float = None      # JSON parse + base64 decode into the temp file
+    write_time: float = None       # PDF verification + publish
+    attempt: int = 1
+    coalesced: bool = False
+    sent: bool = False
+
+    def read_pdf(self) -> bytes:
+        """PDF bytes of a successful result"""
+        if is_pack_ref(self.path):
+            return read_ref(self.path)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def village_info(j: dict):
+    """First regVillageBeanList entry of an EC response, if any"""
+    first = j.get("first")
+    data = first.get("data") if isinstance(first, dict) else None
+    villages = data.get("regVillageBeanList") if isinstance(data, dict) else None
+    if isinstance(villages, list) and villages and isinstance(villages[0], dict):
+        return villages[0]
+    return None
+
+
+def subdivision_hints(j, _depth: int = 0) -> list:
+    """Sub-division numbers mentioned anywhere in a response (village metadata, survey lists); best effort"""
+    found = []
+
+    def collect(value):
+        if isinstance(value, (str, int)) and len(str(value)) < 200:
+            found.extend(p for p in str(value).replace(";", ",").split(","))
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+        elif isinstance(value, dict):
+            found.extend(subdivision_hints(value, _depth + 1))
+
+    if _depth < 6:
+        items = j.items() if isinstance(j, dict) else enumerate(j) if isinstance(j, list) else ()
+        for k, v in items:
+            if isinstance(k, str) and any(part in k.lower() for part in SUBDIVISION_KEY_PARTS):
+                collect(v)
+            elif isinstance(v, (dict, list)):
+                found.extend(subdivision_hints(v, _depth + 1))
+    seen = {}
+    for value in (canonical_subdivision(f) for f in found):
+        if value != "-":
+            seen.setdefault(value, None)
+    return list(seen)
+
+
+@dataclass
+class _Download:
+    """A lookup between steps: answer headers in, body / temp file still to be handled"""
+    client: "ECClient"
+    result: ECResult
+    done: object = None            # submit() callback
+    key: tuple = None              # single-flight key and call (leader only)
+    call: object = None
+    shared: bool = False
+    sess: object = None
+    resp: object = None
+    ct: str = ""
+    cache_key: str = None
+    body: object = None            # live chunk iterator, or a list when the network stage read it all
+    tmp_path: str = None
+    nbytes: int = 0
+    sha256: str = None
+
+
+class SingleFlight:
+    """Identical calls that overlap run once: the first caller does the work, the rest wait for its result"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def begin(self, key):
+        """(call, leader): the leader must end() the call, others wait on call.done and read call.result"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = self._Call()
+            return call, True
+
+    def end(self, key, call, result=None, error=None):
+        call.result, call.error = result, error
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+
+    def do(self, key, fn):
+        """(result, shared) - shared is True when another caller's in-flight result was reused"""
+        call, leader = self.begin(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.end(key, call, error=e)
+            raise
+        self.end(key, call, result)
+        return result, False
+
+
+class ECClient:
+    """Downloads ECs into output_dir with shared throttling, sessions, caching and verified writes.
+
+    Safe to call fetch() from several threads; fetch_many() runs fetch() on a bounded pool
+    and yields results as they complete.
+    """
+
+    def __init__(self, output_dir: str, api_url: str = API_URL, referer: str = REFERER, headers: dict = None,
+                 cookies=(), sessions: SessionPool = None, throttle: AdaptiveThrottle = None, cache=None,
+                 pdf_store: PDFStore = None, overload_http_status=OVERLOAD_HTTP_STATUS, overload_ec_status=(),
+                 negative_ec_status=NEGATIVE_EC_STATUS,
+                 timeout: float = 45, verbose: bool = True, archive=None, metrics=None, events=None,
+                 force_refresh: bool = False, urgent: bool = False, codes=None, pipeline=None, exists=None):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.api_url = api_url
+        self.referer = referer
+        self.headers = dict(headers or DEFAULT_HEADERS)
+        self.sessions = sessions or SessionPool(referer, self.headers["User-Agent"], count=1,
+                                                per_session_rate=1.0, seed_cookies=cookies)
+        self.throttle = throttle or AdaptiveThrottle(api_url, state_file=os.path.join(output_dir, THROTTLE_STATE_FILE))
+        self.cache = cache
+        self.pdf_store = pdf_store or PDFStore(output_dir)
+        self.overload_http_status = set(overload_http_status)
+        self.overload_ec_status = set(overload_ec_status)
+        self.negative_ec_status = set(negative_ec_status)
+        self.timeout = timeout
+        self.verbose = verbose
+        self.archive = archive                # response_archive.ResponseArchive, sampled answers for debugging
+        self.metrics = metrics
+        self.events = events
+        self.force_refresh = force_refresh   # ignore cached answers (e.g. re-check known "No Data" rows)
+        self._flights = SingleFlight()        # one request per canonical payload at a time
+        self.urgent = urgent                  # interactive client: jumps ahead of bulk callers on a shared throttle
+        self.codes = codes                    # code_index.CodeIndex: payloads checked before sending, names learned
+        self.pipeline = pipeline              # pipeline.Pipeline for submit(): decode / write off the network threads
+        self.exists = exists or self.pdf_store.exists   # "already downloaded?" - BulkRun checks its job store first
+
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    # ------------------------------------------------------------------
+    # Single lookup
+    # ------------------------------------------------------------------
+
+    def fetch(self, payload: dict, filename: str = None, attempt: int = 1, refresh: bool = None) -> ECResult:
+        """Look up one EC and save it as output_dir/filename; never raises for download problems.
+
+        refresh=True skips the response cache for this lookup (defaults to the client's force_refresh).
+        The payload is normalized first; a lookup identical to one already in flight waits for that
+        request and shares its answer instead of sending its own.
+        """
+        payload = normalize_payload(payload)
+        result = ECResult(payload=payload, filename=filename or ec_filename(payload), attempt=attempt)
+        refresh = self.force_refresh if refresh is None else refresh
+        leader, shared = self._flights.do(payload_key(payload), lambda: self._fetch(result, refresh))
+        if shared:
+            self._follow(leader, result, refresh)
+        self._observe(result, shared)
+        return result
+
+    def submit(self, payload: dict, filename: str = None, attempt: int = 1, refresh: bool = None, done=None):
+        """Pipelined fetch(): the calling thread only does the network part, the client's Pipeline decodes
+        and writes; done(result) is called from a pipeline thread once the lookup is settled."""
+        payload = normalize_payload(payload)
+        result = ECResult(payload=payload, filename=filename or ec_filename(payload), attempt=attempt)
+        refresh = self.force_refresh if refresh is None else refresh
+        self.pipeline.start().begin()
+        key = payload_key(payload)
+        call, leader = self._flights.begin(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                self.pipeline.end()
+                raise call.error
+            self._follow(call.result, result, refresh)
+            return self._complete(_Download(self, result, done, shared=True))
+        dl = _Download(self, result, done, key=key, call=call)
+        try:
+            with profiler.phase("network"):
+                step = self._guard(dl, self._request, dl, refresh, True)
+        except BaseException as e:
+            self._flights.end(key, call, error=e)
+            self.pipeline.end()
+            raise
+        if result.latency is not None:
+            self.pipeline.network.add(busy=result.latency, items=1)
+        if step is dl:
+            self.pipeline.decode.put(dl, self.pipeline.network)
+        else:
+            self._complete(dl)
+
+    def _complete(self, dl: "_Download"):
+        """Last step of a submitted lookup: release identical waiters, record it, hand it to done()"""
+        result = dl.result
+        if dl.call is not None:
+            self._flights.end(dl.key, dl.call, result)
+        try:
+            self._observe(result, dl.shared)
+            if dl.done:
+                dl.done(result)
+        finally:
+            self.pipeline.end()
+
+    def _observe(self, result: ECResult, shared: bool):
+        if self.codes and not shared:
+            self.codes.observe(result)
+        if self.metrics or self.events:
+            record_result(result, self.metrics, self.events, self.throttle)
+        if self.archive:
+            self.archive.record(result)
+
+    def _fetch(self, result: ECResult, refresh: bool) -> ECResult:
+        """request -> decode -> write on the calling thread, the body decoded while it streams in"""
+        dl = _Download(self, result)
+        with profiler.phase("lookup"):
+            if self._guard(dl, self._request, dl, refresh) is dl and self._decode(dl) is dl:
+                self._write(dl)
+        return result
+
+    def _guard(self, dl: "_Download", step, *args):
+        """Run one step; dl when there is more to do, else the finished ECResult (exceptions become statuses)"""
+        result = dl.result
+        try:
+            out = step(*args)
+        except TRANSIENT_ERRORS as e:
+            self.log(f"❌ Network error for {result.filename}: {e}")
+            out = self._fail(result, "network", f"{type(e).__name__}: {e}")
+        except InvalidPDF as e:
+            # PDFStore / PackStore reject truncated / broken PDFs
+            out = self._fail(result, "invalid_pdf", str(e))
+        except Exception as e:
+            self.log(f"❌ Download failed for {result.filename}: {e}")
+            out = self._fail(result, "error", f"{type(e).__name__}: {e}")
+        except BaseException:
+            self._discard(dl)
+            raise
+        if out is not dl:
+            self._discard(dl)
+        return out
+
+    @staticmethod
+    def _discard(dl: "_Download"):
+        if dl.tmp_path:
+            discard(dl.tmp_path)
+            dl.tmp_path = None
+        if dl.resp is not None:
+            dl.resp.close()   # a body left half-read must not hold on to the pooled connection
+
+    def _request(self, dl: "_Download", refresh: bool, buffer: bool = False):
+        """Network step: cache, throttle, POST. buffer=True reads the whole body here (pipeline mode)"""
+        result = dl.result
+        payload = result.payload
+        result.path = os.path.join(self.output_dir, result.filename)
+
+        # Check if file already exists
+        if self.exists(result.path):
+            self.log(f"📁 File already exists, skipping: {result.filename}")
+            result.path = self.pdf_store.location(result.path)
+            return self._done(result, "exists")
+
+        # Codes the index knows to be wrong never reach the server
+        reason = self.codes.check(payload) if self.codes else None
+        if reason:
+            self.log(f"🚫 {result.filename}: {reason} - not sent")
+            return self._fail(result, "invalid_code", reason)
+
+        # Response cache: fresh entries cost no request, stale ones are revalidated if the server gave ETag/Last-Modified
+        key = dl.cache_key = cache_key(payload, self.api_url)
+        cached = self.cache.get(key) if self.cache and not refresh else None
+        headers = self.headers
+        if cached and cached['fresh']:
+            if self._serve_cached(cached, result):
+                return result
+            cached = None
+        elif cached:
+            headers = dict(self.headers, **self.cache.conditional_headers(cached))
+
+        with profiler.phase("throttle"):
+            waited = self.throttle.acquire(urgent=self.urgent)
+            sess = dl.sess = self.sessions.acquire()
+        result.sent = True
+        if waited >= 1:
+            self.log(f"⏳ Waited {waited:.1f}s (throttle at {self.throttle.rate:.3f} req/s)")
+        self.log(f"🔄 Requesting EC for: Village {payload['revVillageCode']}, Survey {payload['survey_number']}, "
+                 f"Sub-div {payload['sub_division_number']}...")
+        try:
+            with profiler.phase("server"):
+                resp = timed_request(sess.http, "POST", self.api_url, read_body=False, json=payload,
+                                     headers=sess.headers(headers), timeout=self.timeout)
+                for step in ("dns", "connect", "tls"):
+                    profiler.add(step, resp.timings[step])
+        except TRANSIENT_ERRORS as e:
+            self.throttle.on_overload(type(e).__name__)
+            raise
+        dl.resp = resp
+        dl.ct = resp.headers.get("Content-Type", "").lower()
+        result.http_status = resp.status_code
+        result.timings = resp.timings
+
+        if resp.status_code == 304 and cached:
+            resp.close()
+            result.latency = resp.timings['total']
+            self.throttle.on_success(result.latency)
+            self.cache.refresh(key, cached['kind'])
+            if self._serve_cached(cached, result):
+                return result
+            self.cache.forget(key)
+            return self._fail(result, "error", "Cached PDF missing after 304")
+
+        if resp.status_code in self.overload_http_status:
+            resp.close()
+            result.latency = resp.timings['total']
+            retry_after = resp.headers.get("Retry-After", "")
+            self.throttle.on_overload(f"HTTP {resp.status_code}",
+                                      float(retry_after) if retry_after.isdigit() else None)
+            return self._fail(result, "busy", f"Server busy: HTTP {resp.status_code}")
+
+        if looks_expired(resp.status_code, dl.ct, ""):
+            resp.close()
+            result.latency = resp.timings['total']
+            return self._session_expired(sess, result, f"HTTP {resp.status_code}, {dl.ct or 'no content type'}")
+
+        dl.body = iter_body(resp, CHUNK_SIZE)
+        if buffer:
+            with profiler.phase("body"):
+                dl.body = list(dl.body)
+            result.latency = finish_timings(resp)['total']
+        return dl
+
+    def _decode(self, dl: "_Download"):
+        """Body -> temp file (raw PDF, or base64 found in the JSON) plus the parsed answer"""
+        try:
+            return self._guard(dl, self._decode_body, dl)
+        finally:
+            dl.resp.close()   # body consumed (or abandoned on an error) either way
+
+    def _decode_body(self, dl: "_Download"):
+        result, resp, sess, ct = dl.result, dl.resp, dl.sess, dl.ct
+        streaming = not isinstance(dl.body, list)   # pipeline mode: body already read, writer fsyncs in batches
+        # Body is streamed: peek at the first chunk to tell PDF from JSON
+        chunks = iter(dl.body)
+        first = next(chunks, b"")
+        body = itertools.chain((first,), chunks)
+
+        # 1) Direct PDF binary - written to a temp file, verified and renamed once complete
+        if "application/pdf" in ct or looks_like_pdf_bytes(first):
+            with profiler.phase("body") if streaming else contextlib.nullcontext():
+                dl.tmp_path, dl.nbytes, dl.sha256 = write_stream(body, self.output_dir, fsync=streaming)
+            if streaming:
+                result.latency = finish_timings(resp)['total']
+            self.log(f"⏱️ {format_timings(resp.timings)}")
+            self.throttle.on_success(result.latency)
+            return dl
+
+        # 2) JSON response - a base64 PDF anywhere in it is decoded into a temp file while it downloads
+        extractor = JSONPDFExtractor(self.output_dir, fsync=streaming)
+        decode = 0.0
+        try:
+            with profiler.phase("body") if streaming else contextlib.nullcontext():
+                for chunk in body:
+                    t = time.perf_counter()
+                    with profiler.phase("json_scan"):
+                        extractor.feed(chunk)
+                    decode += time.perf_counter() - t
+        except BaseException:
+            extractor.abort()
+            raise
+        t = time.perf_counter()
+        text, dl.tmp_path, dl.nbytes, dl.sha256 = extractor.close()
+        try:
+            with profiler.phase("json_parse"):
+                j = json.loads(text)
+        except ValueError:
+            j = None
+        result.decode_time = decode + time.perf_counter() - t
+        if streaming:
+            result.latency = finish_timings(resp)['total']
+        result.response = j if j is not None else text[:2000]
+        self.log(f"⏱️ {format_timings(resp.timings)}")
+        if j is None:
+            if looks_expired(resp.status_code, ct, text[:200]):
+                return self._session_expired(sess, result, "HTML page instead of JSON")
+            self.log("❌ Not JSON / Not PDF. Status:", resp.status_code, "Snippet:", text[:400])
+            return self._fail(result, "not_json", f"Not JSON / Not PDF (HTTP {resp.status_code})")
+        if not isinstance(j, dict):
+            return self._fail(result, "not_json", f"Unexpected JSON ({type(j).__name__})")
+
+        ec_data = j.get("EC")
+        result.ec_status = ec_data.get("statusCode") if isinstance(ec_data, dict) else None
+        result.message = j.get("message")
+        result.village = village_info(j)
+        result.subdivisions = subdivision_hints(j)
+        if result.ec_status is None and not dl.tmp_path and looks_expired(resp.status_code, ct, "{", result.message):
+            return self._session_expired(sess, result, f"server message: {result.message}")
+        if result.ec_status in self.overload_ec_status:
+            self.throttle.on_overload(f"EC status {result.ec_status}")
+            return self._fail(result, "busy", f"Server busy (EC status {result.ec_status})")
+        self.throttle.on_success(result.latency)
+
+        # Check for specific TNGIS status codes
+        if result.ec_status == 100:
+            self.log("✅ Status 100: Success! Looking for PDF content...")
+        elif result.ec_status in self.negative_ec_status:
+            self.log(f"⚠️ Status {result.ec_status}: No Data Found / Generation Failed for these details.")
+        elif result.ec_status:
+            self.log(f"⚠️ API returned generic Status Code: {result.ec_status}")
+
+        # Print Village Name if available to confirm location
+        if result.village:
+            v = result.village
+            self.log(f"📍 Hit Village: {v.get('regVillageNameEng')} ({v.get('regVillageNameTam')}) | SRO: {v.get('sroNameEng')}")
+
+        # quick debug
+        if result.message is not None:
+            self.log("Server message:", result.message)
+
+        # 2a) Base64 PDF (nested keys handled by the extractor) - already in the temp file
+        if dl.tmp_path:
+            return dl
+        if extractor.error:
+            self.log(extractor.error)
+            result.status, result.error = "decode_error", extractor.error
+
+        # 2b) Maybe JSON gives a PDF URL
+        for k in PDF_URL_KEYS:
+            url = j.get(k)
+            if isinstance(url, str) and url.lower().endswith(".pdf"):
+                with profiler.phase("throttle"):
+                    self.throttle.acquire(urgent=self.urgent)   # a second request to the same server
+                r2 = timed_request(sess.http, "GET", url, timeout=self.timeout,
+                                   headers={"Referer": self.referer, "User-Agent": self.headers["User-Agent"]})
+                try:
+                    if 200 <= r2.status_code < 300 and looks_like_pdf_bytes(r2.content):
+                        dl.tmp_path, dl.nbytes, dl.sha256 = write_stream((r2.content,), self.output_dir, fsync=streaming)
+                        return dl
+                finally:
+                    r2.close()
+
+        if result.ec_status in self.negative_ec_status:
+            if self.cache:
+                self.cache.put(dl.cache_key, 'negative', result.ec_status, etag=resp.headers.get("ETag"),
+                               last_modified=resp.headers.get("Last-Modified"))
+            return self._fail(result, "no_data", f"No Data Found (EC status {result.ec_status})")
+        self.log("⚠️ JSON received but no PDF/base64 found. Full JSON (trimmed):", str(j)[:800])
+        if result.error:
+            return self._fail(result, result.status, result.error)
+        return self._fail(result, "no_pdf", f"No PDF in JSON (EC status {result.ec_status})")
+
+    def _write(self, dl: "_Download") -> ECResult:
+        """Verify + publish the temp file under its EC filename"""
+        return self._guard(dl, self._write_pdf, dl)
+
+    def _write_pdf(self, dl: "_Download") -> ECResult:
+        tmp_path, dl.tmp_path = dl.tmp_path, None
+        self._publish(tmp_path, dl.sha256, dl.nbytes, dl.result)  # consumes the temp file
+        self._remember_pdf(dl.cache_key, dl.resp, dl.result)
+        return dl.result
+
+    def _follow(self, leader: ECResult, result: ECResult, refresh: bool):
+        """Copy the in-flight lookup's answer; a different filename gets the same PDF linked in"""
+        result.coalesced = True
+        result.ok, result.status, result.ec_status, result.error, result.message = (
+            leader.ok, leader.status, leader.ec_status, leader.error, leader.message)
+        result.sha256, result.bytes, result.village = leader.sha256, leader.bytes, leader.village
+        result.subdivisions = leader.subdivisions
+        result.path = os.path.join(self.output_dir, result.filename)
+        if not leader.ok or self.pdf_store.location(result.path) == leader.path:
+            result.path = leader.path if leader.ok else result.path
+            self.log(f"🔗 {result.filename}: same lookup already in flight, shared its answer ({leader.status})")
+            return
+        if self.exists(result.path):
+            result.path = self.pdf_store.location(result.path)
+            self._done(result, "exists")
+        elif leader.sha256 and self.pdf_store.link_blob(self.pdf_store.blob_path(leader.sha256), leader.sha256,
+                                                         result.path):
+            result.path = self.pdf_store.location(result.path)
+            self.log(f"🔗 {result.filename}: same EC as {leader.filename}, linked")
+        else:
+            # leader's file was already on disk (no blob to link) - this name needs its own lookup
+            result.coalesced = False
+            self._fetch(result, refresh)
+
+    def _done(self, result: ECResult, status: str) -> ECResult:
+        result.ok, result.status = True, status
+        return result
+
+    def _fail(self, result: ECResult, status: str, error: str) -> ECResult:
+        result.ok, result.status, result.error = False, status, error
+        if status in ("busy", "invalid_pdf", "no_data"):
+            self.log(f"❌ {result.filename}: {error}")
+        return result
+
+    def _session_expired(self, sess, result: ECResult, reason: str) -> ECResult:
+        self.sessions.expire(sess, reason)
+        self.log(f"❌ Session expired ({reason}) - will retry with a fresh session")
+        return self._fail(result, "session_expired", f"Session expired ({reason})")
+
+    def _publish(self, tmp_path: str, sha256: str, nbytes: int, result: ECResult):
+        """Verify + dedup a downloaded temp file and give it its EC filename"""
+        t = time.perf_counter()
+        with profiler.phase("publish"):
+            duplicate = self.pdf_store.commit(tmp_path, sha256, result.path)
+        result.path = self.pdf_store.location(result.path)
+        result.write_time = time.perf_counter() - t
+        linked = duplicate and not is_pack_ref(result.path)    # packs store a duplicate once, no file link
+        self.log("✅ Saved:", result.path, "(same EC as an earlier file, hardlinked)" if linked else "")
+        result.sha256, result.bytes = sha256, nbytes
+        self._done(result, "saved")
+
+    def _remember_pdf(self, key: str, resp, result: ECResult):
+        if self.cache:
+            self.cache.put(key, 'pdf', result.ec_status, blob=os.path.abspath(self.pdf_store.blob_path(result.sha256)),
+                           sha256=result.sha256, size=result.bytes, etag=resp.headers.get("ETag"),
+                           last_modified=resp.headers.get("Last-Modified"))
+
+    def _serve_cached(self, entry: dict, result: ECResult) -> bool:
+        """Answer from the response cache; False if the cached PDF is gone and we must ask the server"""
+        result.ec_status = entry['ec_status']
+        if entry['kind'] == 'negative':
+            self.log(f"🗃️ Cached: EC status {entry['ec_status']} (No Data) - not asking the server again")
+            result.ok, result.status = False, "no_data"
+            result.error = f"No Data (cached EC status {entry['ec_status']})"
+            return True
+        if self.pdf_store.link_blob(entry['blob'], entry['sha256'], result.path):
+            result.path = self.pdf_store.location(result.path)
+            self.log("🗃️ Cached PDF:", result.path)
+            result.sha256, result.bytes = entry['sha256'], entry['size']
+            self._done(result, "cached")
+            return True
+        return False
+
+    # ------------------------------------------------------------------
+    # Batch
+    # ------------------------------------------------------------------
+
+    async def fetch_many(self, items, concurrency: int = 4):
+        """Async generator: fetch payloads (or (payload, filename) tuples) with at most `concurrency`
+        in flight, yielding ECResults in completion order. Input is consumed lazily."""
+        import asyncio  # only batch callers pay for these; keeps single lookups fast to start
+        from concurrent.futures import ThreadPoolExecutor
+        loop = asyncio.get_running_loop()
+        it = iter(items)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ec-fetch") as pool:
+            pending = set()
+
+            def submit_next() -> bool:
+                item = next(it, None)
+                if item is None:
+                    return False
+                payload, filename = item if isinstance(item, tuple) else (item, None)
+                pending.add(loop.run_in_executor(pool, self.fetch, payload, filename))
+                return True
+
+            for _ in range(concurrency):
+                if not submit_next():
+                    break
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    pending.discard(fut)
+                    submit_next()
+                    yield fut.result()
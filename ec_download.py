@@ -0,0 +1,366 @@
+# ec_download.py - One command line for everything: bulk, retry, discover, manual, probe, codes, bench, pack, shard
+#
+#   python ec_download.py bulk ec_files.xlsx --out Moolakaraipatti_EC_Output --district 29 --taluk 08
+#   python ec_download.py retry --out Moolakaraipatti_EC_Output
+#   python ec_download.py discover --village 040 --surveys 384-420 --out Moolakaraipatti_EC_Output
+#   python ec_download.py campaigns campaigns.json --interactive
+#   python ec_download.py manual --district 29 --taluk 08 --village 040 --survey 384 --subdiv 2A
+#   python ec_download.py probe --village 040 --survey 384
+#   python ec_download.py codes search moolakarai --district 29
+#   python ec_download.py bench -n 100
+#   python ec_download.py pack extract Moolakaraipatti_EC_Output --village 040 --survey 384 --subdiv 2A
+#   python ec_download.py shard plan ec_files.xlsx campaign --shards 4 && python ec_download.py shard local campaign
+#
+# Only argparse and config.py load before a subcommand runs; requests, openpyxl, the job store etc. are
+# imported inside the handler that needs them, so `--help` and cron-driven single lookups start fast.
+import argparse
+import os
+import sys
+
+from config import TNGIS_CONFIG, DEFAULT_ENV, environment
+
+COOKIE_ENV = "TNGIS_COOKIE"   # 👉 browser cookie-a inga export pannunga, command line-la podaama
+
+
+def endpoint(args) -> tuple:
+    """api_url, referer and timeout for the chosen --env, with --api / --referer overriding"""
+    env = environment(args.env)
+    return args.api or env['api_url'], args.referer or env['referer'], env['timeout']
+
+
+def cookie(args):
+    return args.cookie or os.environ.get(COOKIE_ENV) or None
+
+
+def lookup_payload(args) -> dict:
+    return {"revDistrictCode": args.district, "revTalukCode": args.taluk, "revVillageCode": args.village.zfill(3),
+            "survey_number": args.survey, "sub_division_number": args.subdiv}
+
+
+def bulk_settings(args):
+    from bulk import BulkSettings
+    api_url, referer, timeout = endpoint(args)
+    settings = BulkSettings(output_dir=getattr(args, "out", None), district=args.district, taluk=args.taluk,
+                            api_url=api_url, referer=referer, cookie=cookie(args), timeout=timeout,
+                            workers=args.workers, sessions=args.sessions, per_session_rate=args.per_session_rate,
+                            force_refresh=args.force_refresh, metrics_port=getattr(args, "metrics_port", None),
+                            metrics_host=getattr(args, "metrics_host", "127.0.0.1"),
+                            codes_file=args.codes_db, recheck_codes=args.recheck_codes, pipeline=args.pipeline,
+                            decode_workers=args.decode_workers, pack=getattr(args, "pack", False), profile=args.profile)
+    if getattr(args, "pack_size_mb", None) is not None:
+        settings.pack_max_mb = args.pack_size_mb
+    if args.rate is not None:
+        settings.rate = args.rate
+    if args.max_rate is not None:
+        settings.max_rate = args.max_rate
+    return settings
+
+
+def cmd_bulk(args) -> int:
+    if not os.path.exists(args.input):
+        print(f"❌ Input file '{args.input}' not found!")
+        print("Please create an Excel/CSV/JSONL file with columns: Village_No, Survey No., Sub Division")
+        return 1
+    from bulk import BulkRun
+    settings = bulk_settings(args)
+    settings.verify_existing = args.verify_existing
+    settings.postprocess = args.postprocess
+    with BulkRun(settings) as run:
+        if args.failed_entries:
+            run.import_failed_entries(args.failed_entries)
+        run.process(args.input)
+        return 1 if run.store.counts().get('failed') else 0
+
+
+def cmd_retry(args) -> int:
+    from bulk import BulkRun
+    with BulkRun(bulk_settings(args)) as run:
+        run.retry_failed(include_no_data=args.include_no_data)
+        return 1 if run.store.counts().get('failed') else 0
+
+
+def cmd_discover(args) -> int:
+    from bulk import BulkRun
+    from discover import Discovery, parse_ranges, HIT
+    try:
+        surveys = parse_ranges(args.surveys)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    villages = [v.strip() for v in args.village.split(",") if v.strip()]
+    jobs_file = args.jobs or os.path.join(args.out, "discovered_jobs.jsonl")
+    with BulkRun(bulk_settings(args)) as run:
+        finder = Discovery(run.client, args.district, args.taluk, gap=args.gap, guesses=args.guess.split(","),
+                           guess_misses=args.guess_misses, retry=run.retry)
+        entries = finder.run(villages, surveys, jobs_file, args.workers)
+        # Found ECs are already saved; unanswered ones wait in the job store for `retry` / `bulk`
+        added = run.store.add_jobs(entries, args.district, args.taluk,
+                                   {e['filename'] for e in entries if e['discovered'] == HIT})
+        print(f"🗂️ {added} discovered jobs added to {run.job_db}")
+    return 0
+
+
+def cmd_campaigns(args) -> int:
+    from bulk import Budget
+    from scheduler import FairScheduler, load_campaigns
+    from rate_limiter import THROTTLE_STATE_FILE
+    base = bulk_settings(args)
+    # No single output folder here - the learned rate lives next to the campaign file
+    base.throttle_file = os.path.join(os.path.dirname(os.path.abspath(args.file)), THROTTLE_STATE_FILE)
+    try:
+        campaigns = load_campaigns(args.file, base)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Campaign file: {e}")
+        return 1
+    scheduler = FairScheduler(Budget(base), args.workers)
+    for name, input_file, weight, priority, settings in campaigns:
+        if args.interactive:
+            settings.verbose = False   # keep the prompt readable
+        scheduler.add(name, input_file, settings, weight, priority)
+    if not args.interactive:
+        scheduler.run()
+        return 0
+
+    import threading
+    import manual_ec_download
+    background = threading.Thread(target=scheduler.run, daemon=True)
+    background.start()
+    manual_ec_download.OUTPUT_DIR = args.manual_out
+    manual_ec_download.CLIENT = scheduler.interactive_client(args.manual_out,
+                                                             archive=manual_ec_download.interactive_archive())
+    manual_ec_download.manual_entry_mode()
+    if background.is_alive():
+        print("⏳ Waiting for the campaigns to finish (Ctrl+C to stop; they resume next run)...")
+        background.join()
+    return 0
+
+
+def resolve_village(args, codes) -> bool:
+    """--village given as a name: replace it with the code of the only match in the code index"""
+    if args.village.isdigit():
+        return True
+    from code_index import describe
+    matches = codes.search(args.village, "village", args.district, args.taluk)
+    if len(matches) == 1 or (matches and matches[0]['name_en'] and
+                             matches[0]['name_en'].lower() == args.village.strip().lower()):
+        args.village = matches[0]['village']
+        return True
+    print(f"❌ Village '{args.village}' is " + ("ambiguous:" if matches else "not in the code index"))
+    for row in matches:
+        print(f"   {describe(row)}")
+    return False
+
+
+def cmd_manual(args) -> int:
+    from code_index import CodeIndex
+    from ec_client import ECClient, ec_filename
+    from ec_payload import normalize_payload
+    from input_reader import make_entry
+    api_url, referer, timeout = endpoint(args)
+    cookies = [cookie(args)] if cookie(args) else ()
+    codes = CodeIndex(args.codes_db, recheck=args.recheck_codes)
+    if not (args.village and args.survey):
+        # No EC given: the interactive prompt loop, on this environment's client
+        import manual_ec_download
+        manual_ec_download.OUTPUT_DIR = args.out
+        manual_ec_download.CLIENT = ECClient(args.out, api_url, referer, cookies=cookies, timeout=timeout,
+                                             archive=manual_ec_download.interactive_archive(), codes=codes)
+        manual_ec_download.manual_entry_mode()
+        return 0
+    if not resolve_village(args, codes):
+        return 1
+    from response_archive import ResponseArchive, ARCHIVE_DIR
+    archive = ResponseArchive(os.path.join(args.out, ARCHIVE_DIR), sample_rate=1.0)
+    client = ECClient(args.out, api_url, referer, cookies=cookies, timeout=timeout, verbose=not args.quiet,
+                      archive=archive, codes=codes)
+    # Same canonical payload and file name as a bulk row ("2a" -> _2A_, "0384" -> 384)
+    payload = normalize_payload(lookup_payload(args))
+    entry = make_entry(args.village, args.survey, args.subdiv, payload["revDistrictCode"], payload["revTalukCode"])
+    for legacy in {ec_filename(lookup_payload(args)), entry.get('legacy_filename')} - {None}:
+        if client.pdf_store.adopt_legacy(legacy, entry['filename']):
+            print(f"🏷️ Renamed {legacy} -> {entry['filename']}")
+    try:
+        result = client.fetch(payload, entry['filename'])
+    finally:
+        archive.close()
+    if result.ok:
+        print(f"✅ {result.path}")
+    else:
+        print(f"❌ {result.status}: {result.error or result.message or ''}".rstrip(": "))
+    return 0 if result.ok else 1
+
+
+def cmd_probe(args) -> int:
+    import api_debug
+    api_url, referer, _ = endpoint(args)
+    if args.timing:
+        api_debug.compare_connection_reuse(referer, args.timing)
+    else:
+        api_debug.debug_api_response(api_url, lookup_payload(args))
+    return 0
+
+
+def cmd_codes(args) -> int:
+    from code_index import CodeIndex, describe
+    codes = CodeIndex(args.codes_db)
+    if args.action == "search":
+        if not args.value:
+            print("❌ codes search needs a name")
+            return 1
+        matches = codes.search(args.value, args.level, args.district, args.taluk, args.limit)
+        for row in matches:
+            print(describe(row))
+        if not matches:
+            print(f"🔍 No {args.level} named like '{args.value}'")
+        return 0 if matches else 1
+    if args.action in ("import", "learn"):
+        if not (args.value and os.path.exists(args.value)):
+            print(f"❌ '{args.value}' not found")
+            return 1
+        if args.action == "import":
+            print(f"📥 {codes.import_seed(args.value)} villages imported from {args.value} (their taluks are now complete)")
+        else:
+            print(f"📥 {codes.learn_dir(args.value)} answers with village data read from {args.value}")
+    counts = codes.counts()
+    print(f"🗺️ {args.codes_db}: {counts['districts']} districts | {counts['taluks']} taluks | "
+          f"{counts['villages']} villages | {counts['invalid']} known-bad village codes")
+    return 0
+
+
+def cmd_bench(args) -> int:
+    import bench
+    bench.main(args.extra)
+    return 0
+
+
+def cmd_pack(args) -> int:
+    import pack_store
+    return pack_store.main(args.extra)
+
+
+def cmd_shard(args) -> int:
+    import shard
+    return shard.main(args.extra)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="ec_download", description="Download Tamil Nadu Encumbrance Certificates from TNGIS")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    server = argparse.ArgumentParser(add_help=False)
+    server.add_argument("--env", default=DEFAULT_ENV, choices=sorted(TNGIS_CONFIG), help="environment from config.py")
+    server.add_argument("--api", help="EC endpoint URL (overrides --env)")
+    server.add_argument("--referer", help="page that hands out session cookies (overrides --env)")
+    server.add_argument("--cookie", help=f"browser cookie for the first session (default: ${COOKIE_ENV})")
+    server.add_argument("--codes-db", default="ec_codes.db", help="village code index (see code_index.py)")
+    server.add_argument("--recheck-codes", action="store_true",
+                        help="also send village codes the index refused earlier (they are dropped if the server knows them)")
+
+    codes = argparse.ArgumentParser(add_help=False)
+    codes.add_argument("--district", default="29")
+    codes.add_argument("--taluk", default="08")
+
+    budget = argparse.ArgumentParser(add_help=False)
+    budget.add_argument("--workers", type=int, default=4)
+    budget.add_argument("--rate", type=float, help="starting req/s shared by all workers")
+    budget.add_argument("--max-rate", type=float)
+    budget.add_argument("--sessions", type=int, default=3)
+    budget.add_argument("--per-session-rate", type=float, default=0.2)
+    budget.add_argument("--force-refresh", action="store_true", help="ignore cached answers")
+    budget.add_argument("--pipeline", action="store_true",
+                        help="workers only fetch; decoding and writing run in separate stages (see pipeline.py)")
+    budget.add_argument("--decode-workers", type=int, default=2, help="decode threads with --pipeline")
+    budget.add_argument("--profile", nargs="?", const="phases", choices=("phases", "cprofile", "sample"),
+                        help="time every download phase and print a breakdown at the end; cprofile / sample also "
+                             "profile the code (dumps in --out, see profiler.py)")
+
+    run = argparse.ArgumentParser(add_help=False, parents=[budget])
+    run.add_argument("--out", required=True, help="output folder (PDFs, ec_jobs.db, events, metrics)")
+    run.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port during the run")
+    run.add_argument("--metrics-host", default="127.0.0.1",
+                     help="address for --metrics-port (default local only; 0.0.0.0 for a remote Prometheus)")
+    run.add_argument("--pack", action="store_true",
+                     help="store PDFs in size-capped tar packs + index under <out>/packs/ (see pack_store.py)")
+    run.add_argument("--pack-size-mb", type=float, help="size cap per pack with --pack (default 1024)")
+
+    p = sub.add_parser("bulk", parents=[server, codes, run], help="download every row of an input sheet")
+    p.add_argument("input", help=".xlsx, .csv or .jsonl with Village_No / Survey No. / Sub Division")
+    p.add_argument("--verify-existing", action="store_true", help="re-download broken PDFs already in --out")
+    p.add_argument("--postprocess", action="store_true", help="index saved PDFs (text + transactions)")
+    p.add_argument("--failed-entries", help="old failed_entries.json to import once")
+    p.set_defaults(func=cmd_bulk)
+
+    p = sub.add_parser("retry", parents=[server, codes, run], help="run failed jobs of an earlier bulk run again")
+    p.add_argument("--include-no-data", action="store_true", help="also re-check \"No Data\" answers")
+    p.set_defaults(func=cmd_retry)
+
+    p = sub.add_parser("campaigns", parents=[server, codes, budget],
+                       help="several input sheets / output folders at once, sharing one request budget")
+    p.add_argument("file", help="campaign file (json, see scheduler.py); --district/--taluk are the defaults")
+    p.add_argument("--interactive", action="store_true", help="manual prompt on top; its lookups skip the queue")
+    p.add_argument("--manual-out", default="Govindacheri_EC_Output", help="output folder for --interactive lookups")
+    p.set_defaults(func=cmd_campaigns)
+
+    p = sub.add_parser("discover", parents=[server, codes, run],
+                       help="probe survey ranges of a village and write the job list of what exists")
+    p.add_argument("--village", required=True, help="village code(s), comma separated")
+    p.add_argument("--surveys", required=True, help="survey numbers / ranges, e.g. 384-420,450")
+    p.add_argument("--gap", type=int, default=10, help="stop a range after this many empty survey numbers in a row")
+    p.add_argument("--guess", default="", help="sub-divisions to try when the server gives no hints, e.g. 1,2,1A,1B")
+    p.add_argument("--guess-misses", type=int, default=3, help="stop guessing in a survey after this many misses")
+    p.add_argument("--jobs", help="job list to write (default: <out>/discovered_jobs.jsonl)")
+    p.set_defaults(func=cmd_discover)
+
+    for name, help_text in (("manual", "one EC (exit code 0/1), or the interactive prompt without --village"),
+                            ("probe", "show the raw API answer for one EC")):
+        p = sub.add_parser(name, parents=[server, codes], help=help_text)
+        p.add_argument("--village", required=name == "probe", help="village code" + (" or name" if name == "manual" else ""))
+        p.add_argument("--survey", required=name == "probe")
+        p.add_argument("--subdiv", default="-")
+        if name == "manual":
+            p.add_argument("--out", default="Govindacheri_EC_Output")
+            p.add_argument("-q", "--quiet", action="store_true", help="only print the result line")
+            p.set_defaults(func=cmd_manual)
+        else:
+            p.add_argument("--timing", type=int, metavar="N", help="compare N fresh vs pooled connections instead")
+            p.set_defaults(func=cmd_probe)
+
+    # own --district / --taluk: search is not limited to one taluk unless asked
+    p = sub.add_parser("codes", parents=[server], help="village code index: search names, import a seed file")
+    p.add_argument("action", choices=("search", "import", "learn", "stats"))
+    p.add_argument("value", nargs="?", help="name to search / seed file (csv, jsonl) / output folder to learn from")
+    p.add_argument("--district")
+    p.add_argument("--taluk")
+    p.add_argument("--level", default="village", choices=("district", "taluk", "village"))
+    p.add_argument("--limit", type=int, default=10)
+    p.set_defaults(func=cmd_codes)
+
+    p = sub.add_parser("bench", add_help=False, help="throughput benchmark against mock_tngis.py (all options go to bench.py)")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("pack", add_help=False,
+                       help="packed output: extract an EC by survey number, import / list / verify (see pack_store.py)")
+    p.set_defaults(func=cmd_pack)
+
+    p = sub.add_parser("shard", add_help=False,
+                       help="split a sheet into shards, run them on several hosts / egress IPs, merge (see shard.py)")
+    p.set_defaults(func=cmd_shard)
+    return ap
+
+
+# Subcommands whose options are parsed by another module (everything after the name is passed on)
+FORWARDING = ("bench", "pack", "shard")
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in FORWARDING:
+        args, args.extra = parser.parse_known_args(argv)
+    else:
+        args = parser.parse_args(argv)    # a mistyped option is an error, not silently ignored
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# ec_index.py - Post-process downloaded ECs in a process pool: validate, extract text + transactions, index them
+import io
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pack_store import PACK_DIR, PackStore, is_pack_ref, read_ref
+from pdf_writer import check_pdf, check_pdf_data
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ecs (
+    filename     TEXT PRIMARY KEY,
+    sha256       TEXT,
+    district     TEXT,
+    taluk        TEXT,
+    village      TEXT,
+    survey       TEXT,
+    subdivision  TEXT,
+    village_name TEXT,
+    sro          TEXT,                    -- sroNameEng from the API response
+    pages        INTEGER,
+    valid        INTEGER NOT NULL,
+    error        TEXT,
+    transactions INTEGER NOT NULL DEFAULT 0,
+    text         TEXT,
+    indexed_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    filename      TEXT NOT NULL,
+    seq           INTEGER NOT NULL,
+    doc_no        TEXT NOT NULL,
+    doc_year      INTEGER NOT NULL,
+    nature        TEXT,
+    executed_on   TEXT,
+    registered_on TEXT,
+    executants    TEXT,
+    claimants     TEXT,
+    sro           TEXT,
+    PRIMARY KEY (filename, seq)
+);
+CREATE INDEX IF NOT EXISTS transactions_doc ON transactions (doc_year, doc_no);
+"""
+
+# "1234/2015" - document number & year; not the tail of a dd/mm/yyyy date
+DOC_NO_RE = re.compile(r"(?<![\d/.-])(\d{1,6})\s*/\s*((?:19|20)\d{2})(?![\d/])")
+DATE_RE = re.compile(r"\b\d{1,2}[-/.](?:\d{1,2}|[A-Za-z]{3})[-/.](?:19|20)\d{2}\b")
+NATURE_RE = re.compile(r"\b(Sale(?: Deed)?|Mortgage|Settlement|Gift|Release|Partition|Lease|Will|"
+                       r"Power of Attorney|Agreement|Receipt|Exchange|Cancellation|Rectification)\b", re.I)
+EXECUTANT_RE = re.compile(r"(?:Executant\(?s?\)?|எழுதிக் ?கொடுத்தவர்\(?கள்\)?)\s*[:\-]?\s*(.+?)"
+                          r"(?=Claimant|எழுதி ?வாங்கியவர்|$)", re.S | re.I)
+CLAIMANT_RE = re.compile(r"(?:Claimant\(?s?\)?|எழுதி ?வாங்கியவர்\(?கள்\)?)\s*[:\-]?\s*(.+?)"
+                         r"(?=Vol|Consideration|Market|Executant|$)", re.S | re.I)
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.split())[:500] or None
+
+
+def parse_transactions(text: str) -> list:
+    """Best-effort split of EC text into transaction rows, one per document number.
+
+    EC layouts vary by year and language, so fields that can't be found are left None.
+    """
+    rows = []
+    matches = list(DOC_NO_RE.finditer(text))
+    for i, m in enumerate(matches):
+        block = text[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(text)]
+        block = re.sub(r"\s+\d{1,4}\s*$", "", block)  # serial number of the next row
+        dates = DATE_RE.findall(block)
+        nature = NATURE_RE.search(block)
+        executants = EXECUTANT_RE.search(block)
+        claimants = CLAIMANT_RE.search(block)
+        rows.append({
+            'seq': i + 1,
+            'doc_no': m.group(1),
+            'doc_year': int(m.group(2)),
+            'nature': nature.group(1).title() if nature else None,
+            'executed_on': dates[0] if dates else None,
+            'registered_on': dates[-1] if dates else None,
+            'executants': _clean(executants.group(1)) if executants else None,
+            'claimants': _clean(claimants.group(1)) if claimants else None,
+        })
+    return rows
+
+
+def process_pdf(path: str, meta: dict) -> dict:
+    """Runs in a worker process: validate one PDF and pull out its text and transaction rows"""
+    packed = is_pack_ref(path)
+    record = dict(meta, filename=meta.get('filename') or os.path.basename(path), pages=None, valid=0, error=None,
+                  text=None, rows=[], indexed_at=time.time())
+    if packed:
+        data = read_ref(path)
+        ok, reason = check_pdf_data(data)
+    else:
+        ok, reason = check_pdf(path)
+    if not ok:
+        record['error'] = reason
+        return record
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        record.update(valid=1, error="text not extracted (pip install pypdf)")
+        return record
+    try:
+        reader = PdfReader(io.BytesIO(data) if packed else path)
+        record['pages'] = len(reader.pages)
+        text = "\n".join(page.extract_text() or "" for page in reader.pages)
+    except Exception as e:
+        record['error'] = f"unreadable: {e}"
+        return record
+    record.update(valid=1, text=text, rows=parse_transactions(text))
+    return record
+
+
+class ECIndex:
+    """SQLite index of processed ECs and their transaction rows"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def is_indexed(self, filename: str, sha256: str = None) -> bool:
+        row = self._conn().execute("SELECT sha256 FROM ecs WHERE filename = ? AND valid = 1", (filename,)).fetchone()
+        return row is not None and (sha256 is None or row[0] in (None, sha256))
+
+    def add(self, record: dict):
+        rows = record.get('rows', [])
+        with self._conn() as conn:
+            conn.execute("DELETE FROM transactions WHERE filename = ?", (record['filename'],))
+            conn.execute(
+                "INSERT OR REPLACE INTO ecs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record['filename'], record.get('sha256'), record.get('district'), record.get('taluk'),
+                 record.get('village'), record.get('survey'), record.get('subdivision'), record.get('village_name'),
+                 record.get('sro'), record.get('pages'), record['valid'], record.get('error'), len(rows),
+                 record.get('text'), record['indexed_at']))
+            conn.executemany(
+                "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(record['filename'], r['seq'], r['doc_no'], r['doc_year'], r['nature'], r['executed_on'],
+                  r['registered_on'], r['executants'], r['claimants'], record.get('sro')) for r in rows])
+
+    def counts(self) -> dict:
+        conn = self._conn()
+        ecs, valid = conn.execute("SELECT COUNT(*), COALESCE(SUM(valid), 0) FROM ecs").fetchone()
+        return {'ecs': ecs, 'valid': valid, 'transactions': conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]}
+
+    def export_parquet(self, out_dir: str):
+        """Write ecs.parquet and transactions.parquet (needs `pip install pyarrow`)"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("❌ Parquet export needs `pip install pyarrow`")
+            return False
+        os.makedirs(out_dir, exist_ok=True)
+        conn = self._conn()
+        for table in ("ecs", "transactions"):
+            cur = conn.execute(f"SELECT * FROM {table}")
+            names = [d[0] for d in cur.description]
+            columns = list(zip(*cur.fetchall())) or [()] * len(names)
+            pq.write_table(pa.table({n: list(c) for n, c in zip(names, columns)}), os.path.join(out_dir, f"{table}.parquet"))
+        print(f"📦 Exported ecs.parquet / transactions.parquet to {out_dir}")
+        return True
+
+
+class PostProcessor:
+    """Feeds saved PDFs to a process pool while downloads continue; results land in an ECIndex.
+
+    At most `workers * 4` PDFs wait in the pool, so a slow parser throttles submitters instead of
+    queueing the whole campaign in memory.
+    """
+
+    def __init__(self, index_path: str, workers: int = None):
+        self.index = ECIndex(index_path)
+        self.workers = workers or os.cpu_count() or 1
+        # 👉 spawn, not fork: downloads are already running threads (locks, sockets, sqlite) a fork would copy mid-use
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._slots = threading.BoundedSemaphore(self.workers * 4)
+        self.submitted = self.failed = 0
+
+    def submit(self, path: str, meta: dict = None, sha256: str = None) -> bool:
+        """Queue one PDF unless this exact file is already indexed (packed PDFs: pass meta['filename'])"""
+        name = (meta or {}).get('filename') or os.path.basename(path)
+        if self.index.is_indexed(name, sha256):
+            return False
+        self._slots.acquire()
+        self.submitted += 1
+        fut = self.pool.submit(process_pdf, path, dict(meta or {}, sha256=sha256))
+        fut.add_done_callback(lambda f, n=name: self._done(f, n))
+        return True
+
+    def _done(self, fut, name: str):
+        self._slots.release()
+        try:
+            record = fut.result()
+        except Exception as e:
+            record = {'filename': name, 'valid': 0, 'error': f"worker failed: {e}",
+                      'indexed_at': time.time()}
+        if not record['valid']:
+            self.failed += 1
+            print(f"⚠️ Post-processing {record['filename']}: {record['error']}")
+        try:
+            self.index.add(record)
+        except sqlite3.Error as e:
+            print(f"❌ Could not index {record['filename']}: {e}")
+
+    def close(self):
+        """Wait for queued PDFs and print what was indexed"""
+        self.pool.shutdown(wait=True)
+        c = self.index.counts()
+        print(f"🧾 Post-processed {self.submitted} PDFs ({self.failed} problems) | index: {c['ecs']} ECs, "
+              f"{c['transactions']} transactions ({self.index.path})")
+
+
+def meta_from_filename(name: str) -> dict:
+    """district_taluk_village_survey[_subdivision]_EC.pdf -> fields (best effort for backfills)"""
+    parts = name[:-len("_EC.pdf")].split("_") if name.endswith("_EC.pdf") else []
+    keys = ('district', 'taluk', 'village', 'survey', 'subdivision')
+    meta = dict(zip(keys, parts[:4] + ["_".join(parts[4:]) or "-"])) if len(parts) >= 4 else {}
+    return meta
+
+
+if __name__ == "__main__":
+    # python ec_index.py <output_dir> [--parquet <dir>]  - index PDFs already on disk (loose and packed)
+    if len(sys.argv) < 2:
+        print("Usage: python ec_index.py <output_dir> [--parquet <dir>]")
+    else:
+        folder = sys.argv[1]
+        post = PostProcessor(os.path.join(folder, "ec_index.db"))
+        for entry in os.scandir(folder):
+            if entry.name.endswith(".pdf") and entry.is_file():
+                post.submit(entry.path, meta_from_filename(entry.name))
+        if os.path.isdir(os.path.join(folder, PACK_DIR)):
+            packs = PackStore(folder, readonly=True)
+            for name in sorted(packs.names()):
+                post.submit(packs.location(name), dict(meta_from_filename(name), filename=name))
+        post.close()
+        if "--parquet" in sys.argv:
+            i = sys.argv.index("--parquet")
+            post.index.export_parquet(sys.argv[i + 1] if i + 1 < len(sys.argv) else folder)
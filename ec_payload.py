@@ -0,0 +1,52 @@
+# ec_payload.py - Canonical form of an EC lookup, so "2a"/"2A", "-"/blank and "40"/"040" are one request
+import re
+
+PAYLOAD_FIELDS = ("revDistrictCode", "revTalukCode", "revVillageCode", "survey_number", "sub_division_number")
+
+# Spellings of "no sub-division" seen in input sheets
+NO_SUBDIVISION = {"", "-", "--", "–", "—"}
+
+_SPACES = re.compile(r"\s+")
+
+
+def _text(value) -> str:
+    # Excel hands numbers back as int/float - 40.0 must become "40", not "40.0"
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return _SPACES.sub("", str(value)).upper()
+
+
+def canonical_code(value, width: int) -> str:
+    """Numeric codes zero-padded to the width TNGIS uses (village 40 -> 040); others just trimmed"""
+    text = _text(value)
+    return text.zfill(width) if text.isdigit() else text
+
+
+def canonical_survey(value) -> str:
+    """384, "0384", " 384 " -> "384"; "12/1a" -> "12/1A" """
+    text = _text(value)
+    return str(int(text)) if text.isdigit() else text
+
+
+def canonical_subdivision(value) -> str:
+    """"2a", " 2A" -> "2A"; blank and dash variants -> "-" (whole survey number)"""
+    text = _text(value)
+    return "-" if text in NO_SUBDIVISION else text
+
+
+def normalize_payload(payload: dict) -> dict:
+    """Copy of an API payload with every lookup field in canonical form (other keys kept as they are)"""
+    return dict(payload,
+                revDistrictCode=canonical_code(payload.get("revDistrictCode"), 2),
+                revTalukCode=canonical_code(payload.get("revTalukCode"), 2),
+                revVillageCode=canonical_code(payload.get("revVillageCode"), 3),
+                survey_number=canonical_survey(payload.get("survey_number")),
+                sub_division_number=canonical_subdivision(payload.get("sub_division_number")))
+
+
+def payload_key(payload: dict) -> tuple:
+    """Hashable identity of a lookup: equal for payloads that only differ in formatting"""
+    p = normalize_payload(payload)
+    return tuple(p[k] for k in PAYLOAD_FIELDS)
@@ -0,0 +1,205 @@
+# http_session.py - One long-lived, pooled HTTP session shared by all EC scripts
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+
+# 👉 Connection pool settings
+POOL_SIZE = 10        # keep-alive connections per host, keep it >= WORKERS
+KEEP_ALIVE = True     # False = "Connection: close" on every request (old behaviour)
+HTTP2 = False         # needs `pip install httpx[http2]`, falls back to requests if missing
+
+# Network errors that mean "try again later", whichever client is in use
+TRANSIENT_ERRORS = (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError)
+try:
+    import httpx
+    TRANSIENT_ERRORS += (httpx.TimeoutException, httpx.TransportError)
+except ImportError:
+    httpx = None
+
+_local = threading.local()
+_session = None
+_session_lock = threading.Lock()
+
+
+def _reset_conn_timings():
+    _local.conn = None
+
+
+def _record_conn(**timings):
+    _local.conn = dict(getattr(_local, 'conn', None) or {}, **timings)
+
+
+class _TimedConnectionMixin:
+    """Records DNS, TCP connect and TLS time whenever urllib3 opens a new socket.
+
+    The name is resolved once up front (timed as dns) and urllib3 then connects to each
+    address in turn, so create_connection never has to look it up again.
+    """
+
+    def _new_conn(self):
+        t0 = time.perf_counter()
+        try:
+            addrs = socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            addrs = []  # 👉 urllib3 looks it up again below and raises its own NameResolutionError
+        t1 = time.perf_counter()
+        _record_conn(dns=t1 - t0)
+
+        host, err = self._dns_host, None
+        try:
+            for *_, sockaddr in addrs:
+                self._dns_host = sockaddr[0]  # TLS/SNI still uses self.host
+                try:
+                    sock = super()._new_conn()
+                    break
+                except ConnectTimeoutError as e:  # also NewConnectionError: try the next address
+                    err = e
+            else:
+                if err is not None:
+                    raise err
+                sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+        _record_conn(connect=time.perf_counter() - t1)
+        return sock
+
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        tcp = sum((getattr(_local, 'conn', None) or {}).get(k, 0.0) for k in ('dns', 'connect'))
+        _record_conn(tls=max(0.0, time.perf_counter() - t0 - tcp) if self.scheme == 'https' else 0.0)
+
+
+def _httpx_trace(event: str, info: dict):
+    """httpx/httpcore trace hook: times connection.connect_tcp (DNS included) and connection.start_tls"""
+    name, _, stage = event.rpartition('.')
+    step = {'connection.connect_tcp': 'connect', 'connection.start_tls': 'tls'}.get(name)
+    if step is None:
+        return
+    if stage == 'started':
+        _local.step_started = time.perf_counter()
+    elif stage == 'complete':
+        _record_conn(**{step: time.perf_counter() - _local.step_started})
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    scheme = 'http'
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    scheme = 'https'
+
+
+class _TimedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools record connection set-up timings"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPPool, 'https': _TimedHTTPSPool}
+
+
+def new_session(pool_size: int = POOL_SIZE, keep_alive: bool = KEEP_ALIVE, http2: bool = HTTP2):
+    """Create a pooled session (requests, or httpx when HTTP/2 is enabled)"""
+    if http2:
+        if httpx is not None:
+            try:
+                return httpx.Client(
+                    http2=True,
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=pool_size,
+                                        max_keepalive_connections=pool_size if keep_alive else 0),
+                )
+            except ImportError:
+                pass  # httpx without the h2 extra
+        print("⚠️ HTTP2 needs `pip install httpx[http2]` - using requests (HTTP/1.1 keep-alive)")
+
+    s = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    if not keep_alive:
+        s.headers["Connection"] = "close"
+    return s
+
+
+def get_session():
+    """The process-wide shared session, created on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = new_session()
+    return _session
+
+
+def timed_request(session, method: str, url: str, read_body: bool = True, **kwargs):
+    """Send a request and attach `resp.timings` (dns/connect/tls/ttfb/body/total seconds, reused).
+
+    On httpx the DNS lookup can't be split out, so it is counted in connect.
+    With read_body=False the body is left unread for the caller to stream (requests only);
+    call finish_timings(resp) once it has been consumed.
+    """
+    _reset_conn_timings()
+    t0 = time.perf_counter()
+    if httpx is not None and isinstance(session, httpx.Client):
+        extensions = dict(kwargs.pop('extensions', None) or {}, trace=_httpx_trace)
+        resp = session.request(method, url, extensions=extensions, **kwargs)
+        t_headers = t_body = time.perf_counter()
+    else:
+        resp = session.request(method, url, stream=True, **kwargs)
+        t_headers = time.perf_counter()
+        if read_body:
+            resp.content  # read the body now so it is timed separately
+        t_body = time.perf_counter()
+
+    conn = getattr(_local, 'conn', None)
+    setup = sum((conn or {}).values())
+    resp.timings = {
+        'dns': (conn or {}).get('dns', 0.0),
+        'connect': (conn or {}).get('connect', 0.0),
+        'tls': (conn or {}).get('tls', 0.0),
+        'ttfb': max(0.0, t_headers - t0 - setup),
+        'body': t_body - t_headers,
+        'total': t_body - t0,
+        'reused': conn is None,
+    }
+    resp.timing_started = t0
+    return resp
+
+
+def finish_timings(resp):
+    """Account for a body the caller streamed after timed_request(read_body=False)"""
+    end = time.perf_counter()
+    t = resp.timings
+    t['body'] = max(0.0, end - resp.timing_started - t['dns'] - t['connect'] - t['tls'] - t['ttfb'])
+    t['total'] = end - resp.timing_started
+    return t
+
+
+def iter_body(resp, chunk_size: int = 64 * 1024):
+    """Body chunks for both requests and httpx responses"""
+    if httpx is not None and isinstance(resp, httpx.Response):
+        return resp.iter_bytes(chunk_size)
+    return resp.iter_content(chunk_size)
+
+
+def format_timings(t: dict) -> str:
+    """One-line timing breakdown for console output"""
+    conn = "reused conn" if t['reused'] else "new conn"
+    return (f"dns {t['dns'] * 1000:.0f}ms | connect {t['connect'] * 1000:.0f}ms | tls {t['tls'] * 1000:.0f}ms | "
+            f"ttfb {t['ttfb'] * 1000:.0f}ms | body {t['body'] * 1000:.0f}ms | total {t['total'] * 1000:.0f}ms ({conn})")
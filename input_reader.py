@@ -0,0 +1,145 @@
+# input_reader.py - Streaming job input (xlsx / csv / jsonl) without pandas
+import csv
+import itertools
+import json
+import os
+
+from ec_payload import canonical_code, canonical_survey, canonical_subdivision
+
+REQUIRED_COLUMNS = ('Village_No', 'Survey No.', 'Sub Division')
+
+# Other spellings we accept for the required columns (failed_entries.json style keys etc.)
+COLUMN_ALIASES = {
+    'village_no': 'Village_No',
+    'survey_no': 'Survey No.',
+    'sub_division': 'Sub Division',
+}
+
+
+def _canonical_header(name) -> str:
+    name = str(name).strip() if name is not None else ""
+    return COLUMN_ALIASES.get(name, name)
+
+
+def check_columns(columns, source: str):
+    """Raise ValueError naming the first required column that is missing"""
+    for col in REQUIRED_COLUMNS:
+        if col not in columns:
+            raise ValueError(f"Missing required column: {col} in {source}")
+
+
+def _filename(district, taluk, village_no, survey_no, sub_division) -> str:
+    if sub_division == "-":
+        # Dash rows keep the old filename without sub-division
+        return f"{district}_{taluk}_{village_no}_{survey_no}_EC.pdf"
+    return f"{district}_{taluk}_{village_no}_{survey_no}_{sub_division}_EC.pdf"
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def legacy_filename(village, survey, sub_division, district: str, taluk: str) -> str:
+    """Name runs before ec_payload gave this row (cells as typed: "0384", "2a"), so old trees aren't re-downloaded"""
+    village_no = _cell_text(village).zfill(3)
+    return _filename(district, taluk, village_no, _cell_text(survey), _cell_text(sub_division) or "-")
+
+
+def make_entry(village, survey, sub_division, district: str, taluk: str):
+    """Normalized job entry for one row, or None for a blank row.
+
+    Values are canonical (ec_payload), so rows that only differ in formatting become the same job.
+    'legacy_filename' is set when older runs named this row's PDF differently.
+    """
+    village_no = canonical_code(village, 3)
+    survey_no = canonical_survey(survey)
+    subdivision = canonical_subdivision(sub_division)   # blank cell means the whole survey number
+    if not village_no or not survey_no:
+        return None
+    entry = {
+        'district': district,
+        'taluk': taluk,
+        'village_no': village_no,
+        'survey_no': survey_no,
+        'sub_division': subdivision,
+        'filename': _filename(district, taluk, village_no, survey_no, subdivision),
+    }
+    legacy = legacy_filename(village, survey, sub_division, district, taluk)
+    if legacy != entry['filename']:
+        entry['legacy_filename'] = legacy
+    return entry
+
+
+def _iter_xlsx_rows(path: str):
+    from openpyxl import load_workbook  # only needed for Excel input
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [_canonical_header(h) for h in next(rows, ())]
+        check_columns(header, path)
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        wb.close()
+
+
+def _iter_csv_rows(path: str):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [_canonical_header(h) for h in next(reader, [])]
+        check_columns(header, path)
+        for row in reader:
+            yield dict(zip(header, row))
+
+
+def _iter_jsonl_rows(path: str):
+    with open(path, encoding='utf-8') as f:
+        checked = False
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = {_canonical_header(k): v for k, v in json.loads(line).items()}
+            if not checked:
+                check_columns(record, path)
+                checked = True
+            yield record
+
+
+READERS = {
+    '.xlsx': _iter_xlsx_rows,
+    '.xlsm': _iter_xlsx_rows,
+    '.csv': _iter_csv_rows,
+    '.jsonl': _iter_jsonl_rows,
+}
+
+
+def iter_rows(path: str):
+    """Raw rows keyed by canonical column name; the header is checked when the first row is pulled"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"Unsupported input type '{ext}' (use {', '.join(sorted(READERS))})")
+    return READERS[ext](path)
+
+
+def iter_jobs(path: str, district: str, taluk: str):
+    """Lazily yield normalized job entries from an xlsx / csv / jsonl file.
+
+    Columns are validated on call (ValueError), before any row is handed out.
+    """
+    rows = iter_rows(path)
+    first = next(rows, None)
+
+    def jobs():
+        if first is None:
+            return
+        for row in itertools.chain((first,), rows):
+            entry = make_entry(row.get('Village_No'), row.get('Survey No.'), row.get('Sub Division'), district, taluk)
+            if entry is not None:
+                yield entry
+    return jobs()
@@ -0,0 +1,248 @@
+# job_store.py - Durable, resumable run state for bulk EC downloads (SQLite, WAL mode)
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY,
+    district    TEXT NOT NULL,
+    taluk       TEXT NOT NULL,
+    village     TEXT NOT NULL,
+    survey      TEXT NOT NULL,
+    subdivision TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',   -- pending / running / done / failed / no_data
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    ec_status   INTEGER,
+    bytes       INTEGER,
+    latency     REAL,
+    claimed_by  TEXT,
+    claimed_at  REAL,
+    updated_at  REAL,
+    next_attempt_at REAL,                         -- pending retries wait until this time (backoff)
+    UNIQUE (district, taluk, village, survey, subdivision)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_filename ON jobs (filename);
+"""
+
+# A job still 'running' after this long belongs to a dead worker
+STALE_CLAIM_SECONDS = 300
+
+
+def job_payload(job: dict) -> dict:
+    """API payload for a job row"""
+    return {
+        "revDistrictCode": job['district'],
+        "revTalukCode": job['taluk'],
+        "revVillageCode": job['village'],
+        "survey_number": job['survey'],
+        "sub_division_number": job['subdivision'],
+    }
+
+
+def worker_name() -> str:
+    """Unique-enough id for the current thread: host:pid:thread"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _claim_dead(claimed_by: str) -> bool:
+    """True if a claim was made by a process on this host that no longer runs (shard workers: name@host:pid:tid)"""
+    try:
+        host, pid, _ = (claimed_by or "").rsplit("@", 1)[-1].rsplit(":", 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname() or pid == os.getpid() or os.name == "nt":  # os.kill(pid, 0) kills on Windows
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass          # exists, owned by someone else
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] == "Z"   # killed, not reaped yet
+    except (OSError, IndexError):
+        return False
+
+
+class JobStore:
+    """One row per (district, taluk, village, survey, subdivision) with status and attempt history"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if 'next_attempt_at' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN next_attempt_at REAL")  # job stores from older runs
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per-thread; WAL lets them (and other processes) work side by side
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_jobs(self, entries, district: str, taluk: str, done_filenames=None) -> int:
+        """Insert entries (village_no/survey_no/sub_division/filename dicts); known keys are left alone.
+
+        New rows whose filename is in `done_filenames` (e.g. one listing of OUTPUT_DIR) start as done.
+        """
+        done_filenames = done_filenames or ()
+        rows = ((entry.get('district', district), entry.get('taluk', taluk), entry['village_no'],
+                 entry['survey_no'], entry['sub_division'], entry['filename'],
+                 'done' if entry['filename'] in done_filenames else 'pending', time.time())
+                for entry in entries)
+        conn = self._conn()
+        before = conn.total_changes
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (district, taluk, village, survey, subdivision, filename, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return conn.total_changes - before
+
+    def is_done(self, filename: str) -> bool:
+        """Indexed replacement for os.path.exists(output_pdf)"""
+        row = self._conn().execute("SELECT 1 FROM jobs WHERE filename = ? AND status = 'done' LIMIT 1",
+                                   (os.path.basename(filename),)).fetchone()
+        return row is not None
+
+    def mark_done_filenames(self, filenames) -> int:
+        """Pending jobs whose PDF turned up some other way (manual run, copied tree) count as done"""
+        with self._conn() as conn:
+            conn.execute("BEGIN")
+            cur = conn.executemany("UPDATE jobs SET status = 'done', updated_at = ? WHERE filename = ? AND status = 'pending'",
+                                   [(time.time(), n) for n in filenames])
+        return cur.rowcount
+
+    def claim(self, worker: str = None):
+        """Atomically take the oldest pending job that is due and mark it running; None when nothing is due.
+
+        Retries keep their original id, so once their backoff is over they go ahead of fresh rows.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= ?) "
+                "ORDER BY id LIMIT 1", (time.time(),)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, claimed_by = ?, claimed_at = ?, "
+                "updated_at = ? WHERE id = ?", (worker or worker_name(), time.time(), time.time(), row['id']))
+        job = dict(row)
+        job['attempts'] += 1
+        return job
+
+    def mark_done(self, job_id: int, ec_status: int = None, nbytes: int = None, latency: float = None):
+        self._finish(job_id, 'done', None, ec_status, nbytes, latency)
+
+    def mark_failed(self, job_id: int, error: str, ec_status: int = None, latency: float = None):
+        self._finish(job_id, 'failed', error, ec_status, None, latency)
+
+    def mark_no_data(self, job_id: int, error: str, ec_status: int = None, latency: float = None):
+        """Definitive "No Data Found": not a failure, so the retry pass leaves it alone"""
+        self._finish(job_id, 'no_data', error, ec_status, None, latency)
+
+    def mark_retry(self, job_id: int, delay: float, error: str, ec_status: int = None, latency: float = None):
+        """Transient failure: back to pending, but not claimable for `delay` seconds"""
+        self._finish(job_id, 'pending', error, ec_status, None, latency, time.time() + delay)
+
+    def _finish(self, job_id, status, error, ec_status, nbytes, latency, next_attempt_at=None):
+        with self._conn() as conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, ec_status = ?, bytes = ?, latency = ?, "
+                "claimed_by = NULL, updated_at = ?, next_attempt_at = ? WHERE id = ?",
+                (status, error, ec_status, nbytes, latency, time.time(), next_attempt_at, job_id))
+
+    def settle(self, job: dict, result, retry=None):
+        """Record an ECResult for a claimed job; returns the retry delay if it was re-queued"""
+        if result.ok:
+            self.mark_done(job['id'], result.ec_status, result.bytes, result.latency)
+        elif result.status == 'no_data':
+            self.mark_no_data(job['id'], result.error, result.ec_status, result.latency)
+        else:
+            delay = retry.next_delay(result, job['attempts']) if retry else None
+            if delay is None:
+                self.mark_failed(job['id'], result.error or 'Download failed', result.ec_status, result.latency)
+            else:
+                self.mark_retry(job['id'], delay, result.error, result.ec_status, result.latency)
+            return delay
+        return None
+
+    def next_retry_in(self):
+        """Seconds until the earliest backed-off job is due, None if no retry is waiting"""
+        row = self._conn().execute(
+            "SELECT MIN(next_attempt_at) FROM jobs WHERE status = 'pending' AND next_attempt_at IS NOT NULL").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def requeue_stale(self, max_age: float = STALE_CLAIM_SECONDS) -> int:
+        """Put jobs left 'running' by a killed run back to pending.
+
+        A claim counts as stale once it is older than max_age, or at once if the claiming process ran on
+        this host and is gone. Claims of live workers (another shard, a parallel run) are left alone.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT id, claimed_by, claimed_at FROM jobs WHERE status = 'running'").fetchall()
+            cutoff = time.time() - max_age
+            stale = [(r['id'],) for r in rows if (r['claimed_at'] or 0) <= cutoff or _claim_dead(r['claimed_by'])]
+            conn.executemany("UPDATE jobs SET status = 'pending', claimed_by = NULL WHERE id = ?", stale)
+        return len(stale)
+
+    def requeue_failed(self, max_attempts: int = None, error_like: str = "%") -> int:
+        """Send failed jobs (optionally only those with fewer than `max_attempts`, or whose error matches
+        the LIKE pattern `error_like`) back to pending"""
+        with self._conn() as conn:
+            conn.execute("BEGIN")
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'pending', next_attempt_at = NULL "
+                "WHERE status = 'failed' AND attempts < ? AND COALESCE(last_error, '') LIKE ?",
+                (max_attempts if max_attempts is not None else 2 ** 62, error_like))
+        return cur.rowcount
+
+    def requeue_no_data(self, older_than: float = 0) -> int:
+        """Send "No Data" jobs last checked more than `older_than` seconds ago back to pending"""
+        with self._conn() as conn:
+            conn.execute("BEGIN")
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'pending' WHERE status = 'no_data' AND updated_at <= ?",
+                (time.time() - older_than,))
+        return cur.rowcount
+
+    def requeue_filenames(self, filenames) -> int:
+        """Send jobs back to pending by output filename (e.g. PDFs that failed verification)"""
+        with self._conn() as conn:
+            conn.execute("BEGIN")
+            cur = conn.executemany("UPDATE jobs SET status = 'pending' WHERE filename = ?", [(n,) for n in filenames])
+        return cur.rowcount
+
+    def jobs(self, *statuses):
+        """All jobs in the given states, in id order"""
+        marks = ", ".join("?" * len(statuses))
+        for row in self._conn().execute(f"SELECT * FROM jobs WHERE status IN ({marks}) ORDER BY id", statuses):
+            yield dict(row)
+
+    def failed_jobs(self) -> list:
+        return [dict(r) for r in self._conn().execute("SELECT * FROM jobs WHERE status = 'failed' ORDER BY id")]
+
+    def counts(self) -> dict:
+        """Job count per status"""
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return {status: n for status, n in rows}
@@ -1,7 +1,8 @@
-import requests, os, base64
-from time import sleep
-import json
-from datetime import datetime
+import os
+import atexit
+from code_index import CodeIndex, CODES_DB_FILE, describe
+from ec_client import ECClient
+from response_archive import ResponseArchive, ARCHIVE_DIR
 
 # ==========================================
 # CONFIGURATION
@@ -21,7 +22,6 @@ DEFAULT_DISTRICT_CODE = "37" # Ranipet
 DEFAULT_TALUK_CODE = "01"    # Trying 01 for Walaja (02 was Arcot)
 
 OUTPUT_DIR = "Govindacheri_EC_Output"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0",
@@ -39,130 +39,29 @@ HEADERS = {
 # HELPER FUNCTIONS
 # ==========================================
 
-def looks_like_pdf_bytes(b: bytes) -> bool:
-    return len(b) >= 4 and b[:4] == b"%PDF"
+# Same download path as the bulk script, created on first use (ec_download.py manual sets its own)
+CLIENT = None
 
-def save_pdf_bytes(data: bytes, name: str):
-    path = os.path.join(OUTPUT_DIR, name)
-    with open(path, "wb") as f:
-        f.write(data)
-    print("✅ Saved:", path)
-    return path
+def get_client() -> ECClient:
+    global CLIENT
+    if CLIENT is None:
+        # every answer is archived (compressed, base64 stripped) for inspection; village names go to the code index
+        CLIENT = ECClient(OUTPUT_DIR, API_URL, REFERER, HEADERS, cookies=[COOKIE], archive=interactive_archive(),
+                          codes=CodeIndex(CODES_DB_FILE))
+    return CLIENT
+
+def interactive_archive() -> ResponseArchive:
+    """Archive keeping every answer of an interactive session, flushed at exit"""
+    archive = ResponseArchive(os.path.join(OUTPUT_DIR, ARCHIVE_DIR), sample_rate=1.0)
+    atexit.register(archive.close)
+    return archive
 
 def try_download(payload: dict, filename: str = None) -> bool:
     """Try to download EC and return True if successful, False otherwise"""
-    s = requests.Session()
-    
-    # Generate filename if not provided
-    if not filename:
-        filename = f"{payload['revDistrictCode']}_{payload['revTalukCode']}_{payload['revVillageCode']}_{payload['survey_number']}_{payload['sub_division_number']}_EC.pdf"
-
-    # Check if file already exists
-    file_path = os.path.join(OUTPUT_DIR, filename)
-    if os.path.exists(file_path):
-        print(f"📁 File already exists, skipping: {filename}")
-        return True
-        
-    try:
-        print(f"🔄 Requesting EC for: Village {payload['revVillageCode']}, Survey {payload['survey_number']}, Sub-div {payload['sub_division_number']}...")
-        resp = s.post(API_URL, json=payload, headers=HEADERS, timeout=45)
-        ct = resp.headers.get("Content-Type", "").lower()
-
-        # 1) Direct PDF binary
-        if "application/pdf" in ct or looks_like_pdf_bytes(resp.content):
-            save_pdf_bytes(resp.content, filename)
-            return True
-
-        # 2) JSON response
-        try:
-            j = resp.json()
-            
-            # Request: Write response to JSON file
-            debug_json_path = os.path.join(OUTPUT_DIR, "debug_last_response.json")
-            with open(debug_json_path, "w", encoding="utf-8") as f:
-                json.dump(j, f, indent=2)
-            print(f"📄 Saved full API response to: {debug_json_path}")
-
-        except Exception:
-            print("❌ Not JSON / Not PDF. Status:", resp.status_code, "Snippet:", resp.text[:400])
-            return False
-
-        # Debug: Check for specific TNGIS status codes
-        ec_data = j.get("EC", {})
-        ec_status = ec_data.get("statusCode")
-        
-        if ec_status:
-            if ec_status == 100:
-                print("✅ Status 100: Success! Looking for PDF content...")
-            elif ec_status == 1003:
-                print("⚠️ Status 1003: No Data Found / Generation Failed for these details.")
-            else:
-                print(f"⚠️ API returned generic Status Code: {ec_status}")
-        
-        # Debug: Print Village Name if available to confirm location
-        try:
-            village_list = j.get("first", {}).get("data", {}).get("regVillageBeanList", [])
-            if village_list:
-                v = village_list[0]
-                print(f"📍 Hit Village: {v.get('regVillageNameEng')} ({v.get('regVillageNameTam')}) | SRO: {v.get('sroNameEng')}")
-        except:
-            pass
-
-        # quick debug
-        if "message" in j:
-            print("Server message:", j.get("message"))
-
-        # 2a) Explicit check for EC -> Base64String
-        b64 = None
-        if "EC" in j and "Base64String" in j["EC"]:
-            b64 = j["EC"]["Base64String"]
-            print("Tv Found 'Base64String' inside 'EC' object.")
-
-        # 2b) Fallback recursive scan
-        if not b64:
-            def find_b64(o):
-                if isinstance(o, dict):
-                    if "Base64String" in o:
-                        return o["Base64String"]
-                    for v in o.values():
-                        r = find_b64(v)
-                        if r: return r
-                elif isinstance(o, list):
-                    for v in o:
-                        r = find_b64(v)
-                        if r: return r
-                elif isinstance(o, str):
-                    s = o.strip()
-                    if s.startswith("data:application/pdf;base64,"):
-                        s = s.split(",",1)[1]
-                    if (len(s) > 100) and (s[:5].lower() == "jvber"):
-                        return s
-                return None
-            b64 = find_b64(j)
-
-        if b64:
-            try:
-                pdf = base64.b64decode(b64)
-                save_pdf_bytes(pdf, filename)
-                return True
-            except Exception as e:
-                print("Base64 decode fail:", e)
-
-        # 2c) Maybe JSON gives a PDF URL
-        for k in ("url", "pdfUrl", "fileUrl"):
-            url = j.get(k)
-            if isinstance(url, str) and url.lower().endswith(".pdf"):
-                r2 = s.get(url, headers={"Referer": REFERER, "User-Agent": HEADERS["User-Agent"]}, timeout=45)
-                if r2.ok and looks_like_pdf_bytes(r2.content):
-                    save_pdf_bytes(r2.content, filename)
-                    return True
-
-        print("⚠️ JSON received but no PDF found. Check 'debug_last_response.json' for details.")
-        return False
-        
-    except Exception as e:
-        print(f"❌ Download failed for {filename}: {e}")
-        return False
+    result = get_client().fetch(payload, filename)
+    if result.status in ("no_pdf", "decode_error"):
+        print(f"⚠️ JSON received but no PDF found. Check the answer with: python response_archive.py {OUTPUT_DIR} --last 1")
+    return result.ok
 
 # ==========================================
 # MANUAL INPUT LOOP
@@ -180,6 +79,24 @@ def get_user_input(prompt, default=None):
                 return user_val
             print("❌ Input cannot be empty.")
 
+def get_code(prompt, level, width, district=None, taluk=None):
+    """Code typed as digits, or a name looked up in the code index and picked from the matches"""
+    while True:
+        value = get_user_input(prompt)
+        codes = get_client().codes
+        if value.isdigit() or codes is None:
+            return value.zfill(width)
+        matches = codes.search(value, level, district, taluk)
+        if not matches:
+            print(f"❌ No {level} named like '{value}' in the code index - enter the code")
+            continue
+        for i, row in enumerate(matches, 1):
+            print(f"   {i}. {describe(row)}")
+        pick = input(f"Pick 1-{len(matches)} [1]: ").strip() or "1"
+        if pick.isdigit() and 1 <= int(pick) <= len(matches):
+            return matches[int(pick) - 1][level]
+        print("❌ Invalid choice.")
+
 def manual_entry_mode():
     """Loop for manual input of EC details"""
     print("\n" + "="*50)
@@ -187,22 +104,21 @@ def manual_entry_mode():
     print("="*50)
     print("Target: Govindacheri, Walaja, Ranipet")
     print("Please find the TNGIS Codes from the website/DevTools if unknown.")
+    print("Names work too for villages seen before (python ec_download.py codes search NAME).")
     print("="*50 + "\n")
 
     while True:
         try:
             print("\nEnter details for new EC (or Press Ctrl+C to quit):")
             
-            district_code = get_user_input("District Code (e.g. 04 or 36 for Ranipet)")
-            taluk_code = get_user_input("Taluk Code (e.g. 01 for Walaja?)")
+            district_code = get_code("District Code (e.g. 04 or 36 for Ranipet)", "district", 2)
+            taluk_code = get_code("Taluk Code (e.g. 01 for Walaja?)", "taluk", 2, district_code)
 
-            village_no = get_user_input("Village No (e.g. 084 for Govindacheri?)")
+            village_no = get_code("Village No or name (e.g. 084 for Govindacheri?)", "village", 3,
+                                  district_code, taluk_code)
             survey_no = get_user_input("Survey No")
             sub_division = get_user_input("Sub Division (enter '-' for dash)", default="-")
 
-            # Pad village number to 3 digits if needed
-            village_no = village_no.zfill(3)
-
             # Construct payload
             payload = {
                 "revDistrictCode": district_code,
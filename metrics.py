@@ -0,0 +1,229 @@
+# metrics.py - Per-request JSON-lines events plus Prometheus counters/histograms (textfile or /metrics endpoint)
+import json
+import os
+import threading
+from datetime import datetime
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+METRICS_HOST = "127.0.0.1"     # /metrics listens here; 0.0.0.0 exposes it to the network
+
+HELP = {
+    'ec_requests_total': ("counter", "EC lookups by outcome"),
+    'ec_http_responses_total': ("counter", "HTTP responses by status code"),
+    'ec_status_total': ("counter", "TNGIS EC.statusCode values seen"),
+    'ec_retries_total': ("counter", "Lookups that were a retry of an earlier failure"),
+    'ec_retries_scheduled_total': ("counter", "Transient failures put back in the queue, by reason"),
+    'ec_coalesced_total': ("counter", "Lookups that shared an identical in-flight request instead of sending one"),
+    'ec_pdf_bytes_total': ("counter", "PDF bytes saved"),
+    'ec_request_latency_seconds': ("histogram", "Request latency (headers + body)"),
+    'ec_decode_seconds': ("histogram", "Time spent parsing JSON / decoding base64"),
+    'ec_write_seconds': ("histogram", "Time spent verifying and publishing PDFs"),
+    'ec_throttle_rate': ("gauge", "Current adaptive request rate (req/s)"),
+    'ec_jobs': ("gauge", "Jobs in the job store by status"),
+    'ec_stage_utilization': ("gauge", "Pipeline stage busy time / (wall time x threads)"),
+    'ec_stage_items': ("gauge", "Lookups handled by each pipeline stage"),
+    'ec_stage_blocked_seconds': ("gauge", "Time a pipeline stage waited for room in the next stage's queue"),
+    'ec_stage_queue_peak': ("gauge", "Highest queue depth in front of a pipeline stage"),
+}
+
+
+def _escape(value) -> str:
+    """Label value as the Prometheus text format wants it: backslash, quote and newline escaped"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+class EventLog:
+    """Thread-safe JSON-lines writer, one line per request"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, **fields):
+        line = json.dumps(dict(ts=datetime.now().isoformat(timespec='milliseconds'), **fields), ensure_ascii=False)
+        with self._lock:
+            self._f.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+class Metrics:
+    """In-process counters, gauges and histograms rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}        # (name, labels) -> float, for counters and gauges
+        self._hists = {}         # (name, labels) -> [bucket counts..., sum, count]
+        self._buckets = {}
+        self._collectors = []
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._buckets.setdefault(name, buckets)
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = [0] * (len(self._buckets[name]) + 2)
+            for i, bound in enumerate(self._buckets[name]):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def add_collector(self, fn):
+        """fn(metrics) is called before every render, e.g. to refresh gauges from the job store"""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                fn(self)
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        lines, seen = [], set()
+
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, text = HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._values.items()):
+                header(name)
+                lines.append(f"{name}{labels} {value:g}")
+            for (name, labels), h in sorted(self._hists.items()):
+                header(name)
+                inner = labels[1:-1] + "," if labels else ""
+                for bound, count in zip(self._buckets[name], h):
+                    lines.append(f'{name}_bucket{{{inner}le="{bound:g}"}} {count}')
+                lines.append(f'{name}_bucket{{{inner}le="+Inf"}} {h[-1]}')
+                lines.append(f"{name}_sum{labels} {h[-2]:.6f}")
+                lines.append(f"{name}_count{labels} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Atomic write for node_exporter's textfile collector"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+class MetricsExporter:
+    """Rewrites a .prom textfile every `interval` seconds and/or serves /metrics on `host`:`port`.
+
+    The endpoint is local-only unless another host (e.g. 0.0.0.0) is asked for.
+    """
+
+    def __init__(self, metrics: Metrics, textfile: str = None, port: int = None, interval: float = 15,
+                 host: str = METRICS_HOST):
+        self.metrics = metrics
+        self.textfile = textfile
+        self.interval = interval
+        self._stop = threading.Event()
+        self.server = None
+        if port:
+            from http.server import ThreadingHTTPServer
+            self.server = ThreadingHTTPServer((host, port), self._handler())
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            print(f"📈 Metrics on http://{host}:{port}/metrics")
+        if textfile:
+            threading.Thread(target=self._loop, daemon=True).start()
+
+    def _handler(self):
+        from http.server import BaseHTTPRequestHandler
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        if self.textfile:
+            try:
+                self.metrics.write_textfile(self.textfile)
+            except OSError as e:
+                print(f"⚠️ Could not write {self.textfile}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+        if self.server:
+            self.server.shutdown()
+
+
+def record_result(result, metrics: Metrics = None, events: EventLog = None, throttle=None):
+    """Turn one ECResult into an event line and metric updates"""
+    if metrics:
+        metrics.inc('ec_requests_total', status=result.status)
+        if result.coalesced:
+            metrics.inc('ec_coalesced_total')
+        elif result.http_status is not None:
+            metrics.inc('ec_http_responses_total', code=result.http_status)
+        if result.ec_status is not None and not result.coalesced:
+            metrics.inc('ec_status_total', ec_status=result.ec_status)
+        if result.attempt > 1:
+            metrics.inc('ec_retries_total')
+        if result.status == 'saved' and result.bytes and not result.coalesced:
+            metrics.inc('ec_pdf_bytes_total', result.bytes)
+        if result.latency is not None:
+            metrics.observe('ec_request_latency_seconds', result.latency)
+        if result.decode_time:
+            metrics.observe('ec_decode_seconds', result.decode_time, FAST_BUCKETS)
+        if result.write_time:
+            metrics.observe('ec_write_seconds', result.write_time, FAST_BUCKETS)
+        if throttle is not None:
+            metrics.set_gauge('ec_throttle_rate', throttle.rate)
+    if events:
+        p = result.payload
+        events.emit(
+            key="_".join(str(p.get(k, "")) for k in ("revDistrictCode", "revTalukCode", "revVillageCode",
+                                                     "survey_number", "sub_division_number")),
+            file=result.filename, status=result.status, ok=result.ok, http_status=result.http_status,
+            ec_status=result.ec_status, bytes=result.bytes,
+            decode_s=round(result.decode_time, 4) if result.decode_time else None,
+            write_s=round(result.write_time, 4) if result.write_time else None,
+            latency_s=round(result.latency, 4) if result.latency is not None else None,
+            ttfb_s=round(result.timings['ttfb'], 4) if result.timings else None,
+            reused_conn=result.timings.get('reused') if result.timings else None,
+            attempt=result.attempt, retries=result.attempt - 1, coalesced=result.coalesced,
+            error=result.error)
@@ -0,0 +1,199 @@
+# mock_tngis.py - Local stand-in for the TNGIS EC endpoint, replays the response shapes seen in the wild
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+EC_PATH = "/apps/gi_viewer_api/api/encumbrance_certificate"
+REFERER_PATH = "/apps/gi_viewer/"
+FILES_PATH = "/files/"
+
+# Response shapes and their default share of answers
+SHAPES = ("base64", "pdf", "nodata", "nested", "url")
+DEFAULT_MIX = {"base64": 70, "pdf": 10, "nodata": 10, "nested": 5, "url": 5}
+
+LOGIN_PAGE = b"<!DOCTYPE html><html><head><title>TNGIS</title></head><body>Session expired, please login</body></html>"
+
+
+def make_pdf(size: int) -> bytes:
+    """Structurally valid single-page PDF padded to roughly `size` bytes"""
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>"]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    out += b"% " + b"x" * max(0, size - len(out) - 200) + b"\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+def parse_mix(text: str) -> dict:
+    """"base64=70,pdf=10" -> {"base64": 70, "pdf": 10}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SHAPES:
+            raise ValueError(f"Unknown shape '{name}' (choose from {', '.join(SHAPES)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class MockTNGIS(ThreadingHTTPServer):
+    """HTTP server holding the knobs shared by all handler threads"""
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, expire_rate=0.0, pdf_kb=50,
+                 mix=None, seed=None, max_village=None):
+        super().__init__(address, MockHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.expire_rate = expire_rate
+        self.pdf = make_pdf(int(pdf_kb * 1024))
+        self.pdf_b64 = base64.b64encode(self.pdf).decode()
+        mix = mix or DEFAULT_MIX
+        self.shapes, self.weights = list(mix), list(mix.values())
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.files = {}       # one-shot PDF URLs handed out by the "url" shape
+        self.counts = {}
+        self.max_village = max_village   # village codes above this are unknown: No Data without village metadata
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def roll(self):
+        """Pick the next answer: 429, expired page or one of the EC shapes"""
+        with self.lock:
+            r = self.rng.random()
+            if r < self.error_rate:
+                shape = "busy"
+            elif r < self.error_rate + self.expire_rate:
+                shape = "expired"
+            else:
+                shape = self.rng.choices(self.shapes, self.weights)[0]
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            self.counts[shape] = self.counts.get(shape, 0) + 1
+        return shape, delay
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockTNGIS
+
+    def send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj):
+        # like PHP's json_encode: every "/" escaped, so "data:application\/pdf;base64,JVBER..."
+        self.send(200, json.dumps(obj).replace("/", "\\/").encode(), "application/json")
+
+    def do_GET(self):
+        srv = self.server
+        if self.path.startswith(FILES_PATH):
+            with srv.lock:
+                found = srv.files.pop(self.path[len(FILES_PATH):], None)
+            if found is None:
+                return self.send(404, b"Not Found", "text/plain")
+            return self.send(200, srv.pdf, "application/pdf")
+        # REFERER page: hand out a fresh session cookie like the real site
+        self.send(200, LOGIN_PAGE, "text/html; charset=UTF-8",
+                  {"Set-Cookie": f"PHPSESSID={uuid.uuid4().hex[:26]}; path=/"})
+
+    def do_POST(self):
+        srv = self.server
+        n = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(n) or b"{}")
+        except ValueError:
+            return self.send(400, b'{"message":"Bad JSON"}', "application/json")
+        if self.path.split("?")[0] != EC_PATH:
+            return self.send(404, b"Not Found", "text/plain")
+
+        shape, delay = srv.roll()
+        if delay:
+            time.sleep(delay)
+
+        if shape == "busy":
+            return self.send(429, b'{"message":"Too Many Requests"}', "application/json", {"Retry-After": "1"})
+        if shape == "expired":
+            return self.send(200, LOGIN_PAGE, "text/html; charset=UTF-8")
+        if shape == "pdf":
+            return self.send(200, srv.pdf, "application/pdf")
+
+        code = str(payload.get("revVillageCode", ""))
+        if srv.max_village is not None and (not code.isdigit() or int(code) > srv.max_village):
+            return self.send_json({"first": {"data": {"regVillageBeanList": []}}, "EC": {"statusCode": 1003}})
+        village = {"regVillageNameEng": f"Village {payload.get('revVillageCode')}", "regVillageNameTam": "கிராமம்",
+                   "sroNameEng": "Mock SRO"}
+        first = {"data": {"regVillageBeanList": [village]}}
+        if shape == "nodata":
+            return self.send_json({"first": first, "EC": {"statusCode": 1003, "Base64String": None}})
+        if shape == "nested":
+            return self.send_json({"first": first, "EC": {"statusCode": 100},
+                                   "result": {"documents": [{"file": "data:application/pdf;base64," + srv.pdf_b64}]}})
+        if shape == "url":
+            token = uuid.uuid4().hex + ".pdf"
+            with srv.lock:
+                srv.files[token] = True
+            return self.send_json({"first": first, "EC": {"statusCode": 100}, "url": f"{srv.base_url}{FILES_PATH}{token}"})
+        return self.send_json({"first": first, "EC": {"statusCode": 100, "Base64String": srv.pdf_b64}})
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port: int = 0, **options) -> MockTNGIS:
+    """Run a mock server on a background thread (port 0 = any free port)"""
+    srv = MockTNGIS(("127.0.0.1", port), **options)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local mock of the TNGIS EC endpoint")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.2, help="mean seconds before each EC answer")
+    ap.add_argument("--jitter", type=float, default=0.1, help="+/- seconds added to the latency")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of 429 answers")
+    ap.add_argument("--expire-rate", type=float, default=0.0, help="share of HTML session-expired pages")
+    ap.add_argument("--pdf-kb", type=float, default=50, help="size of the returned PDF")
+    ap.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                    help="answer shapes and weights, e.g. base64=70,pdf=10,nodata=10,nested=5,url=5")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--max-village", type=int, help="highest village code that exists (others answer without village data)")
+    args = ap.parse_args()
+
+    srv = MockTNGIS(("127.0.0.1", args.port), args.latency, args.jitter, args.error_rate, args.expire_rate,
+                    args.pdf_kb, args.mix, args.seed, args.max_village)
+    print(f"🧪 Mock TNGIS on {srv.base_url}")
+    print(f"   API_URL = {srv.base_url}{EC_PATH}")
+    print(f"   REFERER = {srv.base_url}{REFERER_PATH}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nAnswers served: {srv.counts}")
+
+
+if __name__ == "__main__":
+    main()
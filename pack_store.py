@@ -0,0 +1,411 @@
+# pack_store.py - Packed output: ECs appended to size-capped tar shards plus one SQLite index, instead of loose files
+#
+#   <output_dir>/packs/pack-00001.tar ...   plain (uncompressed) tar, readable by any tar tool
+#   <output_dir>/packs/index.db             filename / payload key -> pack, offset, length, sha256
+#
+# PackStore has the PDFStore interface, so ECClient / BulkRun use it unchanged (`ec_download.py bulk --pack`).
+# Identical PDFs are stored once; other EC filenames point at the same bytes. Reads go through mmap'd packs,
+# so getting one EC by its survey number is an index lookup plus a slice.
+#
+#   python pack_store.py extract <output_dir> --village 040 --survey 384 [--subdiv 2A] [-o file.pdf]
+#   python pack_store.py import <loose_dir> [--into <output_dir>] [--move]   - pack an existing tree of PDFs
+#   python pack_store.py list <output_dir> [--village 040]
+#   python pack_store.py verify <output_dir>
+import argparse
+import contextlib
+import hashlib
+import mmap
+import os
+import sqlite3
+import sys
+import tarfile
+import threading
+import time
+
+import profiler
+from ec_payload import canonical_code, canonical_survey, canonical_subdivision
+from pdf_writer import InvalidPDF, check_pdf_data, discard
+
+PACK_DIR = "packs"
+INDEX_FILE = "index.db"
+LOCK_FILE = ".lock"             # held (OS-level) by whoever appends to the packs, in any process
+PACK_MAX_MB = 1024
+BLOCK = tarfile.BLOCKSIZE
+END_OF_ARCHIVE = b"\0" * (2 * BLOCK)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256      TEXT PRIMARY KEY,
+    pack        TEXT NOT NULL,
+    offset      INTEGER NOT NULL,       -- first byte of the PDF inside the pack
+    length      INTEGER NOT NULL,
+    verified_at REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    filename    TEXT PRIMARY KEY,
+    district    TEXT,
+    taluk       TEXT,
+    village     TEXT,
+    survey      TEXT,
+    subdivision TEXT,
+    sha256      TEXT NOT NULL,
+    added_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_key ON files (village, survey, subdivision, district, taluk);
+"""
+
+
+def is_pack_ref(ref: str) -> bool:
+    """"<pack path>#<offset>+<length>" - what PackStore.blob_path() hands out instead of a file path"""
+    return isinstance(ref, str) and "#" in ref and ref.rsplit("#", 1)[0].endswith(".tar")
+
+
+def parse_ref(ref: str) -> tuple:
+    pack, span = ref.rsplit("#", 1)
+    offset, length = span.split("+")
+    return pack, int(offset), int(length)
+
+
+@contextlib.contextmanager
+def _os_lock(path: str):
+    """Exclusive lock shared with other processes (flock, or msvcrt on Windows)"""
+    with open(path, "a+b") as f:
+        try:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue     # LK_LOCK gives up after ~10s; keep waiting
+        try:
+            yield
+        finally:
+            try:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            except ImportError:
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def key_from_filename(name: str) -> dict:
+    """district_taluk_village_survey[_subdivision]_EC.pdf -> canonical payload fields (empty if no match)"""
+    parts = name[:-len("_EC.pdf")].split("_") if name.endswith("_EC.pdf") else []
+    if len(parts) < 4:
+        return {}
+    return {'district': canonical_code(parts[0], 2), 'taluk': canonical_code(parts[1], 2),
+            'village': canonical_code(parts[2], 3), 'survey': canonical_survey(parts[3]),
+            'subdivision': canonical_subdivision("_".join(parts[4:]))}
+
+
+class PackReader:
+    """Read-only mmaps of pack files, remapped when a pack has grown since it was mapped"""
+
+    def __init__(self):
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def read(self, pack: str, offset: int, length: int) -> bytes:
+        with self._lock:
+            m = self._maps.get(pack)
+            if m is None or len(m) < offset + length:
+                if m is not None:
+                    m.close()
+                with open(pack, "rb") as f:
+                    m = self._maps[pack] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return m[offset:offset + length]
+
+    def close(self):
+        with self._lock:
+            for m in self._maps.values():
+                m.close()
+            self._maps = {}
+
+
+_READER = PackReader()
+
+
+def read_ref(ref: str) -> bytes:
+    """Bytes of one packed PDF from its blob reference"""
+    return _READER.read(*parse_ref(ref))
+
+
+class PackStore:
+    """Verified, deduplicated PDF writes into tar packs; drop-in for pdf_writer.PDFStore.
+
+    readonly=True (list / extract / verify / indexing) never touches the packs or the index, so it is safe
+    next to a running download. Appends take an OS-level lock, so several processes can share one folder.
+    """
+
+    def __init__(self, output_dir: str, full_check: bool = False, max_mb: float = PACK_MAX_MB,
+                 readonly: bool = False):
+        self.output_dir = output_dir
+        self.root = os.path.join(output_dir, PACK_DIR)
+        self.full_check = full_check
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.readonly = readonly
+        self._local = threading.local()
+        self._lock = threading.Lock()      # one appender per process; _os_lock for the other processes
+        if not readonly:
+            os.makedirs(self.root, exist_ok=True)
+            self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            path = os.path.join(self.root, INDEX_FILE)
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, timeout=30)
+            else:
+                conn = sqlite3.connect(path, timeout=30)
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _pack_path(self, number: int) -> str:
+        return os.path.join(self.root, f"pack-{number:05d}.tar")
+
+    def _tail(self):
+        """(pack number, end offset) to append at; bytes after the last indexed PDF are cut off.
+
+        Only called under the OS lock: unindexed bytes then belong to a writer that died before indexing.
+        """
+        packs = sorted(n for n in os.listdir(self.root) if n.startswith("pack-") and n.endswith(".tar"))
+        number = int(packs[-1][5:10]) if packs else 1
+        path = self._pack_path(number)
+        row = self._conn().execute("SELECT MAX(offset + length) FROM blobs WHERE pack = ?",
+                                   (os.path.basename(path),)).fetchone()
+        end = row[0] or 0
+        end += -end % BLOCK
+        if not os.path.exists(path) or os.path.getsize(path) != end + len(END_OF_ARCHIVE):
+            with open(path, "ab") as f:
+                f.truncate(end)
+                f.write(END_OF_ARCHIVE)
+        return number, end
+
+    def blob_path(self, sha256: str) -> str:
+        row = self._conn().execute("SELECT pack, offset, length FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            return ""
+        return f"{os.path.join(self.root, row['pack'])}#{row['offset']}+{row['length']}"
+
+    def is_verified(self, sha256: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone() is not None
+
+    def exists(self, path: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM files WHERE filename = ?",
+                                    (os.path.basename(path),)).fetchone() is not None
+
+    def names(self) -> set:
+        return {r[0] for r in self._conn().execute("SELECT filename FROM files")}
+
+    def adopt_legacy(self, legacy_name: str, filename: str) -> bool:
+        return False     # packs only ever held canonical names
+
+    def location(self, path: str) -> str:
+        """Where an EC filename's bytes live (a pack reference)"""
+        row = self._conn().execute("SELECT sha256 FROM files WHERE filename = ?", (os.path.basename(path),)).fetchone()
+        return self.blob_path(row['sha256']) if row else path
+
+    def _append(self, name: str, data: bytes):
+        """Add one tar member; returns (pack filename, data offset). Caller holds both locks."""
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = len(data), int(time.time()), 0o644
+        header = info.tobuf(tarfile.GNU_FORMAT, "utf-8", "surrogateescape")
+        size = len(header) + len(data) + (-len(data) % BLOCK)
+        number, end = self._tail()
+        if end and end + size + len(END_OF_ARCHIVE) > self.max_bytes:
+            number, end = number + 1, 0
+        path = self._pack_path(number)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(end)
+            f.write(header)
+            f.write(data)
+            f.write(b"\0" * (-len(data) % BLOCK))
+            f.write(END_OF_ARCHIVE)
+            f.flush()
+            os.fsync(f.fileno())
+        return os.path.basename(path), end + len(header)
+
+    def _add_file(self, final_path: str, sha256: str):
+        name = os.path.basename(final_path)
+        k = key_from_filename(name)
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (name, k.get('district'), k.get('taluk'), k.get('village'), k.get('survey'),
+                          k.get('subdivision'), sha256, time.time()))
+
+    def add_bytes(self, data: bytes, sha256: str, final_path: str, verify: bool = True) -> bool:
+        """Store PDF bytes under an EC filename; returns True if the same PDF was already packed"""
+        if not self.is_verified(sha256) and verify:
+            with profiler.phase("verify"):
+                ok, reason = check_pdf_data(data, self.full_check)
+            if not ok:
+                raise InvalidPDF(f"Invalid PDF: {reason}")
+        with self._lock, _os_lock(os.path.join(self.root, LOCK_FILE)):
+            duplicate = self.is_verified(sha256)    # again: another process may have packed it meanwhile
+            if not duplicate:
+                pack, offset = self._append(os.path.basename(final_path), data)
+                with self._conn() as conn:
+                    conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?)",
+                                 (sha256, pack, offset, len(data), time.time()))
+            self._add_file(final_path, sha256)
+        return duplicate
+
+    def commit(self, tmp_path: str, sha256: str, final_path: str) -> bool:
+        """Verify a finished temp file and pack it as final_path; the temp file is always removed"""
+        try:
+            with open(tmp_path, "rb") as f:
+                data = f.read()
+            return self.add_bytes(data, sha256, final_path)
+        finally:
+            discard(tmp_path)
+
+    def link_blob(self, blob: str, sha256: str, final_path: str) -> bool:
+        """Publish an already stored PDF (cache hit, identical lookup); False if it is gone"""
+        if self.is_verified(sha256):
+            self._add_file(final_path, sha256)
+            return True
+        try:
+            data = read_ref(blob) if is_pack_ref(blob) else open(blob, "rb").read()
+        except (OSError, ValueError):
+            return False
+        if hashlib.sha256(data).hexdigest() != sha256:
+            return False
+        self.add_bytes(data, sha256, final_path)
+        return True
+
+    def save_bytes(self, data: bytes, final_path: str) -> bool:
+        return self.add_bytes(data, hashlib.sha256(data).hexdigest(), final_path)
+
+    def read(self, filename: str) -> bytes:
+        ref = self.location(filename)
+        if not is_pack_ref(ref):
+            raise KeyError(filename)
+        return read_ref(ref)
+
+    def find(self, village: str, survey: str, subdivision: str = "-", district: str = None,
+             taluk: str = None) -> list:
+        """Index rows for one survey number (all districts/taluks in this folder unless given)"""
+        sql = "SELECT * FROM files WHERE village = ? AND survey = ? AND subdivision = ?"
+        args = [canonical_code(village, 3), canonical_survey(survey), canonical_subdivision(subdivision)]
+        if district:
+            sql += " AND district = ?"
+            args.append(canonical_code(district, 2))
+        if taluk:
+            sql += " AND taluk = ?"
+            args.append(canonical_code(taluk, 2))
+        return [dict(r) for r in self._conn().execute(sql, args)]
+
+    def verify_tree(self):
+        """Check every packed PDF; returns the EC filenames whose bytes are bad"""
+        bad_blobs = set()
+        rows = self._conn().execute("SELECT sha256, pack, offset, length FROM blobs").fetchall()
+        for r in rows:
+            data = _READER.read(os.path.join(self.root, r['pack']), r['offset'], r['length'])
+            ok, reason = check_pdf_data(data, self.full_check)
+            if not ok or hashlib.sha256(data).hexdigest() != r['sha256']:
+                print(f"❌ {r['pack']}@{r['offset']}: {reason if not ok else 'sha256 mismatch'}")
+                bad_blobs.add(r['sha256'])
+        bad = [r[0] for r in self._conn().execute("SELECT filename, sha256 FROM files") if r[1] in bad_blobs]
+        print(f"🔎 Checked {len(rows)} packed PDFs, {len(bad_blobs)} bad ({len(bad)} EC files)")
+        return bad
+
+    def quarantine(self, names):
+        """Forget bad EC files so they are downloaded again (the bytes stay in the pack)"""
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM files WHERE filename = ?", [(n,) for n in names])
+            conn.execute("DELETE FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM files)")
+
+    def import_tree(self, src_dir: str, move: bool = False) -> int:
+        """Pack every *.pdf of a loose output folder (already packed names are skipped)"""
+        known, added = self.names(), 0
+        for entry in sorted(os.scandir(src_dir), key=lambda e: e.name):
+            if not entry.name.endswith(".pdf") or not entry.is_file() or entry.name in known:
+                continue
+            with open(entry.path, "rb") as f:
+                data = f.read()
+            try:
+                self.add_bytes(data, hashlib.sha256(data).hexdigest(), entry.name)
+            except InvalidPDF as e:
+                print(f"⚠️ {entry.name}: {e} - not imported")
+                continue
+            added += 1
+            if move:
+                os.remove(entry.path)
+            if added % 1000 == 0:
+                print(f"📦 {added} PDFs packed...")
+        return added
+
+    def counts(self) -> dict:
+        conn = self._conn()
+        packs = [n for n in os.listdir(self.root) if n.endswith(".tar")]
+        return {'files': conn.execute("SELECT COUNT(*) FROM files").fetchone()[0],
+                'blobs': conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0],
+                'packs': len(packs),
+                'bytes': sum(os.path.getsize(os.path.join(self.root, n)) for n in packs)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="pack_store", description="Packed EC output folders (tar shards + index)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("extract", help="write one EC out of the packs")
+    p.add_argument("output_dir")
+    p.add_argument("--village", required=True)
+    p.add_argument("--survey", required=True)
+    p.add_argument("--subdiv", default="-")
+    p.add_argument("--district")
+    p.add_argument("--taluk")
+    p.add_argument("-o", "--out", help="file to write (default: the EC filename in the current folder)")
+    p = sub.add_parser("import", help="pack the loose PDFs of an output folder")
+    p.add_argument("src_dir")
+    p.add_argument("--into", help="packed output folder (default: src_dir itself)")
+    p.add_argument("--move", action="store_true", help="delete each loose PDF once it is packed")
+    p.add_argument("--max-mb", type=float, default=PACK_MAX_MB, help="size cap per pack")
+    p = sub.add_parser("list", help="EC files in the index")
+    p.add_argument("output_dir")
+    p.add_argument("--village")
+    p = sub.add_parser("verify", help="check every packed PDF")
+    p.add_argument("output_dir")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "import":
+        store = PackStore(args.into or args.src_dir, max_mb=args.max_mb)
+        added = store.import_tree(args.src_dir, args.move)
+        c = store.counts()
+        print(f"📦 {added} PDFs packed | {c['files']} EC files, {c['blobs']} distinct PDFs in {c['packs']} packs "
+              f"({c['bytes'] / 1e6:.1f} MB) under {store.root}")
+        return 0
+    if not os.path.isdir(os.path.join(args.output_dir, PACK_DIR)):
+        print(f"❌ No packs in {args.output_dir}")
+        return 1
+    store = PackStore(args.output_dir, readonly=True)
+    if args.cmd == "extract":
+        rows = store.find(args.village, args.survey, args.subdiv, args.district, args.taluk)
+        if len(rows) != 1:
+            print(f"❌ {len(rows)} packed ECs match" + ("" if not rows else ": " + ", ".join(r['filename'] for r in rows)))
+            return 1
+        target = args.out or rows[0]['filename']
+        with open(target, "wb") as f:
+            f.write(store.read(rows[0]['filename']))
+        print(f"✅ {target}")
+    elif args.cmd == "list":
+        sql, params = "SELECT filename, sha256 FROM files", ()
+        if args.village:
+            sql, params = sql + " WHERE village = ?", (canonical_code(args.village, 3),)
+        for name, sha256 in store._conn().execute(sql + " ORDER BY filename", params):
+            print(f"{name}  {sha256[:12]}")
+    elif args.cmd == "verify":
+        return 1 if store.verify_tree() else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
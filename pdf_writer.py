@@ -0,0 +1,489 @@
+# pdf_writer.py - Streaming PDF extraction and writes for EC responses
+import binascii
+import hashlib
+import io
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import profiler
+
+CHUNK_SIZE = 64 * 1024
+
+# Same rules as find_b64: optional data URI, "JVBER" (base64 of "%PDF") prefix, longer than 100 chars
+DATA_URI_PREFIX = b"data:application/pdf;base64,"
+PDF_B64_PREFIX = b"jvber"
+MIN_B64_LENGTH = 100
+DECIDE_AFTER = 160          # bytes of a JSON string we look at before deciding it is a PDF
+
+# What the streamed string turns into inside the parsed JSON
+STREAMED_PLACEHOLDER = "<streamed base64>"
+
+_B64_CHARS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+_NOT_B64 = bytes(c for c in range(256) if c not in _B64_CHARS)
+_QUOTE_OR_ESCAPE = re.compile(rb'["\\]')
+_ESCAPE = re.compile(rb'\\(u[0-9a-fA-F]{4}|.)', re.DOTALL)
+_PARTIAL_ESCAPE = re.compile(rb'(\\+)(u[0-9a-fA-F]{0,3})?$')
+_SIMPLE_ESCAPES = {b'b': b'\b', b'f': b'\f', b'n': b'\n', b'r': b'\r', b't': b'\t'}
+
+# Content-addressed store: one blob per distinct PDF, output filenames are hardlinks to it
+CAS_DIR = ".cas"
+TAIL_CHECK_BYTES = 1024     # "%%EOF" must appear in the last KB
+
+# Temp files are created 0666 minus the umask (the kernel applies it), unlike mkstemp's 0600,
+# so finished PDFs get the normal open() permissions without a chmod
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_BINARY", 0)
+
+
+def looks_like_pdf_bytes(b: bytes) -> bool:
+    return len(b) >= 4 and b[:4] == b"%PDF"
+
+
+def split_escape(data: bytes):
+    """(complete part, unfinished escape at the end) of raw JSON string bytes"""
+    m = _PARTIAL_ESCAPE.search(data, max(0, len(data) - 64))
+    if m and len(m.group(1)) % 2:
+        cut = m.end(1) - 1
+        return data[:cut], data[cut:]
+    return data, b""
+
+
+def _unescape_one(m) -> bytes:
+    e = m.group(1)
+    if e[:1] == b"u" and len(e) == 5:
+        return chr(int(e[1:], 16)).encode("utf-8", "replace")
+    return _SIMPLE_ESCAPES.get(e, e)
+
+
+def json_unescape(data: bytes) -> bytes:
+    """JSON string escapes (\\/, \\n, \\u002B ...) -> plain bytes"""
+    return _ESCAPE.sub(_unescape_one, data) if b"\\" in data else data
+
+
+def _temp_file(directory: str):
+    while True:
+        path = os.path.join(directory, f".ec-{os.urandom(6).hex()}.part")
+        try:
+            fd = os.open(path, _TEMP_FLAGS, 0o666)
+        except FileExistsError:
+            continue
+        return os.fdopen(fd, "wb"), path
+
+
+def discard(tmp_path: str):
+    """Remove a temp file that will not be used"""
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def commit(tmp_path: str, final_path: str) -> str:
+    """Move a finished temp file to its final name (atomic on the same filesystem)"""
+    os.replace(tmp_path, final_path)
+    return final_path
+
+
+def _fsync_close(f, fsync: bool = True):
+    f.flush()
+    if fsync:
+        with profiler.phase("fsync"):
+            os.fsync(f.fileno())
+    f.close()
+
+
+def write_stream(chunks, directory: str, fsync: bool = True):
+    """Write raw body chunks to an fsync'd temp file; returns (tmp_path, nbytes, sha256 hex).
+
+    fsync=False leaves the fsync to the caller (the pipeline writer syncs a whole batch at once).
+    """
+    f, path = _temp_file(directory)
+    n = 0
+    digest = hashlib.sha256()
+    try:
+        for chunk in chunks:
+            with profiler.phase("disk_write"):
+                f.write(chunk)
+            with profiler.phase("hash"):
+                digest.update(chunk)
+            n += len(chunk)
+        _fsync_close(f, fsync)
+    except BaseException:
+        f.close()
+        discard(path)
+        raise
+    return path, n, digest.hexdigest()
+
+
+class InvalidPDF(ValueError):
+    """A downloaded PDF failed verification (truncated / broken); the store rejected it"""
+
+
+def check_pdf(path: str, full: bool = False):
+    """Cheap structural check: %PDF header and %%EOF trailer; full=True also parses the xref (needs pypdf).
+
+    Returns (ok, reason).
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            head = f.read(8)
+            f.seek(max(0, size - TAIL_CHECK_BYTES))
+            tail = f.read()
+    except OSError as e:
+        return False, f"unreadable: {e}"
+    return _check_parts(head, tail, path if full else None)
+
+
+def check_pdf_data(data: bytes, full: bool = False):
+    """check_pdf() for a PDF already in memory (packed output)"""
+    return _check_parts(data[:8], data[-TAIL_CHECK_BYTES:], io.BytesIO(data) if full else None)
+
+
+def _check_parts(head: bytes, tail: bytes, source=None):
+    if not looks_like_pdf_bytes(head):
+        return False, "missing %PDF header"
+    if b"%%EOF" not in tail:
+        return False, "missing %%EOF trailer (truncated?)"
+    if source is not None:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            print("⚠️ Full PDF check needs `pip install pypdf` - header/trailer check only")
+            return True, "ok"
+        try:
+            len(PdfReader(source, strict=True).pages)
+        except Exception as e:
+            return False, f"xref/structure error: {e}"
+    return True, "ok"
+
+
+class B64FileSink:
+    """Decodes JSON-escaped base64 text in 4-char aligned pieces straight into a temp file"""
+
+    def __init__(self, directory: str, fsync: bool = True):
+        self.file, self.path = _temp_file(directory)
+        self.fsync = fsync
+        self.nbytes = 0
+        self.head = b""
+        self.digest = hashlib.sha256()
+        self._pending = b""
+        self._carry = b""
+
+    def write(self, text: bytes):
+        # an escape split across two chunks is finished with the next piece
+        data, self._carry = split_escape(self._carry + text)
+        if b"\\u" in data:
+            data = json_unescape(data)
+        else:
+            # PHP's json_encode writes "/" as "\/"; wrapped base64 may carry \r\n
+            data = data.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"").replace(b"\\t", b"")
+        data = self._pending + data.translate(None, _NOT_B64)
+        cut = len(data) - len(data) % 4
+        self._pending = data[cut:]
+        if cut:
+            with profiler.phase("b64_decode"):
+                raw = binascii.a2b_base64(data[:cut])
+            self._emit(raw)
+
+    def _emit(self, raw: bytes):
+        if len(self.head) < 8:
+            self.head += raw[:8 - len(self.head)]
+        with profiler.phase("disk_write"):
+            self.file.write(raw)
+        with profiler.phase("hash"):
+            self.digest.update(raw)
+        self.nbytes += len(raw)
+
+    def close(self):
+        if self._pending.rstrip(b"="):
+            self._emit(binascii.a2b_base64(self._pending + b"=" * (-len(self._pending) % 4)))
+        self._pending = b""
+        _fsync_close(self.file, self.fsync)
+
+    def abort(self):
+        self.file.close()
+        discard(self.path)
+
+
+class JSONPDFExtractor:
+    """Incremental scan of a JSON body.
+
+    The first string that looks like a base64 PDF is decoded chunk by chunk into a temp file
+    and replaced by STREAMED_PLACEHOLDER; everything else (status codes, village info, URLs)
+    is kept as a small JSON text for json.loads.
+    """
+
+    def __init__(self, directory: str, fsync: bool = True):
+        self.directory = directory
+        self.fsync = fsync
+        self.skeleton = bytearray()
+        self.sink = None
+        self.error = None
+        self._in_string = False
+        self._escaped = False
+        self._mode = None      # buffer / copy / stream / skip
+        self._buf = bytearray()
+
+    def feed(self, chunk: bytes):
+        i, n = 0, len(chunk)
+        while i < n:
+            if not self._in_string:
+                j = chunk.find(b'"', i)
+                if j < 0:
+                    self.skeleton += chunk[i:]
+                    return
+                self.skeleton += chunk[i:j]
+                self._in_string, self._mode = True, 'buffer'
+                self._buf = bytearray()
+                i = j + 1
+                continue
+            j = self._string_end(chunk, i)
+            self._string_part(chunk[i:j if j >= 0 else n])
+            if j < 0:
+                return
+            self._end_string()
+            i = j + 1
+
+    def _string_end(self, chunk: bytes, pos: int) -> int:
+        """Index of the closing quote in this chunk, -1 if the string continues"""
+        n = len(chunk)
+        if self._escaped:
+            self._escaped = False
+            pos += 1
+        while pos < n:
+            m = _QUOTE_OR_ESCAPE.search(chunk, pos)
+            if m is None:
+                return -1
+            if m.group() == b'"':
+                return m.start()
+            pos = m.end() + 1
+            if pos > n:
+                self._escaped = True
+        return -1
+
+    def _string_part(self, part: bytes):
+        if self._mode == 'buffer':
+            self._buf += part
+            if len(self._buf) >= DECIDE_AFTER:
+                self._decide(final=False)
+        elif self._mode == 'copy':
+            self.skeleton += part
+        elif self._mode == 'stream':
+            self._sink_write(part)
+
+    def _decide(self, final: bool):
+        # match the prefixes on the unescaped text: PHP sends "data:application\/pdf;base64,..."
+        head, carry = split_escape(bytes(self._buf))
+        text = json_unescape(head).lstrip()
+        if text.startswith(DATA_URI_PREFIX):
+            text = text[len(DATA_URI_PREFIX):]
+        is_pdf = text[:5].lower() == PDF_B64_PREFIX and (not final or len(text.rstrip()) > MIN_B64_LENGTH)
+        if not is_pdf:
+            self.skeleton += b'"' + self._buf
+            self._mode = 'copy'
+        elif self.sink is None and self.error is None:
+            self.sink = B64FileSink(self.directory, self.fsync)
+            self._mode = 'stream'
+            self._sink_write(text + carry)
+        else:
+            self._mode = 'skip'  # only the first PDF string is kept, like find_b64
+        self._buf = bytearray()
+
+    def _sink_write(self, part: bytes):
+        try:
+            self.sink.write(part)
+        except (binascii.Error, ValueError) as e:
+            self._fail(e)
+
+    def _fail(self, e):
+        self.error = f"Base64 decode fail: {e}"
+        self.sink.abort()
+        self.sink = None
+        self._mode = 'skip'
+
+    def _end_string(self):
+        if self._mode == 'buffer':
+            self._decide(final=True)
+        if self._mode == 'copy':
+            self.skeleton += b'"'
+        else:
+            self.skeleton += b'"' + STREAMED_PLACEHOLDER.encode() + b'"'
+            if self._mode == 'stream':
+                try:
+                    self.sink.close()
+                except (binascii.Error, ValueError) as e:
+                    self._fail(e)
+        self._in_string = False
+        self._mode = None
+
+    def close(self):
+        """Finish the scan; returns (json_text, tmp_path or None, decoded bytes, sha256 hex)"""
+        if self._in_string and self.sink is not None and self._mode == 'stream':
+            self._fail(ValueError("JSON ended inside the base64 string"))
+        text = self.skeleton.decode("utf-8", errors="replace")
+        if self.sink is None:
+            return text, None, 0, None
+        return text, self.sink.path, self.sink.nbytes, self.sink.digest.hexdigest()
+
+    def abort(self):
+        if self.sink is not None:
+            self.sink.abort()
+            self.sink = None
+
+
+class PDFStore:
+    """Verified, deduplicated PDF writes for one output directory.
+
+    Every PDF is kept once under <output_dir>/.cas/<sha[:2]>/<sha>.pdf and the EC filename is a
+    hardlink to it (a copy where the filesystem has no hardlinks). Hashes that already passed
+    verification are not checked again.
+    """
+
+    def __init__(self, output_dir: str, full_check: bool = False):
+        self.output_dir = output_dir
+        self.root = os.path.join(output_dir, CAS_DIR)
+        self.full_check = full_check
+        os.makedirs(self.root, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER, verified_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, sha256 TEXT, size INTEGER, mtime REAL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256 + ".pdf")
+
+    def is_verified(self, sha256: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone() is not None
+
+    def commit(self, tmp_path: str, sha256: str, final_path: str) -> bool:
+        """Verify a finished temp file and publish it as final_path; returns True if it was a duplicate.
+
+        Raises InvalidPDF (temp file removed) when the PDF fails the check.
+        """
+        blob = self.blob_path(sha256)
+        duplicate = self.is_verified(sha256) and os.path.exists(blob)
+        if duplicate:
+            discard(tmp_path)
+        else:
+            with profiler.phase("verify"):
+                ok, reason = check_pdf(tmp_path, self.full_check)
+            if not ok:
+                discard(tmp_path)
+                raise InvalidPDF(f"Invalid PDF: {reason}")
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            commit(tmp_path, blob)
+            with self._conn() as conn:
+                conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)",
+                             (sha256, os.path.getsize(blob), time.time()))
+        self._publish(blob, final_path)
+        st = os.stat(final_path)
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                         (os.path.basename(final_path), sha256, st.st_size, st.st_mtime))
+        return duplicate
+
+    def _publish(self, blob: str, final_path: str):
+        # Link under a temp name first so final_path is replaced atomically
+        tmp = final_path + ".link"
+        discard(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, final_path)
+
+    def link_blob(self, blob: str, sha256: str, final_path: str) -> bool:
+        """Publish an already stored PDF (e.g. a cache hit from another campaign); False if it is gone"""
+        if not os.path.exists(blob):
+            from pack_store import is_pack_ref, read_ref
+            if not is_pack_ref(blob):
+                return False
+            try:
+                data = read_ref(blob)       # cached by a campaign with packed output
+            except (OSError, ValueError):
+                return False
+            if hashlib.sha256(data).hexdigest() != sha256:
+                return False
+            self.save_bytes(data, final_path)
+            return True
+        self._publish(blob, final_path)
+        st = os.stat(final_path)
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                         (os.path.basename(final_path), sha256, st.st_size, st.st_mtime))
+        return True
+
+    def save_bytes(self, data: bytes, final_path: str) -> bool:
+        """Atomic, verified write of an in-memory PDF"""
+        tmp_path, _, sha256 = write_stream((data,), self.output_dir)
+        return self.commit(tmp_path, sha256, final_path)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def names(self) -> set:
+        """EC filenames already in the output dir"""
+        return {e.name for e in os.scandir(self.output_dir) if e.name.endswith(".pdf")}
+
+    def location(self, path: str) -> str:
+        """Where an EC file can be read from (PackStore returns a pack reference)"""
+        return path
+
+    def adopt_legacy(self, legacy_name: str, filename: str) -> bool:
+        """Rename a PDF saved under its pre-ec_payload name ("_2a_", "0384") to the canonical one"""
+        old, new = os.path.join(self.output_dir, legacy_name), os.path.join(self.output_dir, filename)
+        if os.path.exists(new) or not os.path.exists(old):
+            return False
+        os.replace(old, new)
+        return True
+
+    def quarantine(self, names):
+        """Move bad PDFs aside as <name>.bad so they are downloaded again"""
+        for name in names:
+            path = os.path.join(self.output_dir, name)
+            os.replace(path, path + ".bad")
+
+    def verify_tree(self):
+        """Check every PDF in the output dir; files unchanged since they were recorded are skipped.
+
+        Returns the list of bad filenames.
+        """
+        known = {name: (size, mtime) for name, size, mtime in
+                 self._conn().execute("SELECT filename, size, mtime FROM files")}
+        bad = []
+        checked = skipped = 0
+        for entry in os.scandir(self.output_dir):
+            if not entry.name.endswith(".pdf") or not entry.is_file():
+                continue
+            st = entry.stat()
+            if known.get(entry.name) == (st.st_size, st.st_mtime):
+                skipped += 1
+                continue
+            checked += 1
+            ok, reason = check_pdf(entry.path, self.full_check)
+            if not ok:
+                print(f"❌ {entry.name}: {reason}")
+                bad.append(entry.name)
+        print(f"🔎 Checked {checked} PDFs, skipped {skipped} already verified, {len(bad)} bad")
+        return bad
+
+
+if __name__ == "__main__":
+    # python pdf_writer.py <output_dir> [--full]  - find truncated / broken PDFs
+    if len(sys.argv) < 2:
+        print("Usage: python pdf_writer.py <output_dir> [--full]")
+    else:
+        PDFStore(sys.argv[1], full_check="--full" in sys.argv).verify_tree()
@@ -0,0 +1,192 @@
+# pipeline.py - Staged downloads: network -> decode -> write, with bounded queues in between
+#
+# The network stage is the callers' own threads (bulk workers): they wait for the throttle, send the request and
+# read the whole body, then hand it to the decode stage and go on with the next job. Decode threads turn the body
+# into a temp file (JSON scan + base64 decode, or the raw PDF); one writer thread fsyncs a batch of temp files
+# together, then verifies and publishes each PDF. Queues are bounded, so a slow stage blocks the one before it
+# and at most (queue_size + workers) bodies per stage are held in memory.
+#
+# Every stage keeps busy / blocked time; report() shows which one limits throughput on this machine:
+#   utilization = busy time / (wall time x threads), "blocked" = time spent waiting for room downstream.
+import os
+import queue
+import threading
+import time
+
+import profiler
+
+_STOP = object()
+
+
+class Stage:
+    """One pipeline step: bounded input queue + worker threads calling fn(batch of items)"""
+
+    def __init__(self, name: str, fn=None, workers: int = 1, queue_size: int = 8, batch: int = 1):
+        self.name = name
+        self.fn = fn                      # None = the callers' threads do the work (network stage)
+        self.workers = workers
+        self.batch = batch
+        self.queue = queue.Queue(maxsize=queue_size) if fn else None
+        self.busy = self.blocked = 0.0
+        self.items = self.peak = 0
+        self._threads = []
+        self._callers = set()             # threads that reported work to a stage without its own workers
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers if self.fn else 0):
+            t = threading.Thread(target=self._run, name=f"ec-{self.name}-{i + 1}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def put(self, item, upstream: "Stage" = None):
+        """Queue an item; blocks while the queue is full (the wait is charged to upstream)"""
+        t = time.perf_counter()
+        self.queue.put(item)
+        if upstream is not None:
+            upstream.add(blocked=time.perf_counter() - t)
+        depth = self.queue.qsize()
+        if depth > self.peak:
+            self.peak = depth
+
+    def add(self, busy: float = 0.0, blocked: float = 0.0, items: int = 0):
+        with self._lock:
+            self.busy += busy
+            self.blocked += blocked
+            self.items += items
+            if self.fn is None and items:
+                self._callers.add(threading.get_ident())
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            while len(batch) < self.batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self.queue.put(_STOP)   # for this thread's next round
+                    break
+                batch.append(item)
+            t = time.perf_counter()
+            try:
+                self.fn(batch)
+            except Exception as e:
+                print(f"❌ Pipeline stage {self.name} failed: {type(e).__name__}: {e}")
+            self.add(busy=time.perf_counter() - t, items=len(batch))
+
+    def close(self):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def stats(self, elapsed: float) -> dict:
+        threads = self.workers if self.fn else max(1, len(self._callers))
+        return {'stage': self.name, 'threads': threads, 'items': self.items, 'busy': self.busy,
+                'blocked': self.blocked, 'queue_peak': self.peak,
+                'utilization': self.busy / (elapsed * threads) if elapsed else 0.0}
+
+
+class Pipeline:
+    """Decode and write stages shared by every ECClient of a Budget (see ECClient.submit)"""
+
+    def __init__(self, decode_workers: int = 2, write_workers: int = 1, queue_size: int = 8, write_batch: int = 16):
+        self.network = Stage("network")
+        self.decode = Stage("decode", self._decode, decode_workers, queue_size)
+        self.write = Stage("write", self._write, write_workers, queue_size, batch=write_batch)
+        self.stages = (self.network, self.decode, self.write)
+        self.inflight = 0                  # submitted lookups whose result is not settled yet
+        self._lock = threading.Lock()
+        self._started = None
+
+    def start(self):
+        with self._lock:
+            if self._started is None:
+                self._started = time.perf_counter()
+                self.decode.start()
+                self.write.start()
+        return self
+
+    def begin(self):
+        with self._lock:
+            self.inflight += 1
+
+    def end(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def _decode(self, batch):
+        for dl in batch:
+            with profiler.phase("decode"):
+                step = dl.client._decode(dl)
+            if step is dl:
+                self.write.put(dl, self.decode)
+            else:
+                self._complete(dl)
+
+    def _write(self, batch):
+        # One round of fsyncs for the whole batch before any file is renamed into place
+        for dl in batch:
+            if dl.tmp_path:
+                try:
+                    with profiler.phase("fsync"):
+                        fsync_path(dl.tmp_path)
+                except OSError:
+                    pass    # the PDF check in _write reports a file that is really broken
+        for dl in batch:
+            with profiler.phase("write"):
+                dl.client._write(dl)
+            self._complete(dl)
+
+    def _complete(self, dl):
+        try:
+            dl.client._complete(dl)
+        except Exception as e:
+            print(f"❌ {dl.result.filename}: result handling failed: {type(e).__name__}: {e}")
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started if self._started else 0.0
+
+    def collect(self, metrics):
+        """Metrics collector: per-stage utilization, items and blocked time"""
+        elapsed = self.elapsed()
+        for s in (stage.stats(elapsed) for stage in self.stages):
+            metrics.set_gauge('ec_stage_utilization', round(s['utilization'], 4), stage=s['stage'])
+            metrics.set_gauge('ec_stage_items', s['items'], stage=s['stage'])
+            metrics.set_gauge('ec_stage_blocked_seconds', round(s['blocked'], 3), stage=s['stage'])
+            metrics.set_gauge('ec_stage_queue_peak', s['queue_peak'], stage=s['stage'])
+
+    def report(self):
+        elapsed = self.elapsed()
+        stats = [stage.stats(elapsed) for stage in self.stages]
+        print(f"🏭 Pipeline over {elapsed:.1f}s:")
+        for s in stats:
+            print(f"   {s['stage']:<8} {s['threads']:>2} threads | {s['items']:>6} items | busy {s['busy']:7.1f}s "
+                  f"({s['utilization']:6.1%}) | blocked {s['blocked']:6.1f}s | queue peak {s['queue_peak']}")
+        top = max(stats, key=lambda s: s['utilization'])
+        if top['items']:
+            print(f"   ➡️ Busiest stage: {top['stage']} - add threads there first"
+                  + (" (or raise --rate: network time excludes the throttle wait)" if top['stage'] == "network" else ""))
+
+    def close(self):
+        """Finish everything queued and stop the stage threads"""
+        if self._started is None:
+            return
+        self.decode.close()
+        self.write.close()
+        self.report()
+        self._started = None
+
+
+def fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
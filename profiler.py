@@ -0,0 +1,237 @@
+# profiler.py - Where does a lookup's time go? Phase timers for the download path (`--profile`)
+#
+# ECClient / pdf_writer wrap each step in `with phase("..."):`; that is a no-op unless a Profiler is running.
+# Phases nest per thread, and each one is charged only its own time (children excluded), so the phases of one
+# lookup add up to its total:
+#
+#   lookup / network / decode / write   one unit: a whole lookup, or one pipeline stage's share of it
+#     throttle      waiting for a request token (and a session)
+#     server        request sent until response headers = server time (children: dns, connect, tls)
+#     body          reading the response body off the socket
+#     json_scan     scanning the JSON for the base64 PDF (children: b64_decode, disk_write, hash)
+#     json_parse    json.loads of what is left once the PDF is taken out
+#     fsync         temp file to disk
+#     publish       dedup + rename / link / pack (child: verify = PDF check)
+#
+# Modes: "phases" (timers only), "cprofile" (+ cProfile of every thread -> ec_profile.pstats, open with
+# snakeviz or `python -m pstats`), "sample" (+ a wall-clock stack sampler of all threads). Timer stacks and
+# samples are written as collapsed stacks (ec_profile_phases.folded / ec_profile_sampled.folded) for
+# flamegraph.pl, speedscope or inferno.
+import contextlib
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+MODES = ("phases", "cprofile", "sample")
+SAMPLE_INTERVAL = 0.005
+
+_active = None    # the running Profiler; None = phase() costs one function call
+_NULL = contextlib.nullcontext()
+
+
+def phase(name: str):
+    """Time a block as `name` under whatever phase this thread is in"""
+    return _active.phase(name) if _active is not None else _NULL
+
+
+def add(name: str, seconds: float):
+    """Charge a duration measured elsewhere (e.g. the TLS handshake) as a child of the current phase"""
+    if _active is not None:
+        _active.add(name, seconds)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start", "children")
+
+    def __init__(self, profiler, name):
+        self.profiler, self.name = profiler, name
+
+    def __enter__(self):
+        self.profiler._stack().append(self)
+        self.children = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.profiler._close(self, elapsed)
+        return False
+
+
+class Profiler:
+    """Phase timers for every thread, plus optional cProfile / stack sampling; one per run (see Budget)"""
+
+    def __init__(self, mode: str = "phases", out_dir: str = ".", interval: float = SAMPLE_INTERVAL):
+        if mode not in MODES:
+            raise ValueError(f"profile mode must be one of {', '.join(MODES)}")
+        self.mode = mode
+        self.out_dir = out_dir
+        self.interval = interval
+        self.units = defaultdict(list)        # phase -> its own time in each unit it appeared in
+        self.folded = defaultdict(float)      # "lookup;server;tls" -> seconds
+        self.threads = set()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._samples = defaultdict(int)
+        self._sampler = None
+        self._stop = threading.Event()
+        self._started = None
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._local.unit = defaultdict(float)
+        return stack
+
+    def phase(self, name: str) -> _Phase:
+        return _Phase(self, name)
+
+    def add(self, name: str, seconds: float):
+        stack = self._stack()
+        if not stack or seconds <= 0:
+            return
+        stack[-1].children += seconds
+        self._local.unit[name] += seconds
+        key = ";".join(p.name for p in stack) + ";" + name
+        with self._lock:
+            self.folded[key] += seconds
+
+    def _close(self, p: _Phase, elapsed: float):
+        stack = self._local.stack
+        own = max(0.0, elapsed - p.children)
+        key = ";".join(q.name for q in stack)
+        stack.pop()
+        unit = self._local.unit
+        unit[p.name] += own
+        if stack:
+            stack[-1].children += elapsed
+        with self._lock:
+            self.folded[key] += own
+            if not stack:
+                # outermost phase done: one sample per phase for the percentiles
+                for name, seconds in unit.items():
+                    self.units[name].append(seconds)
+                self.units[f"({p.name})"].append(elapsed)     # whole unit, children included
+                self.threads.add(threading.get_ident())
+        if not stack:
+            unit.clear()
+
+    # ------------------------------------------------------------------
+
+    def start(self):
+        global _active
+        self._started = time.perf_counter()
+        _active = self
+        if self.mode == "cprofile":
+            import cProfile
+            threading.setprofile(self._boot_thread)   # threads started from now on get their own profile
+            self._enable(cProfile.Profile())
+        elif self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample, name="ec-profile-sampler", daemon=True)
+            self._sampler.start()
+        print(f"⏱️ Profiling on ({self.mode}) - report at the end, dumps in {os.path.abspath(self.out_dir)}")
+        return self
+
+    def _enable(self, prof):
+        try:
+            prof.enable()
+        except ValueError:
+            return     # Python 3.12+: one cProfile sees every thread already
+        with self._lock:
+            self._profiles.append(prof)
+
+    def _boot_thread(self, frame, event, arg):
+        import cProfile
+        sys.setprofile(None)
+        self._enable(cProfile.Profile())
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: re.sub(r"[-_]\d+$", "", t.name) for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                self._samples[";".join(reversed(stack))] += 1
+
+    def close(self):
+        """Stop profiling, write the dumps and print the breakdown"""
+        global _active
+        if self._started is None:
+            return
+        wall = time.perf_counter() - self._started
+        _active = None
+        os.makedirs(self.out_dir, exist_ok=True)
+        self._write_folded(os.path.join(self.out_dir, "ec_profile_phases.folded"),
+                           {k: round(v * 1e6) for k, v in self.folded.items()})   # microseconds
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._write_folded(os.path.join(self.out_dir, "ec_profile_sampled.folded"), self._samples)
+        if self.mode == "cprofile":
+            self._write_pstats()
+        self.report(wall)
+        self._started = None
+
+    def _write_folded(self, path: str, counts: dict):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in sorted(counts.items()):
+                if n:
+                    f.write(f"{stack} {n}\n")
+        print(f"🔥 Flamegraph stacks: {path} (flamegraph.pl / speedscope)")
+
+    def _write_pstats(self):
+        import pstats
+        threading.setprofile(None)
+        profiles = self._profiles
+        main = profiles.pop(0) if profiles else None
+        stats = None
+        for prof in profiles + ([main] if main else []):   # main thread's last: disabling it stops ours
+            if stats is None:
+                stats = pstats.Stats(prof)
+            else:
+                stats.add(prof)
+        if stats is None:
+            return
+        path = os.path.join(self.out_dir, "ec_profile.pstats")
+        stats.dump_stats(path)
+        print(f"🧮 cProfile of {len(profiles) + 1} threads: {path} - top functions by own time:")
+        stats.sort_stats("tottime").print_stats(10)
+
+    def report(self, wall: float):
+        totals = {name: sum(v) for name, v in self.units.items() if not name.startswith("(")}
+        roots = sorted(name for name in self.units if name.startswith("("))
+        busy = sum(totals.values())
+        threads = max(1, len(self.threads))
+        units = sum(len(self.units[name]) for name in roots)
+        print(f"⏱️ Profile: {units} units over {wall:.1f}s wall on {threads} threads "
+              f"({busy:.1f}s inside timed phases)")
+        print(f"   {'phase':<12} {'units':>6} {'total s':>9} {'share':>6} {'wall%':>6} "
+              f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name in sorted(totals, key=totals.get, reverse=True) + roots:
+            values = self.units[name]
+            total = sum(values)
+            share = total / busy if busy else 0.0
+            print(f"   {name:<12} {len(values):>6} {total:>9.2f} {share:>6.1%} {total / (wall * threads):>6.1%} "
+                  + " ".join(f"{percentile(values, q) * 1000:>8.1f}" for q in (0.5, 0.9, 0.99, 1.0)))
+        if totals:
+            top = max(totals, key=totals.get)
+            print(f"   ➡️ Most time goes to {top} ({totals[top] / busy:.0%} of timed work)")
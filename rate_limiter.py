@@ -0,0 +1,154 @@
+# rate_limiter.py - Shared request budget for EC downloads
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+# Per-endpoint rate learned by AdaptiveThrottle, reused as the next run's starting rate
+# (bulk runs keep it in their output folder, campaigns next to the campaign file)
+THROTTLE_STATE_FILE = "throttle_state.json"
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests/second with bursts up to `capacity`.
+
+    Urgent callers (interactive lookups) take the next free token; normal callers hold back while
+    any urgent caller is waiting.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._urgent_waiting = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate: float):
+        """Change the refill rate, tokens earned so far are kept"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available right now, never blocks"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` are available (0 = now)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1.0, urgent: bool = False) -> float:
+        """Block until tokens are available, returns seconds spent waiting"""
+        waited = 0.0
+        if urgent:
+            with self._lock:
+                self._urgent_waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    self._refill(time.monotonic())
+                    if urgent or not self._urgent_waiting:
+                        if self._tokens >= tokens:
+                            self._tokens -= tokens
+                            return waited
+                        wait = (tokens - self._tokens) / self.rate
+                    else:
+                        wait = 0.05   # an interactive lookup is waiting for this token
+                time.sleep(wait)
+                waited += wait
+        finally:
+            if urgent:
+                with self._lock:
+                    self._urgent_waiting -= 1
+
+
+def load_throttle_state(state_file: str = THROTTLE_STATE_FILE) -> dict:
+    """Load saved per-endpoint rates"""
+    if os.path.exists(state_file):
+        try:
+            with open(state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+
+class AdaptiveThrottle(TokenBucket):
+    """AIMD rate controller driven by server responses.
+
+    Every quick success adds `increase` req/s or `growth` x the current rate, whichever is more (up to
+    `max_rate`), so a rate halved by a burst of 429s climbs back in tens of requests, not thousands.
+    Overload signals (timeouts, 429/5xx, overload EC status codes) multiply the rate by `decrease`
+    and pause all callers for a jittered cool-down.
+    """
+
+    def __init__(self, endpoint: str, rate: float = 0.1, min_rate: float = 0.02, max_rate: float = 1.0,
+                 increase: float = 0.01, decrease: float = 0.5, slow_latency: float = 15.0,
+                 capacity: float = 1.0, state_file: str = THROTTLE_STATE_FILE, growth: float = 0.05):
+        saved = load_throttle_state(state_file).get(endpoint, {}).get('rate')
+        start = saved if saved else rate
+        super().__init__(min(max_rate, max(min_rate, start)), capacity)
+        self.endpoint = endpoint
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.growth = growth
+        self.decrease = decrease
+        self.slow_latency = slow_latency
+        self.state_file = state_file
+        self._cooldown_until = 0.0
+        self._adjust = threading.Lock()     # on_success / on_overload come from every worker thread
+        if saved:
+            print(f"🎚️ Starting at saved rate {self.rate:.3f} req/s for {endpoint}")
+
+    def acquire(self, tokens: float = 1.0, urgent: bool = False) -> float:
+        pause = self._cooldown_until - time.monotonic()
+        waited = 0.0
+        if pause > 0:
+            time.sleep(pause)
+            waited = pause
+        return waited + super().acquire(tokens, urgent)
+
+    def on_success(self, latency: float):
+        """Additive increase, only when the server answered quickly"""
+        if latency >= self.slow_latency:
+            return
+        with self._adjust:
+            if self.rate < self.max_rate and time.monotonic() >= self._cooldown_until:
+                self.set_rate(min(self.max_rate, self.rate + max(self.increase, self.rate * self.growth)))
+
+    def on_overload(self, reason: str, retry_after: float = None):
+        """Multiplicative decrease plus a jittered cool-down for everyone"""
+        with self._adjust:
+            if time.monotonic() < self._cooldown_until:
+                # Requests already in flight when we backed off - don't halve again for them
+                return
+            new_rate = max(self.min_rate, self.rate * self.decrease)
+            self.set_rate(new_rate)
+            pause = retry_after if retry_after else (1.0 / new_rate) * random.uniform(0.5, 1.5)
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + pause)
+        print(f"🐢 Server overload ({reason}) → {new_rate:.3f} req/s, cooling down {pause:.1f}s")
+
+    def save(self):
+        """Persist the settled rate for this endpoint"""
+        state = load_throttle_state(self.state_file)
+        state[self.endpoint] = {'rate': round(self.rate, 4), 'updated': datetime.now().isoformat(timespec='seconds')}
+        with open(self.state_file, 'w') as f:
+            json.dump(state, f, indent=2)
+        print(f"🎚️ Saved rate {self.rate:.3f} req/s for next run ({self.state_file})")
@@ -0,0 +1,216 @@
+# response_archive.py - Sampled history of API answers for debugging, written off the download path
+#
+# Every failure and the first few answers of each (status, HTTP code, EC status) kind are kept; the rest is
+# sampled at `sample_rate`. Long strings (base64 PDFs, data URLs) are replaced by their hash and length.
+# Records go through a bounded queue to one writer thread that appends to a compressed JSONL file
+# (responses.jsonl.gz, or .zst with `pip install zstandard`) and rotates it once it reaches max_bytes on disk.
+#
+#   python response_archive.py <output_dir> [--last N] [--status no_pdf]   - print archived answers
+import hashlib
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+ARCHIVE_DIR = "responses"
+BLOB_LIMIT = 512               # strings longer than this are stored as {"$blob": sha256, "len": n}
+TEXT_LIMIT = 2000              # non-JSON bodies (HTML error pages) are cut to this many characters
+SKIP_STATUSES = {"exists", "cached"}   # answered locally, nothing to archive
+NORMAL_FAILURES = {"no_data"}  # definitive negative answers are sampled like successes
+CLOSE_TIMEOUT = 10             # seconds close() waits for the writer before giving up on what is queued
+
+_STOP = object()
+
+
+def strip_blobs(obj, limit: int = BLOB_LIMIT):
+    """Copy of a JSON value with every long string replaced by a hash reference"""
+    if isinstance(obj, str):
+        if len(obj) <= limit:
+            return obj
+        return {"$blob": hashlib.sha256(obj.encode("utf-8", "replace")).hexdigest(), "len": len(obj)}
+    if isinstance(obj, dict):
+        return {k: strip_blobs(v, limit) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [strip_blobs(v, limit) for v in obj]
+    return obj
+
+
+def _opener(compression: str):
+    """(suffix, open function) for the archive files; zstd only if the module is installed"""
+    if compression == "zstd":
+        try:
+            import zstandard
+            return ".jsonl.zst", lambda path: zstandard.open(path, "ab")
+        except ImportError:
+            print("⚠️ zstd archive needs `pip install zstandard` - using gzip")
+    import gzip
+    return ".jsonl.gz", lambda path: gzip.open(path, "ab", compresslevel=6)
+
+
+class ResponseArchive:
+    """Thread-safe, non-blocking record() for ECClient; one background writer per archive"""
+
+    def __init__(self, directory: str, sample_rate: float = 0.01, first_of_kind: int = 3,
+                 max_bytes: int = 16 * 1024 * 1024, keep: int = 10, compression: str = "gzip",
+                 queue_size: int = 1000):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.first_of_kind = first_of_kind
+        self.max_bytes = max_bytes          # compressed size of the current file before it is rotated
+        self.keep = keep                    # rotated files kept next to the current one
+        suffix, self._open = _opener(compression)
+        self.path = os.path.join(directory, "responses" + suffix)
+        self.kept = self.dropped = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self.error = None                   # OSError that stopped the writer; record() is a no-op after it
+
+    def reason(self, result):
+        """Why this result should be kept, or None"""
+        if result.status in SKIP_STATUSES or result.coalesced:
+            return None
+        if not result.ok and result.status not in NORMAL_FAILURES:
+            return "failure"
+        kind = (result.status, result.http_status, result.ec_status)
+        with self._lock:
+            seen = self._seen[kind] = self._seen.get(kind, 0) + 1
+        if seen <= self.first_of_kind:
+            return "new_kind"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def record(self, result):
+        """Queue an ECResult (and its parsed response) for the archive; never blocks the caller"""
+        why = self.reason(result)
+        if why is None:
+            return
+        if self.error is not None:
+            with self._lock:
+                self.dropped += 1
+            return
+        item = (datetime.now().isoformat(timespec='milliseconds'), why, result)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._writer, name="response-archive", daemon=True)
+                    self._thread.start()
+
+    def _line(self, ts: str, why: str, result) -> bytes:
+        response = result.response
+        if isinstance(response, str):
+            response = response[:TEXT_LIMIT]
+        record = {'ts': ts, 'reason': why, 'file': result.filename, 'payload': result.payload,
+                  'status': result.status, 'ok': result.ok, 'http_status': result.http_status,
+                  'ec_status': result.ec_status, 'message': result.message, 'error': result.error,
+                  'attempt': result.attempt, 'latency': result.latency, 'sha256': result.sha256,
+                  'response': strip_blobs(response)}
+        return (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+    def _rotate(self):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base, suffix = self.path.split(".jsonl")
+        os.replace(self.path, f"{base}-{stamp}.jsonl{suffix}")
+        old = sorted(n for n in os.listdir(self.directory) if n.startswith("responses-"))
+        for name in old[:max(0, len(old) - self.keep)]:
+            os.remove(os.path.join(self.directory, name))
+
+    def _full(self) -> bool:
+        return os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes
+
+    def _writer(self):
+        f = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._full():
+                self._rotate()
+            f = self._open(self.path)
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                try:
+                    line = self._line(*item)
+                except (TypeError, ValueError):
+                    # one answer the encoder can't take - skip it, the archive goes on
+                    with self._lock:
+                        self.dropped += 1
+                    continue
+                f.write(line)
+                self.kept += 1
+                if self._queue.empty() or self.kept % 100 == 0:
+                    f.flush()
+                    if self._full():
+                        f.close()
+                        self._rotate()
+                        f = self._open(self.path)
+        except OSError as e:
+            # Disk full / no permission: stop archiving, never the download run
+            self.error = e
+            print(f"⚠️ Response archive stopped: {e} - answers are no longer archived")
+        finally:
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+
+    def close(self):
+        """Write what is queued and stop the writer (gives up after CLOSE_TIMEOUT, e.g. when the writer died)"""
+        if self._thread is not None:
+            deadline = time.monotonic() + CLOSE_TIMEOUT
+            while self._thread.is_alive() and time.monotonic() < deadline:
+                try:
+                    self._queue.put(_STOP, timeout=0.1)   # short tries: the writer may die while we wait
+                    break
+                except queue.Full:
+                    continue
+            self._thread.join(max(0.0, deadline - time.monotonic()))
+            self._thread = None
+        if self.dropped:
+            print(f"⚠️ Response archive: {self.dropped} records dropped (writer could not keep up or had stopped)")
+
+
+def read_archive(directory: str):
+    """Archived records from the rotated files and the current one, oldest first"""
+    names = sorted(n for n in os.listdir(directory) if n.startswith("responses-"))
+    names += [n for n in ("responses.jsonl.gz", "responses.jsonl.zst") if os.path.exists(os.path.join(directory, n))]
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.endswith(".zst"):
+            import zstandard
+            f = zstandard.open(path, "rt", encoding="utf-8")
+        else:
+            import gzip
+            f = gzip.open(path, "rt", encoding="utf-8")
+        with f:
+            try:
+                for line in f:
+                    yield json.loads(line)
+            except EOFError:
+                pass   # file of a run that is still writing / was killed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python response_archive.py <output_dir> [--last N] [--status STATUS]")
+    else:
+        folder = os.path.join(sys.argv[1], ARCHIVE_DIR)
+        last = int(sys.argv[sys.argv.index("--last") + 1]) if "--last" in sys.argv else 5
+        status = sys.argv[sys.argv.index("--status") + 1] if "--status" in sys.argv else None
+        records = [r for r in read_archive(folder) if status is None or r['status'] == status]
+        for r in records[-last:]:
+            print(json.dumps(r, indent=2, ensure_ascii=False))
+        print(f"📚 {len(records)} archived answers in {folder}")
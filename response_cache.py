@@ -0,0 +1,126 @@
+# response_cache.py - Local cache of EC lookups (PDF hits and "No Data" answers) across campaigns
+import json
+import sqlite3
+import threading
+import time
+
+from ec_payload import PAYLOAD_FIELDS, normalize_payload
+
+DAY = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key           TEXT PRIMARY KEY,
+    kind          TEXT NOT NULL,          -- pdf / negative
+    ec_status     INTEGER,
+    blob          TEXT,                   -- content-addressed PDF path (pdf_writer.PDFStore)
+    sha256        TEXT,
+    size          INTEGER,
+    etag          TEXT,
+    last_modified TEXT,
+    stored_at     REAL NOT NULL,
+    expires_at    REAL NOT NULL,
+    last_used     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used);
+CREATE INDEX IF NOT EXISTS responses_kind ON responses (kind, last_used);
+"""
+
+def cache_key(payload: dict, endpoint: str) -> str:
+    """Stable key for a lookup: endpoint plus the canonical payload fields in a fixed order"""
+    payload = normalize_payload(payload)
+    values = [payload[k] for k in PAYLOAD_FIELDS]
+    return json.dumps([endpoint] + values, ensure_ascii=False)
+
+
+class ResponseCache:
+    """SQLite cache with separate TTLs for PDFs and negative answers.
+
+    PDF entries are LRU-capped at max_entries; negative ("No Data") entries are small and are the record
+    that spares a lookup on the next run, so they leave by TTL only, never by size.
+    """
+
+    def __init__(self, path: str, pdf_ttl_days: float = 30, negative_ttl_days: float = 7,
+                 max_entries: int = 200_000):
+        self.path = path
+        self.ttl = {'pdf': pdf_ttl_days * DAY, 'negative': negative_ttl_days * DAY}
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Entry dict with a 'fresh' flag, or None"""
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        with conn:
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        entry = dict(row)
+        entry['fresh'] = entry['expires_at'] > now
+        return entry
+
+    def put(self, key: str, kind: str, ec_status: int = None, blob: str = None, sha256: str = None,
+            size: int = None, etag: str = None, last_modified: str = None):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, ec_status, blob, sha256, size, etag, last_modified, now, now + self.ttl[kind], now))
+        self._puts += 1
+        if self._puts % 100 == 0:
+            self.evict()
+
+    def refresh(self, key: str, kind: str):
+        """Server confirmed (304) the cached answer is still current"""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("UPDATE responses SET expires_at = ?, last_used = ? WHERE key = ?",
+                         (now + self.ttl[kind], now, key))
+
+    def forget(self, key: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def counts(self) -> dict:
+        """Unexpired entries per kind, e.g. {'pdf': 120, 'negative': 45}"""
+        rows = self._conn().execute("SELECT kind, COUNT(*) FROM responses WHERE expires_at > ? GROUP BY kind",
+                                    (time.time(),))
+        return {kind: n for kind, n in rows}
+
+    def evict(self) -> int:
+        """Drop expired negative entries, and least-recently-used PDF entries above max_entries"""
+        conn = self._conn()
+        with conn:
+            expired = conn.execute("DELETE FROM responses WHERE kind = 'negative' AND expires_at <= ?",
+                                   (time.time(),)).rowcount
+        count = conn.execute("SELECT COUNT(*) FROM responses WHERE kind = 'pdf'").fetchone()[0]
+        extra = max(0, count - self.max_entries)
+        if extra:
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key IN "
+                             "(SELECT key FROM responses WHERE kind = 'pdf' ORDER BY last_used LIMIT ?)", (extra,))
+            print(f"🧹 Response cache: evicted {extra} least recently used PDF entries")
+        return extra + expired
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        """If-None-Match / If-Modified-Since for revalidating a stale entry"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
@@ -0,0 +1,34 @@
+# retry_policy.py - Which failed lookups are worth retrying, and when (exponential backoff + jitter)
+import random
+
+# ECResult.status values that can succeed on a later try
+TRANSIENT_STATUSES = {
+    "busy",              # 429 / 5xx / overload EC status
+    "network",           # timeout, connection reset, DNS
+    "session_expired",   # HTML login page / 401 - the pool gets a new cookie
+    "not_json",          # HTML error page or cut-off body
+    "decode_error",      # broken base64, usually a truncated response
+    "invalid_pdf",       # PDF failed verification, usually truncated
+}
+# Everything else (no_data, no_pdf, invalid_code, unexpected errors) is permanent: one attempt only
+
+
+def is_transient(result) -> bool:
+    return result.status in TRANSIENT_STATUSES
+
+
+class RetryPolicy:
+    """Per-job exponential backoff: base * 2^(attempt-1), capped, with +/- jitter"""
+
+    def __init__(self, base: float = 5, cap: float = 300, max_attempts: int = 6, jitter: float = 0.5):
+        self.base = base
+        self.cap = cap
+        self.max_attempts = max_attempts
+        self.jitter = jitter
+
+    def next_delay(self, result, attempts: int):
+        """Seconds until the next try, or None when the job should be marked failed"""
+        if not is_transient(result) or attempts >= self.max_attempts:
+            return None
+        delay = min(self.cap, self.base * 2 ** (attempts - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
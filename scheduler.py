@@ -0,0 +1,146 @@
+# scheduler.py - Several bulk campaigns in one process, sharing one request budget fairly
+#
+# Campaign file (json):
+#   {"campaigns": [
+#       {"name": "moolakaraipatti", "input": "missing_382.xlsx", "output_dir": "Moolakaraipatti_EC_Output",
+#        "district": "29", "taluk": "08", "weight": 3},
+#       {"name": "govindacheri", "input": "backfill.csv", "output_dir": "Govindacheri_EC_Output",
+#        "district": "37", "taluk": "01", "weight": 1, "priority": 0}]}
+#
+# Any other BulkSettings field can be set per campaign; the budget (endpoint, rate, sessions, cache) is shared.
+# Higher priority campaigns are served first whenever they have due jobs; campaigns of equal priority share
+# the requests in proportion to their weights (start-time fair queueing). Urgent lookups - the interactive
+# manual prompt - bypass the queue and take the next free token of the shared throttle.
+import contextlib
+import dataclasses
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bulk import Budget, BulkRun, BulkSettings
+
+CAMPAIGN_KEYS = ("name", "input", "weight", "priority")
+
+
+@dataclasses.dataclass
+class Campaign:
+    name: str
+    input_file: str
+    run: BulkRun
+    weight: float = 1.0
+    priority: int = 0
+    vtime: float = 0.0     # virtual finish time of the last job handed out
+    served: int = 0        # requests actually sent
+
+
+def load_campaigns(path: str, base: BulkSettings) -> list:
+    """(name, input, weight, priority, BulkSettings) per campaign in a campaign file"""
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    campaigns = []
+    for i, entry in enumerate(spec.get("campaigns", [])):
+        options = {k: v for k, v in entry.items() if k not in CAMPAIGN_KEYS}
+        try:
+            settings = dataclasses.replace(base, **options)
+        except TypeError as e:
+            raise ValueError(f"Campaign #{i + 1} in {path}: {e}") from None
+        if not settings.output_dir or not entry.get("input"):
+            raise ValueError(f"Campaign #{i + 1} in {path}: needs \"input\" and \"output_dir\"")
+        name = entry.get("name") or os.path.basename(os.path.normpath(settings.output_dir))
+        weight = float(entry.get("weight", 1))
+        if weight <= 0:
+            raise ValueError(f"Campaign '{name}': weight must be > 0")
+        campaigns.append((name, entry["input"], weight, int(entry.get("priority", 0)), settings))
+    if not campaigns:
+        raise ValueError(f"No campaigns in {path}")
+    return campaigns
+
+
+class FairScheduler:
+    """Hands jobs from several BulkRuns to one worker pool: strict priority, then weighted-fair by requests sent.
+
+    A job is charged when it is handed out and refunded in settled() if it never reached the server.
+    """
+
+    def __init__(self, budget: Budget, workers: int = 4):
+        self.budget = budget
+        self.workers = workers
+        self.campaigns = []
+        self._clock = 0.0            # virtual start time of the job handed out last
+        self._lock = threading.Lock()
+
+    def add(self, name: str, input_file: str, settings: BulkSettings, weight: float = 1.0, priority: int = 0):
+        run = BulkRun(settings, self.budget)
+        campaign = Campaign(name, input_file, run, weight, priority)
+        run.on_settled = lambda job, result: self.settled(campaign, result)
+        self.campaigns.append(campaign)
+        return run
+
+    def interactive_client(self, output_dir: str, **options):
+        """Client for one-off lookups that jump ahead of every campaign on the shared throttle"""
+        return self.budget.client(output_dir, urgent=True, **options)
+
+    def next_job(self):
+        """(campaign, job) with the smallest virtual start time among the highest priority that has work"""
+        with self._lock:
+            order = sorted(self.campaigns, key=lambda c: (-c.priority, max(c.vtime, self._clock)))
+            for c in order:
+                job = c.run.store.claim()
+                if job is not None:
+                    start = max(c.vtime, self._clock)   # an idle campaign doesn't bank credit
+                    c.vtime = start + 1.0 / c.weight
+                    self._clock = start
+                    return c, job
+        return None, None
+
+    def settled(self, campaign: Campaign, result):
+        """Only requests that went out count: refund jobs answered from disk, the cache or a shared lookup.
+
+        Otherwise a mostly-downloaded campaign pays for every 'exists' and falls behind the others.
+        """
+        with self._lock:
+            if result.sent:
+                campaign.served += 1
+            else:
+                campaign.vtime -= 1.0 / campaign.weight
+
+    def work_loop(self):
+        while True:
+            loading = not all(c.run.ingest_done.is_set() for c in self.campaigns)
+            campaign, job = self.next_job()
+            if job is None:
+                waits = [w for w in (c.run.store.next_retry_in() for c in self.campaigns) if w is not None]
+                if self.budget.busy():
+                    waits.append(0.05)   # pipelined lookups may still come back as retries
+                if not loading and not waits:
+                    return
+                time.sleep(0.5 if loading else min(max(min(waits), 0.05), 5))
+                continue
+            campaign.run.run_job(job)
+
+    def run(self):
+        """Load every campaign's input, drain all job stores, print one summary per campaign"""
+        with contextlib.ExitStack() as stack:
+            stack.callback(self.budget.close)
+            for c in self.campaigns:
+                stack.enter_context(c.run)
+            try:
+                for c in self.campaigns:
+                    jobs = c.run.prepare(c.input_file)
+                    if jobs is not None:
+                        c.run.start(jobs)
+                shares = ", ".join(f"{c.name} x{c.weight:g}" + (f" (priority {c.priority})" if c.priority else "")
+                                   for c in self.campaigns)
+                print(f"🚀 {len(self.campaigns)} campaigns on {self.workers} workers sharing "
+                      f"{self.budget.throttle.rate:.3f} req/s: {shares}")
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    for fut in [pool.submit(self.work_loop) for _ in range(self.workers)]:
+                        fut.result()
+            finally:
+                for c in self.campaigns:
+                    c.run.finish()
+            for c in self.campaigns:
+                print(f"\n📦 Campaign {c.name}: {c.served} requests sent")
+                c.run.report()
@@ -0,0 +1,136 @@
+# session_pool.py - Several TNGIS sessions (PHPSESSID cookies) with expiry detection and re-bootstrap
+import itertools
+import threading
+
+from http_session import new_session
+from rate_limiter import TokenBucket
+
+# Hints in a JSON "message" that the server no longer recognises our session
+EXPIRED_MESSAGE_HINTS = ("session", "unauthori", "login", "token")
+
+
+def looks_expired(status_code: int, content_type: str, body_start: str, message: str = None) -> bool:
+    """True when a response has the shape of an expired session rather than an EC answer"""
+    if status_code in (401, 403, 419, 440):
+        return True
+    if "text/html" in content_type or body_start.lstrip()[:1] == "<":
+        return True  # login / error page instead of JSON
+    if message and any(h in str(message).lower() for h in EXPIRED_MESSAGE_HINTS):
+        return True
+    return False
+
+
+class ECSession:
+    """One credential: its own cookie jar, connection pool and request budget"""
+
+    def __init__(self, name: str, rate: float, cookie: str = None, proxy: str = None):
+        self.name = name
+        self.http = new_session()
+        if proxy and hasattr(self.http, "proxies"):
+            self.http.proxies.update({"http": proxy, "https": proxy})  # egress through another IP
+        self.cookie = cookie          # pasted browser cookie; None = use the jar filled by bootstrap
+        self.bucket = TokenBucket(rate, 1)
+        self.healthy = cookie is not None
+        self.refreshing = False       # a bootstrap is running for this slot (outside the pool lock)
+        self.requests = 0
+        self.expired_count = 0
+        self.lock = threading.Lock()
+
+    def headers(self, base: dict) -> dict:
+        headers = {k: v for k, v in base.items() if k != "Cookie"}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        return headers
+
+    def phpsessid(self) -> str:
+        if self.cookie:
+            for part in self.cookie.split(";"):
+                k, _, v = part.strip().partition("=")
+                if k == "PHPSESSID":
+                    return v
+        return self.http.cookies.get("PHPSESSID", "")
+
+
+class SessionPool:
+    """Spreads requests over several sessions and replaces the ones that expire"""
+
+    def __init__(self, referer: str, user_agent: str, count: int = 3, per_session_rate: float = 0.2,
+                 seed_cookies=(), proxy: str = None):
+        self.referer = referer
+        self.user_agent = user_agent
+        seeds = [c for c in seed_cookies if c]
+        self.sessions = [ECSession(f"s{i + 1}", per_session_rate, seeds[i] if i < len(seeds) else None, proxy)
+                         for i in range(max(count, len(seeds)))]
+        self._rr = itertools.cycle(self.sessions)
+        self._cond = threading.Condition()    # guards slot state; notified when a bootstrap finishes
+
+    def bootstrap(self, sess: ECSession) -> bool:
+        """Open REFERER without a cookie so the server hands out a fresh PHPSESSID"""
+        with sess.lock:
+            sess.cookie = None
+            sess.http.cookies.clear()
+            try:
+                r = sess.http.get(self.referer, headers={"User-Agent": self.user_agent}, timeout=30)
+            except Exception as e:
+                print(f"❌ Session {sess.name}: bootstrap failed: {e}")
+                sess.healthy = False
+                return False
+            sess.healthy = bool(sess.http.cookies.get("PHPSESSID"))
+            if sess.healthy:
+                print(f"🔑 Session {sess.name}: new PHPSESSID {sess.phpsessid()[:8]}…")
+            else:
+                print(f"❌ Session {sess.name}: no PHPSESSID from {self.referer} (HTTP {r.status_code})")
+            return sess.healthy
+
+    def acquire(self) -> ECSession:
+        """Next healthy session with budget left; bootstraps lazily and waits if all are busy.
+
+        A bootstrap (a GET to REFERER) runs outside the pool lock, so workers on healthy sessions carry on
+        while one slot is being refreshed.
+        """
+        tried = set()     # slots this call bootstrapped without success
+        with self._cond:
+            while True:
+                stale = None
+                wait = None
+                for _ in range(len(self.sessions)):
+                    sess = next(self._rr)
+                    if sess.refreshing:
+                        continue
+                    if not sess.healthy:
+                        if stale is None and sess.name not in tried:
+                            stale = sess
+                        continue
+                    if sess.bucket.try_acquire():
+                        sess.requests += 1
+                        return sess
+                    w = sess.bucket.wait_time()
+                    wait = w if wait is None else min(wait, w)
+                if stale is not None:
+                    stale.refreshing = True
+                    self._cond.release()
+                    try:
+                        ok = self.bootstrap(stale)
+                    finally:
+                        self._cond.acquire()
+                        stale.refreshing = False
+                        self._cond.notify_all()
+                    if not ok:
+                        tried.add(stale.name)
+                    continue
+                refreshing = any(s.refreshing for s in self.sessions)
+                if wait is None and not refreshing:
+                    raise RuntimeError("No working TNGIS session - paste a fresh COOKIE or check REFERER")
+                self._cond.wait(wait if wait is not None else None)
+
+    def expire(self, sess: ECSession, reason: str):
+        """Response looked like an expired session: the next acquire() that reaches this slot re-bootstraps it"""
+        with self._cond:
+            sess.expired_count += 1
+            if not sess.healthy:
+                return    # another worker saw the same expiry
+            sess.healthy = False
+        print(f"🔒 Session {sess.name} expired ({reason}) - re-bootstrapping")
+
+    def summary(self) -> str:
+        return ", ".join(f"{s.name}: {s.requests} req / {s.expired_count} expired" for s in self.sessions)
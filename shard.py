@@ -0,0 +1,205 @@
+# shard.py - Split a campaign into deterministic shards, run them on several hosts / egress IPs, merge the results
+#
+# Layout of a campaign folder (put it on a shared drive, or copy shard_NN/ back before merging):
+#   plan.json               shard count, district/taluk, rows per shard
+#   shards/shard_NN.jsonl   job entries for shard NN
+#   shard_NN/               worker output: PDFs, ec_jobs.db, events, cache
+#   merged/                 one output tree after `merge`
+#   failures.csv            every job that did not end with a PDF
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import zlib
+from datetime import datetime
+
+from bulk import BulkRun, BulkSettings
+from code_index import CODES_DB_FILE
+from ec_client import API_URL, REFERER
+from input_reader import iter_jobs
+from job_store import JobStore
+
+PLAN_FILE = "plan.json"
+FAILURE_REPORT = "failures.csv"
+
+
+def shard_of(village_no: str, shards: int) -> int:
+    """Same village always lands in the same shard, on every machine and every run"""
+    return zlib.crc32(str(village_no).encode()) % shards
+
+
+def shard_name(n: int) -> str:
+    return f"shard_{n:02d}"
+
+
+def shard_input(campaign: str, n: int) -> str:
+    return os.path.join(campaign, "shards", shard_name(n) + ".jsonl")
+
+
+def shard_output(campaign: str, n: int) -> str:
+    return os.path.join(campaign, shard_name(n))
+
+
+def load_plan(campaign: str) -> dict:
+    with open(os.path.join(campaign, PLAN_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def plan(input_file: str, campaign: str, shards: int, district: str, taluk: str) -> dict:
+    """Coordinator: stream the input once and write one job file per shard"""
+    os.makedirs(os.path.join(campaign, "shards"), exist_ok=True)
+    counts = [0] * shards
+    files = [open(shard_input(campaign, n), "w", encoding="utf-8") for n in range(shards)]
+    try:
+        for entry in iter_jobs(input_file, district, taluk):
+            n = shard_of(entry['village_no'], shards)
+            files[n].write(json.dumps(entry, ensure_ascii=False) + "\n")
+            counts[n] += 1
+    finally:
+        for f in files:
+            f.close()
+    manifest = {'input': os.path.abspath(input_file), 'shards': shards, 'district': district, 'taluk': taluk,
+                'rows': counts, 'created': datetime.now().isoformat(timespec='seconds')}
+    with open(os.path.join(campaign, PLAN_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"🗂️ {sum(counts)} rows split into {shards} shards: " + ", ".join(f"{shard_name(n)}={c}" for n, c in enumerate(counts)))
+    return manifest
+
+
+def run_worker(campaign: str, shard: int, settings: BulkSettings = None):
+    """Worker: download one shard into campaign/shard_NN as a normal bulk run (own job store, sessions, throttle)"""
+    manifest = load_plan(campaign)
+    out = shard_output(campaign, shard)
+    s = settings or BulkSettings(out)
+    s.output_dir, s.district, s.taluk = out, manifest['district'], manifest['taluk']
+    s.cache_file = os.path.join(out, "ec_response_cache.db")
+    print(f"🧩 {shard_name(shard)}: {manifest['rows'][shard]} rows → {out}")
+    with BulkRun(s) as run:
+        run.process(shard_input(campaign, shard))
+        counts = run.store.counts()
+        print(f"🏁 {shard_name(shard)}: ✅ {counts.get('done', 0)} | 🚫 {counts.get('no_data', 0)} | "
+              f"❌ {counts.get('failed', 0)} | 🔑 {run.sessions.summary()}")
+    return counts
+
+
+def worker_argv(args) -> list:
+    """The worker options of a parsed `local` command, for each worker process it starts"""
+    argv = ["--workers", str(args.workers), "--api", args.api, "--referer", args.referer, "--rate", str(args.rate),
+            "--max-rate", str(args.max_rate), "--sessions", str(args.sessions),
+            "--per-session-rate", str(args.per_session_rate), "--codes-db", args.codes_db]
+    for flag, value in (("--cookie", args.cookie), ("--proxy", args.proxy)):
+        if value:
+            argv += [flag, value]
+    return argv
+
+
+def run_local(campaign: str, worker_args: list):
+    """Run every shard as its own process on this machine (loopback testing / one box with many IPs)"""
+    manifest = load_plan(campaign)
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", campaign, str(n)] + worker_args)
+             for n in range(manifest['shards'])]
+    codes = [p.wait() for p in procs]
+    if any(codes):
+        print(f"⚠️ Worker exit codes: {codes}")
+    return merge(campaign)
+
+
+def _publish(src: str, dst: str):
+    if os.path.exists(dst):
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)  # other drive / filesystem without hardlinks
+
+
+def merge(campaign: str, dest: str = None) -> dict:
+    """Collect every shard's PDFs into one tree and every unfinished job into one failure report"""
+    manifest = load_plan(campaign)
+    dest = dest or os.path.join(campaign, "merged")
+    os.makedirs(dest, exist_ok=True)
+    totals, merged, missing = {}, 0, []
+    report_path = os.path.join(campaign, FAILURE_REPORT)
+    with open(report_path, "w", newline="", encoding="utf-8") as f:
+        report = csv.writer(f)
+        report.writerow(["shard", "district", "taluk", "village", "survey", "subdivision", "status", "ec_status",
+                         "attempts", "last_error"])
+        for n in range(manifest['shards']):
+            out = shard_output(campaign, n)
+            db = os.path.join(out, "ec_jobs.db")
+            if not os.path.exists(db):
+                missing.append(shard_name(n))
+                continue
+            store = JobStore(db)
+            for status, count in store.counts().items():
+                totals[status] = totals.get(status, 0) + count
+            for job in store.jobs('done'):
+                src = os.path.join(out, job['filename'])
+                if os.path.exists(src):
+                    _publish(src, os.path.join(dest, job['filename']))
+                    merged += 1
+            for job in store.jobs('failed', 'no_data', 'pending', 'running'):
+                report.writerow([shard_name(n), job['district'], job['taluk'], job['village'], job['survey'],
+                                 job['subdivision'], job['status'], job['ec_status'], job['attempts'], job['last_error']])
+    print(f"📁 Merged {merged} PDFs into {dest}")
+    print(f"✅ Done: {totals.get('done', 0)} | 🚫 No Data: {totals.get('no_data', 0)} | ❌ Failed: {totals.get('failed', 0)} | "
+          f"⏳ Unfinished: {totals.get('pending', 0) + totals.get('running', 0)}")
+    print(f"📝 Failure report: {report_path}")
+    if missing:
+        print(f"⚠️ No results yet from: {', '.join(missing)}")
+    return totals
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="ec_download shard", description="Sharded EC campaigns across hosts / egress IPs")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("plan", help="split an input sheet into shards")
+    p.add_argument("input")
+    p.add_argument("campaign")
+    p.add_argument("--shards", type=int, required=True)
+    p.add_argument("--district", default="29")
+    p.add_argument("--taluk", default="08")
+
+    for name, help_text in (("worker", "download one shard"), ("local", "run all shards as local processes, then merge")):
+        w = sub.add_parser(name, help=help_text)
+        w.add_argument("campaign")
+        if name == "worker":
+            w.add_argument("shard", type=int)
+        w.add_argument("--workers", type=int, default=4, help="threads per shard")
+        w.add_argument("--api", default=API_URL)
+        w.add_argument("--referer", default=REFERER)
+        w.add_argument("--cookie", help="browser cookie for the first session")
+        w.add_argument("--proxy", help="send this worker's traffic through a proxy / other egress IP")
+        w.add_argument("--rate", type=float, default=0.1, help="starting req/s for this worker")
+        w.add_argument("--max-rate", type=float, default=1.0)
+        w.add_argument("--sessions", type=int, default=3)
+        w.add_argument("--per-session-rate", type=float, default=0.2)
+        w.add_argument("--codes-db", default=CODES_DB_FILE, help="village code index (see code_index.py)")
+
+    m = sub.add_parser("merge", help="build one output tree and failure report")
+    m.add_argument("campaign")
+    m.add_argument("--dest")
+
+    args = ap.parse_args(argv)
+    if args.cmd == "plan":
+        plan(args.input, args.campaign, args.shards, args.district, args.taluk)
+    elif args.cmd == "worker":
+        settings = BulkSettings(shard_output(args.campaign, args.shard), api_url=args.api, referer=args.referer,
+                                cookie=args.cookie, proxy=args.proxy, workers=args.workers, rate=args.rate,
+                                max_rate=args.max_rate, sessions=args.sessions, per_session_rate=args.per_session_rate,
+                                codes_file=args.codes_db, verbose=False)
+        counts = run_worker(args.campaign, args.shard, settings)
+        return 1 if counts.get('failed') else 0
+    elif args.cmd == "local":
+        run_local(args.campaign, worker_argv(args))
+    else:
+        merge(args.campaign, args.dest)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())